@@ -0,0 +1,314 @@
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from resililink import spec_pb2
+from resililink.airtime import time_on_air
+from resililink.codec import encode_frame, decode_frame
+from resililink.compression import compress, decompress, FLAG_COMPRESSED
+from resililink.crypto import MessageCipher, message_aad, FLAG_AEAD
+from resililink.fragment import make_fragments, split_payload
+from resililink.aggregation import make_aggregate
+from resililink.rylr998 import parse_rcv
+from resililink.wire import serialize_packet, parse_packet
+
+# Benchmark of the per-frame hot path: building a packet, compressing and
+# encrypting its text, serializing, encoding and formatting AT+SEND, then
+# the reverse from a +RCV line back to text. Every stage is timed on its own
+# for each packet type, with the pipeline's throughput, its peak memory and
+# the bytes it puts on air. Results can be saved as a baseline and later
+# runs compared against it:
+#
+#   python benchmark.py                          # print the results
+#   python benchmark.py --save baseline.json     # also store them as a baseline
+#   python benchmark.py --compare baseline.json  # exit 1 on a regression
+#
+# --iterations sets the calls per timing round and --tolerance the
+# slowdown allowed before a regression is reported.
+#
+# Timings vary with the machine and its load, so every run also times a
+# fixed calibration loop, and regressions are judged on timings relative to
+# it. Sizes and time on air do not vary and must not grow at all.
+
+BASELINE = 'benchmark_baseline.json'
+TOLERANCE = 0.25  # Fraction a packet type's pipeline may slow down before it counts as a regression
+ROUNDS = 9  # Timing rounds per stage; the fastest one counts
+
+KEY = b'password'.ljust(16, b'\0')[:16]
+NODE_ID = "FIXED178"
+DESTINATION = "FIXED12"
+SHORT_TEXT = "Meet at the north gate at 6, bring water"
+LONG_TEXT = ("Road to the shelter is flooded past the bridge. We are taking the east trail instead "
+             "and should reach the school by 7. Two people need insulin, please let the clinic know.")
+
+def network_packet(text, version=2, encryption="ccm", codec="base91"):
+    # A NetworkMessage as chat.send_message builds it, plus the settings to send it with
+    packet = spec_pb2.Packet()
+    packet.packet_uuid = "5f3a9c01"
+    packet.packet_type = spec_pb2.NETWORK_MESSAGE
+    packet.sequence = 1234
+    packet.hop_limit = 3
+    packet.network_message.node_id = NODE_ID
+    packet.network_message.timestamp = 1729200000
+    packet.network_message.destination = DESTINATION
+    return packet, text, version, encryption, codec
+
+def ack_packet():
+    packet = spec_pb2.Packet(packet_uuid="5f3a9c02", packet_type=spec_pb2.ACK_MESSAGE, sequence=1235, hop_limit=3)
+    packet.ack_message.message_id = "5f3a9c01"
+    packet.ack_message.node_id = DESTINATION
+    packet.ack_message.timestamp = 1729200001
+    return packet
+
+def discover_packet():
+    packet = spec_pb2.Packet(packet_uuid="5f3a9c03", packet_type=spec_pb2.DISCOVER_MESSAGE, sequence=1236, hop_limit=3)
+    packet.discover_message.timestamp = 1729200002
+    return packet
+
+def announce_packet():
+    packet = spec_pb2.Packet(packet_uuid="5f3a9c04", packet_type=spec_pb2.ANNOUNCE_MESSAGE, sequence=1237, hop_limit=3)
+    packet.announce_message.node_id = NODE_ID
+    packet.announce_message.timestamp = 1729200003
+    packet.announce_message.route_cost = 20
+    return packet
+
+def fragment_packet():
+    fragments = make_fragments(NODE_ID, "5f3a9c05", DESTINATION, split_payload(bytes(300), 150), 3)
+    return fragments[0]
+
+def nack_packet():
+    packet = spec_pb2.Packet(packet_uuid="5f3a9c06", packet_type=spec_pb2.NACK_MESSAGE, hop_limit=3)
+    packet.nack_message.node_id = DESTINATION
+    packet.nack_message.message_id = "5f3a9c05"
+    packet.nack_message.destination = NODE_ID
+    packet.nack_message.missing.extend([1, 3])
+    return packet
+
+def aggregate_packet():
+    # An ACK and an ANNOUNCE sharing a frame, with a fixed ID so its size does not vary
+    packet = parse_packet(make_aggregate([serialize_packet(ack_packet()), serialize_packet(announce_packet())], 2))
+    packet.packet_uuid = "5f3a9c07"
+    return packet
+
+def network_stages(build):
+    # Stages of a NetworkMessage, whose text is compressed and encrypted
+    cipher = MessageCipher(KEY)
+    packet, text, version, encryption, codec = build()
+    header = (packet.network_message.node_id, packet.packet_uuid, packet.sequence)
+    content, compressed = compress(text.encode())
+    packet.network_message.flags = (FLAG_COMPRESSED if compressed else 0) | (FLAG_AEAD if encryption == "ccm" else 0)
+    if encryption == "ccm":
+        encrypt = lambda: cipher.encrypt(content, *header, message_aad(packet.network_message))
+        decrypt = lambda: cipher.decrypt(ciphertext, *header, message_aad(packet.network_message))
+    else:
+        encrypt = lambda: cipher.encrypt_cbc(content)
+        decrypt = lambda: cipher.decrypt_cbc(ciphertext)
+    ciphertext = encrypt()
+    packet.network_message.message_content = ciphertext
+    stages = [
+        ('build', lambda: build()[0]),
+        ('compress', lambda: compress(text.encode())),
+        ('encrypt', encrypt),
+    ]
+    receive = [
+        ('decrypt', decrypt),
+        ('decompress', lambda: (decompress(content) if compressed else content).decode()),
+    ]
+    return packet, version, codec, stages, receive
+
+def frame_stages(packet, version, codec, send, receive):
+    # The stages every packet goes through, around the packet-specific ones
+    data = serialize_packet(packet, version)
+    frame = encode_frame(data, codec)
+    line = f"+RCV=12,{len(frame)},{frame},-80,9"
+    send = send + [
+        ('serialize', lambda: serialize_packet(packet, version)),
+        ('encode', lambda: encode_frame(data, codec)),
+        ('command', lambda: f"AT+SEND=0,{len(frame)},{frame}\r\n".encode()),
+    ]
+    receive = [
+        ('rcv', lambda: parse_rcv(line)),
+        ('decode', lambda: decode_frame(frame)),
+        ('parse', lambda: parse_packet(data)),
+    ] + receive
+    sizes = {
+        'v1_bytes': packet.ByteSize(),
+        'wire_bytes': len(data),
+        'frame_chars': len(frame),
+        'airtime_ms': round(time_on_air(len(frame)) * 1000, 1),
+    }
+    return send + receive, sizes
+
+def scenarios():
+    """
+    :return: {name: (stages, sizes)} for every packet type.
+    """
+    results = {}
+    for name, build in [
+        ('network', lambda: network_packet(SHORT_TEXT)),
+        ('network_long', lambda: network_packet(LONG_TEXT)),
+        # The original pipeline: v1 schema, AES-CBC and base64, for reference
+        ('network_legacy', lambda: network_packet(SHORT_TEXT, version=1, encryption="cbc", codec="base64")),
+    ]:
+        packet, version, codec, send, receive = network_stages(build)
+        results[name] = frame_stages(packet, version, codec, send, receive)
+    for name, build in [
+        ('ack', ack_packet),
+        ('discover', discover_packet),
+        ('announce', announce_packet),
+        ('fragment', fragment_packet),
+        ('nack', nack_packet),
+        ('aggregate', aggregate_packet),
+    ]:
+        results[name] = frame_stages(build(), 2, "base91", [('build', build)], [])
+    return results
+
+# Input of the calibration loop
+CALIBRATION_DATA = bytes(range(256)) * 2
+
+def calibration():
+    # Fixed work of the same kind as the pipeline's: interpreted loops over
+    # bytes, small allocations and string formatting
+    value = 0
+    for byte in CALIBRATION_DATA:
+        value = (value * 31 + byte) & 0xFFFFFFFF
+    return f"{value:08x}".encode() + CALIBRATION_DATA[:16]
+
+def time_stage(function, iterations):
+    """
+    Time a stage, alternating its rounds with rounds of the calibration loop
+    so both see the same load, without garbage collection pauses landing on
+    whichever stage happens to trigger them.
+
+    :return: (us, calibration_us) per call, the fastest of ROUNDS each.
+    """
+    best = calibration_best = float('inf')
+    gc.disable()
+    try:
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                function()
+            middle = time.perf_counter()
+            for _ in range(iterations):
+                calibration()
+            best = min(best, middle - start)
+            calibration_best = min(calibration_best, time.perf_counter() - middle)
+    finally:
+        gc.enable()
+    return best / iterations * 1e6, calibration_best / iterations * 1e6
+
+def peak_memory(stages):
+    # Peak bytes allocated while one packet goes through the whole pipeline
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        for _, function in stages:
+            function()
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+def run(iterations=2000):
+    results = {}
+    all_scenarios = scenarios()
+    # One pass first, so caches and the allocator settle before anything is timed
+    for stages, _ in all_scenarios.values():
+        for _, function in stages:
+            function()
+    calibrations = []
+    for name, (stages, sizes) in all_scenarios.items():
+        timings = {}
+        relative = 0
+        for stage, function in stages:
+            us, calibration_us = time_stage(function, iterations)
+            timings[stage] = round(us, 2)
+            relative += us / calibration_us
+            calibrations.append(calibration_us)
+        total = sum(timings.values())
+        results[name] = {
+            'stages_us': timings,
+            'total_us': round(total, 2),
+            # Time per packet in calibration loops, which compares across runs
+            'relative': round(relative, 3),
+            'packets_per_second': round(1e6 / total),
+            'peak_bytes': peak_memory(stages),
+            **sizes,
+        }
+    return {
+        'machine': f"{platform.machine()} {platform.processor() or platform.node()}".strip(),
+        'python': platform.python_version(),
+        'iterations': iterations,
+        'calibration_us': round(min(calibrations), 2),
+        'results': results,
+    }
+
+def report(run_results):
+    print(f"{run_results['machine']}, Python {run_results['python']}, calibration loop {run_results['calibration_us']:.2f} us")
+    for name, result in run_results['results'].items():
+        print(f"{name}: {result['wire_bytes']} bytes ({result['v1_bytes']} as v1), {result['frame_chars']} chars, "
+              f"{result['airtime_ms']} ms on air, {result['total_us']:.1f} us per packet, {result['relative']:.2f} calibration loops "
+              f"({result['packets_per_second']} packets/s), peak {result['peak_bytes']} bytes")
+        print("  " + ", ".join(f"{stage} {us:.2f}" for stage, us in result['stages_us'].items()))
+
+def compare(run_results, baseline, tolerance=TOLERANCE):
+    """
+    :return: Descriptions of the regressions against the baseline, empty if there are none.
+    """
+    regressions = []
+    if 'calibration_us' not in baseline:
+        print("Warning: the baseline has no calibration timing, only sizes are compared; save a new one")
+    elif baseline.get('machine') != run_results['machine']:
+        print(f"Warning: the baseline was made on {baseline.get('machine')}; relative timings differ somewhat between CPUs")
+    for name, result in run_results['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        for field in ('v1_bytes', 'wire_bytes', 'frame_chars', 'airtime_ms'):
+            if result[field] > old[field]:
+                regressions.append(f"{name}: {field} grew from {old[field]} to {result[field]}")
+        if 'calibration_us' not in baseline:
+            continue
+        if result['relative'] > old['relative'] * (1 + tolerance):
+            # Name the stages that account for it; single stages are too noisy to judge alone
+            scale = baseline['calibration_us'] / run_results['calibration_us']
+            slower = [f"{stage} {old['stages_us'][stage]:.2f} -> {us * scale:.2f}" for stage, us in result['stages_us'].items()
+                      if stage in old['stages_us'] and us * scale - old['stages_us'][stage] > (result['total_us'] * scale - old['total_us']) / 4]
+            regressions.append(f"{name}: {old['relative']:.2f} -> {result['relative']:.2f} calibration loops per packet "
+                               f"(in the baseline's us: {', '.join(slower)})")
+        elif result['relative'] < old['relative'] / (1 + tolerance):
+            print(f"{name}: {old['relative']:.2f} -> {result['relative']:.2f} calibration loops per packet")
+    return regressions
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    iterations = 2000
+    if '--iterations' in args:
+        iterations = int(args[args.index('--iterations') + 1])
+    tolerance = TOLERANCE
+    if '--tolerance' in args:
+        tolerance = float(args[args.index('--tolerance') + 1])
+    results = run(iterations)
+    report(results)
+
+    if '--save' in args:
+        index = args.index('--save') + 1
+        path = args[index] if index < len(args) and not args[index].startswith('--') else BASELINE
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved the baseline to {path}")
+
+    if '--compare' in args:
+        index = args.index('--compare') + 1
+        path = args[index] if index < len(args) and not args[index].startswith('--') else BASELINE
+        with open(path) as f:
+            regressions = compare(results, json.load(f), tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {path}")
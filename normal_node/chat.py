@@ -1,160 +1,217 @@
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding as sym_padding
-import spec_pb2
+from resililink import spec_pb2
 import uuid
+import itertools
 import time
-import os
-import base64
 import threading
 import random
-import gzip
-from rylr998 import RYLR998
-import binascii
+import os
+from resililink.rylr998 import RYLR998
+from resililink.airtime import AirtimeScheduler
+from resililink.codec import encode_frame, decode_frame, max_payload, frame_length
+from resililink.wire import serialize_packet, parse_packet, packet_source, packet_destination, FLAG_MORE
+from resililink.dedup import DuplicateFilter
+from resililink.reliability import ReliableSender
+from resililink.flooding import FloodController
+from resililink.routing import RoutingTable
+from resililink.fragment import Reassembler, StreamAssembler, FragmentCache, fragment_size, split_payload, make_fragments
+from resililink.aggregation import FrameAggregator, unpack_packet
+from resililink.compression import compress, decompress, FLAG_COMPRESSED
+from resililink.crypto import MessageCipher, message_aad, FLAG_AEAD
 
 NODE_ID = "FIXED178"  # Generate a UUID4 for the node ID
 AES_KEY = b'password'.ljust(16, b'\0')[:16]  # Ensure the key is 16 bytes
-
-# Set to keep track of received packet UUIDs
-received_packets = set()
+message_cipher = MessageCipher(AES_KEY)
+ENCRYPTION = "ccm"  # Message encryption, "ccm" (AES-CCM, no IV on the wire) or "cbc" for nodes that predate it
+LORA_PORT = os.environ.get('LORA_PORT', '/dev/ttyAMA0')  # RYLR998 serial port, or a simulator.py pty
+DUTY_CYCLE = 1.0  # Fraction of each hour the radio may spend transmitting
+FRAME_CODEC = "base91"  # Use "base64" while legacy nodes that cannot decode other codecs remain
+WIRE_VERSION = 2  # Packet schema to transmit (1 = spec.proto, 2 = compact spec_v2.proto)
+HOP_LIMIT = 3  # Transmissions a packet this node creates may take through the mesh
+FRAME_SIZE = 240  # Largest AT+SEND payload the RYLR998 accepts
+# Largest serialized packet that fits into one frame; larger ones are fragmented
+MAX_PACKET_SIZE = max_payload(FRAME_SIZE, FRAME_CODEC)
+AGGREGATION_WINDOW = 0.5  # Seconds a small packet waits for others to share its frame (0 = off)
+
+# Duplicate suppression for received packets, keyed on (source, sequence)
+duplicate_filter = DuplicateFilter()
+# Delayed, suppressible rebroadcasts of packets for other nodes
+flood_controller = FloodController()
+# Next hops towards other nodes, learned from ANNOUNCE packets
+routing_table = RoutingTable(spreading_factor=11)
+# Fragments of packets addressed to this node, waiting for the rest
+reassembler = Reassembler()
+# Slices of packets this node fragmented, kept to answer NACKs
+fragment_cache = FragmentCache()
+# Segments of streamed answers, put back in order
+stream_assembler = StreamAssembler()
 # Dictionary to keep track of sent packets and their acknowledgment status
+# (False = pending, True = acknowledged, None = gave up)
 acknowledgments = {}
 # Set to keep track of discovered nodes
 discovered_nodes = set()
+# Sequence numbers for the packets this node creates
+# Starting from the clock, so after a restart they continue above the numbers
+# used before, which receivers would reject as replays
+sequence_numbers = itertools.count(int(time.time()))
+
+def delivery_failed(packet_uuid, destination):
+    print(f"No acknowledgment from {destination} for {packet_uuid}")
+    acknowledgments[packet_uuid] = None
+
+# Retransmits sent messages until their ACK arrives
+reliable_sender = ReliableSender(on_give_up=delivery_failed)
+# Packs small packets for the same address into one frame, created with the radio
+frame_aggregator = None
 
 def initialize_lora(address, network_id):
+    global frame_aggregator
     # Initialize the LoRa module
-    lora = RYLR998(port='/dev/ttyAMA0')
+    lora = RYLR998(port=LORA_PORT, scheduler=AirtimeScheduler(duty_cycle=DUTY_CYCLE))
     lora.set_address(address)  # Set this node's address
     lora.set_network_id(network_id)  # Set the network ID
     lora.set_rf_parameters(11,9,4,12)
     lora.set_band(902687500)
+    reliable_sender.start()
+    frame_aggregator = FrameAggregator(lambda address, payload, priority: lora.send_data(address, encode_frame(payload, FRAME_CODEC)),
+                                       window=AGGREGATION_WINDOW, max_payload=MAX_PACKET_SIZE, version=WIRE_VERSION)
 
     return lora
 
-def aes_encrypt(message):
-    if isinstance(message, str):
-        message = message.encode()
-
-    # Generate a random 16-byte IV for CBC mode
-    iv = os.urandom(16)
-
-    # Create AES cipher with the key and IV in CBC mode
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
 
-    # Add padding to the message (AES requires the input to be a multiple of the block size)
-    padder = sym_padding.PKCS7(algorithms.AES.block_size).padder()
-    padded_message = padder.update(message) + padder.finalize()
-
-    # Encrypt the message
-    encrypted_message = encryptor.update(padded_message) + encryptor.finalize()
-
-    # Return the IV and the encrypted message
-    return iv + encrypted_message
-
-def aes_decrypt(ciphertext):
-    # Extract the IV (first 16 bytes) and the actual encrypted message
-    iv = ciphertext[:16]
-    encrypted_message = ciphertext[16:]
-
-    # Create AES cipher with the key and IV in CBC mode
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv), backend=default_backend())
-    decryptor = cipher.decryptor()
-
-    # Decrypt the message
-    decrypted_padded_message = decryptor.update(encrypted_message) + decryptor.finalize()
-
-    # Remove padding from the decrypted message
-    unpadder = sym_padding.PKCS7(algorithms.AES.block_size).unpadder()
-    decrypted_message = unpadder.update(decrypted_padded_message) + unpadder.finalize()
+def encrypt_message(packet, message):
+    # Compress and encrypt message text into a packet's NetworkMessage, whose
+    # node_id must be set: with AES-CCM the packet header provides the nonce
+    network_message = packet.network_message
+    content, compressed = compress(message.encode())
+    network_message.flags = FLAG_COMPRESSED if compressed else 0
+    if ENCRYPTION == "ccm":
+        # The flags are authenticated along with the rest of the header, so set them first
+        network_message.flags |= FLAG_AEAD
+        network_message.message_content = message_cipher.encrypt(content, network_message.node_id, packet.packet_uuid, packet.sequence,
+                                                                 message_aad(network_message))
+    else:
+        network_message.message_content = message_cipher.encrypt_cbc(content)
+
+def decrypt_message(packet):
+    # Decrypt a packet's message text in whichever format the sender used
+    network_message = packet.network_message
+    if network_message.flags & FLAG_AEAD:
+        content = message_cipher.decrypt(network_message.message_content, network_message.node_id, packet.packet_uuid, packet.sequence,
+                                         message_aad(network_message))
+    else:
+        content = message_cipher.decrypt_cbc(network_message.message_content)
+    if network_message.flags & FLAG_COMPRESSED:
+        content = decompress(content)
+    return content.decode()
 
-    return decrypted_message.decode()
+def new_packet(packet_type):
+    # Create a Packet with a fresh ID and this node's next sequence number
+    packet = spec_pb2.Packet()
+    packet.packet_uuid = uuid.uuid4().hex[:8]  # Generate a UUID4 for the packet
+    packet.packet_type = packet_type
+    packet.sequence = next(sequence_numbers)
+    packet.hop_limit = HOP_LIMIT
+    return packet
+
+def packet_payloads(packet):
+    # Serialized packets carrying a packet: itself, or its fragments if it does not fit a frame.
+    # Fragments are rebuilt on every call, so resent ones get fresh packet IDs.
+    serialized_packet = serialize_packet(packet, WIRE_VERSION)
+    if len(serialized_packet) <= MAX_PACKET_SIZE:
+        return [serialized_packet]
+    destination = packet_destination(packet)
+    chunks = split_payload(serialized_packet, fragment_size(NODE_ID, destination, MAX_PACKET_SIZE, WIRE_VERSION))
+    fragment_cache.put(packet.packet_uuid, chunks, destination)
+    fragments = make_fragments(NODE_ID, packet.packet_uuid, destination, chunks, HOP_LIMIT)
+    return [serialize_packet(fragment, WIRE_VERSION) for fragment in fragments]
+
+def send_packet(lora, packet, address=0):
+    # Send a packet to a radio address (0 = broadcast). Small packets wait
+    # briefly in the aggregator, so ACKs and short packets share frames.
+    # Returns a Future resolved once the packet's last frame was sent, or
+    # None if it was sent already.
+    future = None
+    for payload in packet_payloads(packet):
+        if frame_aggregator is None:
+            lora.send_data(address, encode_frame(payload, FRAME_CODEC))
+        else:
+            future = frame_aggregator.submit(address, payload)
+    return future
 
 def send_message(lora, destination, message_content):
-    # Encrypt the message
-    encrypted_message = aes_encrypt(message_content.encode())
-
     # Create a NetworkMessage
     network_message = spec_pb2.NetworkMessage()
     network_message.node_id = NODE_ID
     network_message.timestamp = int(time.time())
-    network_message.message_content = encrypted_message
     network_message.destination = destination
 
     # Create a Packet and assign the NetworkMessage to it
-    packet = spec_pb2.Packet()
-    packet.packet_uuid = uuid.uuid4().hex[:8]  # Generate a UUID4 for the packet
-    packet.packet_type = spec_pb2.NETWORK_MESSAGE
+    packet = new_packet(spec_pb2.NETWORK_MESSAGE)
     packet.network_message.CopyFrom(network_message)
 
-    # Serialize the Packet to a binary format
-    serialized_packet = packet.SerializeToString()
-
-    # Base64 encode the serialized packet
-    b64_packet = base64.urlsafe_b64encode(serialized_packet)
+    # Compress and encrypt the message, now that the packet header is known
+    encrypt_message(packet, message_content)
 
-    # Send the packet
-    lora.send_data(0, str(b64_packet.decode()))
+    # Estimate when the last frame will be fully on air, fragments included
+    eta = None
+    if lora.scheduler:
+        eta = sum(lora.scheduler.estimate_delivery(frame_length(len(payload), FRAME_CODEC))
+                  for payload in packet_payloads(packet))
 
-    # Add the packet to the acknowledgment dictionary
+    # Add the packet to the acknowledgment dictionary, then hand it to the
+    # reliable sender, which transmits it and retransmits until it is ACKed
     acknowledgments[packet.packet_uuid] = False
+    reliable_sender.send(destination, packet.packet_uuid, lambda: send_packet(lora, packet, next_hop_address(destination)))
 
     return {
         'type': 'sent',
         'packet_uuid': packet.packet_uuid,
         'destination': destination,
-        'content': message_content
+        'content': message_content,
+        'eta': round(eta, 2) if eta is not None else None
     }
 
+def next_hop_address(destination):
+    # Unicast towards the destination when a route is known, broadcast otherwise
+    next_hop = routing_table.next_hop(destination)
+    return next_hop if next_hop is not None else 0
+
+def is_new_packet(packet):
+    return duplicate_filter.check(packet_source(packet), packet.sequence, packet.packet_uuid)
+
 def listen_for_data(lora):
     processed_messages = []
-    received_data = lora.receive_data()
+    check_reassembly(lora)
+    received_data = lora.receive_data(timeout=1)
     
     if received_data:
         print(f"Processing {received_data}")
         for item in received_data:
             if isinstance(item, dict) and 'data' in item:
                 try:
-                    # Add padding if necessary
+                    # Detects the frame codec, legacy base64 included
                     encoded_packet = item['data']
-                    encoded_packet += '=' * (-len(encoded_packet) % 4)
-                    # Use urlsafe_b64decode which is more forgiving
-                    serialized_packet = base64.urlsafe_b64decode(encoded_packet)
+                    serialized_packet = decode_frame(encoded_packet)
 
-                    received_packet = spec_pb2.Packet()
-                    received_packet.ParseFromString(serialized_packet)
+                    received_packet = parse_packet(serialized_packet)
 
                     print(f"Received: {received_packet}")
 
-                    if received_packet.packet_uuid in received_packets:
-                        print("Skipping")
-                        continue  # Skip further processing for repeated packet
-
-                    received_packets.add(received_packet.packet_uuid)
-                
-                    if received_packet.packet_type == spec_pb2.NETWORK_MESSAGE:
-                        result = process_network_message(lora, received_packet)
-                    elif received_packet.packet_type == spec_pb2.ACK_MESSAGE:
-                        result = process_ack_message(received_packet)
-                    elif received_packet.packet_type == spec_pb2.DISCOVER_MESSAGE:
-                        result = process_discover_message(lora, received_packet)
-                    elif received_packet.packet_type == spec_pb2.ANNOUNCE_MESSAGE:
-                        result = process_announce_message(lora, received_packet)
-                    else:
-                        result = {
-                            'type': 'unknown',
-                            'packet_uuid': received_packet.packet_uuid
-                        }
-                    
-                    processed_messages.append(result)
-
-                except (binascii.Error, base64.binascii.Error) as e:
-                    print(f"Error decoding base64: {e}")
+                    # Every frame is a link quality sample for the neighbour that sent it
+                    routing_table.heard(item['address'], item['rssi'], item['snr'])
+
+                    # An aggregate frame carries several packets, each handled on its own
+                    for packet in unpack_packet(received_packet):
+                        result = process_packet(lora, packet, item['address'])
+                        if result is not None:
+                            processed_messages.append(result)
+
+                except ValueError as e:
+                    print(f"Error decoding frame: {e}")
                     print(f"Problematic encoded packet: {encoded_packet}")
                     processed_messages.append({
                         'type': 'error',
-                        'error': 'base64_decoding',
+                        'error': 'frame_decoding',
                         'details': str(e)
                     })
                 except Exception as e:
@@ -180,95 +237,218 @@ def listen_for_data(lora):
         print(f"processed messages: {processed_messages}")
     return processed_messages
 
+def process_packet(lora, received_packet, address):
+    # Handle a packet received from the neighbour at address
+    if packet_source(received_packet) == NODE_ID:
+        return None  # Our own packet, rebroadcast by a neighbour
+
+    if not is_new_packet(received_packet):
+        # Another copy counts against a pending rebroadcast
+        flood_controller.overheard(received_packet.packet_uuid)
+        if received_packet.packet_type == spec_pb2.ANNOUNCE_MESSAGE:
+            # Copies arriving over other paths may offer a better route
+            routing_table.update(received_packet.announce_message.node_id, address,
+                                 received_packet.announce_message.route_cost)
+        if (received_packet.packet_type == spec_pb2.NETWORK_MESSAGE
+                and received_packet.network_message.destination == NODE_ID):
+            # The sender is retransmitting, so our ACK was lost
+            send_ack(lora, received_packet)
+        print("Skipping")
+        return None  # Skip further processing for repeated packet
+
+    if received_packet.packet_type == spec_pb2.NETWORK_MESSAGE:
+        return process_network_message(lora, received_packet)
+    elif received_packet.packet_type == spec_pb2.ACK_MESSAGE:
+        return process_ack_message(lora, received_packet)
+    elif received_packet.packet_type == spec_pb2.DISCOVER_MESSAGE:
+        return process_discover_message(lora, received_packet)
+    elif received_packet.packet_type == spec_pb2.ANNOUNCE_MESSAGE:
+        return process_announce_message(lora, received_packet, address)
+    elif received_packet.packet_type == spec_pb2.FRAGMENT_MESSAGE:
+        return process_fragment_message(lora, received_packet, address)
+    elif received_packet.packet_type == spec_pb2.NACK_MESSAGE:
+        return process_nack_message(lora, received_packet)
+    return {
+        'type': 'unknown',
+        'packet_uuid': received_packet.packet_uuid
+    }
+
 def process_network_message(lora, received_packet):
     print(f"{received_packet.network_message.destination} != {NODE_ID}?")
     if received_packet.network_message.destination != NODE_ID:
         # Retransmit the packet if it's not for us
-        #retransmit_packet(lora, base64.urlsafe_b64encode(received_packet.SerializeToString()).decode())
+        retransmit_packet(lora, received_packet)
         return {
             'type': 'retransmitted',
             'packet_uuid': received_packet.packet_uuid
         }
     else:
         # Decrypt the message content
-        decrypted_message = aes_decrypt(received_packet.network_message.message_content)
+        decrypted_message = decrypt_message(received_packet)
 
         # Construct and send an acknowledgment
         send_ack(lora, received_packet)
 
+        network_message = received_packet.network_message
+        if not network_message.stream_id:
+            return {
+                'type': 'received',
+                'packet_uuid': received_packet.packet_uuid,
+                'from': network_message.node_id,
+                'content': decrypted_message,
+                'partial': False
+            }
+
+        # A segment of a streamed answer: show its text once every earlier segment arrived
+        added = stream_assembler.add(network_message.node_id, network_message.stream_id, network_message.segment,
+                                     decrypted_message, not network_message.flags & FLAG_MORE)
+        if added is None or (not added[0] and not added[1]):
+            return None
+        text, complete = added
         return {
             'type': 'received',
             'packet_uuid': received_packet.packet_uuid,
-            'from': received_packet.network_message.node_id,
-            'content': decrypted_message
+            'from': network_message.node_id,
+            'stream': network_message.stream_id,
+            'content': text,
+            # More of the answer follows
+            'partial': not complete
         }
 
-def process_ack_message(received_packet):
+def process_ack_message(lora, received_packet):
     message_id = received_packet.ack_message.message_id
+    reliable_sender.ack(message_id)
     if message_id in acknowledgments:
         acknowledgments[message_id] = True
         return {
             'type': 'ack',
             'packet_uuid': message_id
         }
+    # Someone else's ACK, pass it on towards its destination
+    retransmit_packet(lora, received_packet)
 
 def process_discover_message(lora, received_packet):
     time.sleep(random.randint(1,50)/10)
 
     send_announce_message(lora)
     # Retransmit the DISCOVER message
-    # retransmit_packet(lora, base64.b64encode(received_packet.SerializeToString()).decode())
+    retransmit_packet(lora, received_packet)
     return {
         'type': 'discover',
         'packet_uuid': received_packet.packet_uuid
     }
 
-def process_announce_message(lora, received_packet):
+def process_announce_message(lora, received_packet, address):
     print(f"Process announce message from {received_packet.announce_message.node_id}")
     announced_node_id = received_packet.announce_message.node_id
     if announced_node_id not in discovered_nodes:
         discovered_nodes.add(announced_node_id)
+    # Route to the announcing node through the neighbour we heard it from,
+    # and pass the cost of that route on with the ANNOUNCE
+    route_cost = routing_table.update(announced_node_id, address, received_packet.announce_message.route_cost)
+    received_packet.announce_message.route_cost = route_cost
     # Retransmit the ANNOUNCE message
-    retransmit_packet(lora, base64.b64encode(received_packet.SerializeToString()).decode())
+    retransmit_packet(lora, received_packet)
     return {
         'type': 'announce',
         'packet_uuid': received_packet.packet_uuid,
         'node_id': announced_node_id
     }
 
+def process_fragment_message(lora, received_packet, address):
+    fragment = received_packet.fragment_message
+    if fragment.destination != NODE_ID:
+        # Fragments for other nodes are forwarded as they are, not reassembled
+        retransmit_packet(lora, received_packet)
+        return {
+            'type': 'retransmitted',
+            'packet_uuid': received_packet.packet_uuid
+        }
+
+    serialized_packet = reassembler.add(fragment.node_id, fragment.message_id, fragment.index, fragment.count, fragment.data)
+    if serialized_packet is None:
+        return {
+            'type': 'fragment',
+            'packet_uuid': fragment.message_id,
+            'index': fragment.index,
+            'count': fragment.count
+        }
+    # The reassembled packet is processed like one that arrived whole
+    return process_packet(lora, parse_packet(serialized_packet), address)
+
+def process_nack_message(lora, received_packet):
+    nack = received_packet.nack_message
+    if nack.destination != NODE_ID:
+        retransmit_packet(lora, received_packet)
+        return None
+
+    cached = fragment_cache.get(nack.message_id)
+    if cached is None:
+        print(f"NACK for {nack.message_id}, which is no longer cached")
+        return None
+    chunks, destination = cached
+    # Resend only the fragments the receiver is missing
+    for fragment in make_fragments(NODE_ID, nack.message_id, destination, chunks, HOP_LIMIT, nack.missing):
+        send_packet(lora, fragment, next_hop_address(destination))
+    return {
+        'type': 'nack',
+        'packet_uuid': nack.message_id,
+        'missing': list(nack.missing)
+    }
+
+def check_reassembly(lora):
+    # Ask for the fragments missing from stalled reassembly buffers
+    for source, message_id, missing in reassembler.nacks():
+        send_nack(lora, source, message_id, missing)
+
+def send_nack(lora, destination, message_id, missing):
+    nack_message = spec_pb2.NackMessage()
+    nack_message.node_id = NODE_ID
+    nack_message.message_id = message_id
+    nack_message.destination = destination
+    nack_message.missing.extend(missing)
+
+    packet = new_packet(spec_pb2.NACK_MESSAGE)
+    packet.nack_message.CopyFrom(nack_message)
+
+    send_packet(lora, packet, next_hop_address(destination))
+
 def send_ack(lora, received_packet):
     ack_message = spec_pb2.AckMessage()
     ack_message.message_id = received_packet.packet_uuid
     ack_message.node_id = NODE_ID
     ack_message.timestamp = int(time.time())
 
-    ack_packet = spec_pb2.Packet()
-    ack_packet.packet_uuid = uuid.uuid4().hex[:8]
-    ack_packet.packet_type = spec_pb2.ACK_MESSAGE
+    ack_packet = new_packet(spec_pb2.ACK_MESSAGE)
     ack_packet.ack_message.CopyFrom(ack_message)
 
-    serialized_ack_packet = ack_packet.SerializeToString()
-    b64_ack_packet = base64.urlsafe_b64encode(serialized_ack_packet)
-
-    lora.send_data(0, b64_ack_packet.decode())
+    # Unicast when the route back is known, so the ACK can share a frame with data going that way
+    send_packet(lora, ack_packet, next_hop_address(packet_source(received_packet)))
 
-def retransmit_packet(lora, encoded_packet):
-    return
-    lora.send_data(0, encoded_packet)
+def retransmit_packet(lora, received_packet):
+    # Rebroadcast a packet for other nodes after a random delay, unless its
+    # hop limit is used up or enough neighbours rebroadcast it first
+    if received_packet.hop_limit <= 1:
+        return False
+    packet = spec_pb2.Packet()
+    packet.CopyFrom(received_packet)
+    packet.hop_limit -= 1
+    if packet_destination(packet):
+        next_hop = routing_table.next_hop(packet_destination(packet))
+        if next_hop is not None:
+            # With a known route there is no need to flood, hand the packet to the next hop
+            send_packet(lora, packet, next_hop)
+            return True
+    return flood_controller.schedule(packet.packet_uuid, lambda: send_packet(lora, packet))
 
 def send_discover_message(lora):
     discover_message = spec_pb2.DiscoverMessage()
     discover_message.timestamp = int(time.time())
 
-    packet = spec_pb2.Packet()
-    packet.packet_uuid = uuid.uuid4().hex[:8]
-    packet.packet_type = spec_pb2.DISCOVER_MESSAGE
+    packet = new_packet(spec_pb2.DISCOVER_MESSAGE)
     packet.discover_message.CopyFrom(discover_message)
 
-    serialized_packet = packet.SerializeToString()
-    b64_packet = base64.urlsafe_b64encode(serialized_packet)
-
-    lora.send_data(0, str(b64_packet.decode()))
+    send_packet(lora, packet)
     return {
         'type': 'discover_sent',
         'packet_uuid': packet.packet_uuid
@@ -279,15 +459,10 @@ def send_announce_message(lora):
     announce_message.node_id = NODE_ID
     announce_message.timestamp = int(time.time())
 
-    packet = spec_pb2.Packet()
-    packet.packet_uuid = uuid.uuid4().hex[:8]
-    packet.packet_type = spec_pb2.ANNOUNCE_MESSAGE
+    packet = new_packet(spec_pb2.ANNOUNCE_MESSAGE)
     packet.announce_message.CopyFrom(announce_message)
 
-    serialized_packet = packet.SerializeToString()
-    b64_packet = base64.urlsafe_b64encode(serialized_packet)
-
-    lora.send_data(0, str(b64_packet.decode()))
+    send_packet(lora, packet)
     return {
         'type': 'announce_sent',
         'packet_uuid': packet.packet_uuid
@@ -299,28 +474,35 @@ def get_node_id():
 def get_discovered_nodes():
     return list(discovered_nodes)
 
+def get_duplicate_stats():
+    return duplicate_filter.stats()
+
+def get_flood_stats():
+    return flood_controller.stats()
+
+def get_routes():
+    return routing_table.routes()
+
+def get_reassembly_stats():
+    return reassembler.stats()
+
+def get_aggregation_stats():
+    return frame_aggregator.stats() if frame_aggregator else {}
+
 def get_acknowledgments():
-    return {uuid: "ACKED" if acked else "PENDING" for uuid, acked in acknowledgments.items()}
+    return {uuid: "FAILED" if acked is None else "ACKED" if acked else "PENDING" for uuid, acked in acknowledgments.items()}
 
 # Main loop example
 def main():
     lora = initialize_lora(address=6, network_id=18)
     
     while True:
-        received_data = lora.receive_data()
-        if received_data:
-            for item in received_data:
-                if 'data' in item:
-                    result = listen_for_data(lora)
-                    if result:
-                        print(f"Processed: {result}")
-                else:
-                    print(f"Other response: {item['other']}")
-        
+        result = listen_for_data(lora)
+        if result:
+            print(f"Processed: {result}")
+
         # Here you can add other operations, like sending messages, 
         # checking for user input, etc.
-        
-        time.sleep(0.1)  # Short sleep to prevent CPU overuse
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
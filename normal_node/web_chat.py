@@ -38,6 +38,26 @@ def get_messages():
 def get_acks():
     return jsonify(lora_chat.get_acknowledgments())
 
+@app.route('/duplicates')
+def get_duplicates():
+    return jsonify(lora_chat.get_duplicate_stats())
+
+@app.route('/flooding')
+def get_flooding():
+    return jsonify(lora_chat.get_flood_stats())
+
+@app.route('/routes')
+def get_routes():
+    return jsonify(lora_chat.get_routes())
+
+@app.route('/fragments')
+def get_fragments():
+    return jsonify(lora_chat.get_reassembly_stats())
+
+@app.route('/aggregation')
+def get_aggregation():
+    return jsonify(lora_chat.get_aggregation_stats())
+
 def message_listener():
     while True:
         new_messages = lora_chat.listen_for_data(lora)
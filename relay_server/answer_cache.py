@@ -0,0 +1,134 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import Future
+
+from resililink.compression import compress
+
+# Cache of LLM answers for the relay's "+Q" queries. During an incident many
+# nodes ask nearly the same question, so answers are kept under a normalized
+# form of the query, with the compressed payload ready for encryption.
+# Concurrent misses for one query share a single upstream call.
+
+# A cached answer: its text, the text compressed for the downlink, and when it was generated
+Answer = namedtuple('Answer', ['text', 'content', 'compressed', 'created'])
+
+def normalize_query(query):
+    # Case, accents, punctuation and spacing do not change the question
+    query = unicodedata.normalize('NFKD', query.casefold())
+    query = ''.join(c for c in query if not unicodedata.combining(c))
+    return ' '.join(re.sub(r"[^\w\s]", ' ', query).split())
+
+def make_answer(text, created=None):
+    content, compressed = compress(text.encode())
+    return Answer(text, content, compressed, time.time() if created is None else created)
+
+class AnswerCache:
+    """
+    Usage::
+
+        cache = AnswerCache(path="answers.json")
+        answer = cache.get("Where is the nearest shelter?", generate_answer)
+        encrypt_content(packet, answer.content, answer.compressed)
+    """
+    def __init__(self, max_entries=256, ttl=1800, path=None):
+        """
+        :param max_entries: Answers kept; the least recently used one is evicted first.
+        :param ttl: Seconds an answer stays valid after it was generated.
+        :param path: JSON file the answers are saved to and loaded from, None to keep them in memory only.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._answers = OrderedDict()  # Normalized query -> Answer, least recently used first
+        self._in_flight = {}  # Normalized query -> Future of the upstream call
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    def get(self, query, compute):
+        """
+        Answer a query from the cache, or with compute(query) on a miss.
+
+        :raises Exception: Whatever compute raised; failed answers are not cached.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            answer = self._answers.get(key)
+            if answer is not None and time.time() - answer.created > self.ttl:
+                del self._answers[key]
+                self._counts['expired'] += 1
+                answer = None
+            if answer is not None:
+                self._answers.move_to_end(key)
+                self._counts['hits'] += 1
+                return answer
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self._counts['misses'] += 1
+            else:
+                self._counts['coalesced'] += 1
+        if not leader:
+            # Someone is already asking upstream, wait for their answer
+            return future.result()
+
+        try:
+            answer = make_answer(compute(query))
+        except Exception as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[key]
+            self._answers[key] = answer
+            while len(self._answers) > self.max_entries:
+                self._answers.popitem(last=False)
+                self._counts['evicted'] += 1
+        future.set_result(answer)
+        if self.path is not None:
+            self._save()
+        return answer
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load cached answers from {self.path}: {e}")
+            return
+        now = time.time()
+        for key, entry in sorted(saved.items(), key=lambda item: item[1]['created']):
+            if now - entry['created'] <= self.ttl:
+                self._answers[key] = make_answer(entry['text'], entry['created'])
+        while len(self._answers) > self.max_entries:
+            self._answers.popitem(last=False)
+        print(f"Loaded {len(self._answers)} cached answers from {self.path}")
+
+    def _save(self):
+        # Written to a temporary file first, so a crash never leaves a truncated cache
+        temporary = f"{self.path}.tmp"
+        with self._save_lock:
+            with self._lock:
+                saved = {key: {'text': answer.text, 'created': answer.created} for key, answer in self._answers.items()}
+            try:
+                with open(temporary, 'w') as f:
+                    json.dump(saved, f)
+                os.replace(temporary, self.path)
+            except OSError as e:
+                print(f"Could not save cached answers to {self.path}: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['entries'] = len(self._answers)
+            stats['in_flight'] = len(self._in_flight)
+        return stats
@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import Counter
+
+# Gateway selection for the relay's downlinks. Every super node listens on
+# its own topic, 12458Test/sub/<gateway node ID>, besides the shared
+# 12458Test/sub. A downlink goes to the gateway that most recently heard its
+# destination with the best link (see uplink.UplinkCollector), so only one
+# gateway spends airtime on it. Gateways pass the destination's ACK back
+# over MQTT; without one in time the downlink is sent again through the
+# next gateway, and after the last through the shared topic, which every
+# gateway transmits from.
+
+DOWNLINK_TOPIC = "12458Test/sub"
+
+def downlink_topic(gateway=None):
+    # A gateway's own topic, or the shared one
+    return f"{DOWNLINK_TOPIC}/{gateway}" if gateway else DOWNLINK_TOPIC
+
+class DownlinkRouter:
+    """
+    Usage::
+
+        router = DownlinkRouter(uplink_collector.gateways, client.publish).start()
+        router.send(packet.packet_uuid, destination, frames)
+        router.acked(ack.message_id)  # When the destination's ACK comes back
+    """
+    def __init__(self, gateways, publish, ack_timeout=30.0, frame_timeout=5.0, penalty=300):
+        """
+        :param gateways: Called with a node ID, returns [(gateway, link)] of the gateways reaching it, best first.
+        :param publish: Called as publish(topic, frame) to send a frame over MQTT.
+        :param ack_timeout: Seconds to wait for the ACK of a one-frame downlink before trying the next gateway;
+            covers the satellite round trip and the mesh hops both ways.
+        :param frame_timeout: Seconds added for every further frame, e.g. the fragments of a long answer.
+        :param penalty: Seconds a gateway that missed an ACK is passed over for its destination,
+            unless no other gateway reaches it.
+        """
+        self.gateways = gateways
+        self.publish = publish
+        self.ack_timeout = ack_timeout
+        self.frame_timeout = frame_timeout
+        self.penalty = penalty
+        self._pending = {}  # packet_uuid -> {'destination', 'frames', 'tried', 'deadline'}
+        self._missed = {}  # (destination, gateway) -> when the gateway last missed an ACK
+        self._counts = Counter()
+        self._lock = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self._lock.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def send(self, packet_uuid, destination, frames, publish=None):
+        """
+        Publish a downlink's frames through the best gateway for its destination.
+
+        :param publish: Used instead of the router's publish for this first transmission only,
+            e.g. to record what was sent. Fallbacks always use the router's.
+        :return: The gateway used, None if the destination was not heard recently and the shared topic was used.
+        """
+        with self._lock:
+            gateway = self._next_gateway(destination, [], time.time())
+            if gateway is not None:
+                self._pending[packet_uuid] = {
+                    'destination': destination,
+                    'frames': frames,
+                    'tried': [gateway],
+                    'deadline': time.time() + self._timeout(frames),
+                }
+                self._counts['routed'] += 1
+                self._lock.notify()
+            else:
+                self._counts['shared'] += 1
+        self._publish(publish or self.publish, gateway, frames)
+        return gateway
+
+    def acked(self, packet_uuid):
+        """
+        Record the ACK of a downlink, relayed by a gateway.
+
+        :return: True if the downlink was waiting for it.
+        """
+        with self._lock:
+            pending = self._pending.pop(packet_uuid, None)
+            if pending is None:
+                return False
+            self._missed.pop((pending['destination'], pending['tried'][-1]), None)
+            self._counts['acked'] += 1
+            if len(pending['tried']) > 1:
+                self._counts['acked_after_fallback'] += 1
+            return True
+
+    def _timeout(self, frames):
+        return self.ack_timeout + self.frame_timeout * (len(frames) - 1)
+
+    def _next_gateway(self, destination, tried, now):
+        # Best gateway not tried yet, preferring those without a recent missed ACK
+        candidates = [gateway for gateway, _ in self.gateways(destination) if gateway not in tried]
+        for gateway in candidates:
+            if now - self._missed.get((destination, gateway), float('-inf')) > self.penalty:
+                return gateway
+        return candidates[0] if candidates else None
+
+    def _publish(self, publish, gateway, frames):
+        topic = downlink_topic(gateway)
+        for i, frame in enumerate(frames):
+            publish(topic, frame)
+            print(f"Sent frame {i+1}/{len(frames)} (size {len(frame)}) to {topic}")
+
+    def _run(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                retries = []
+                for packet_uuid, pending in list(self._pending.items()):
+                    if pending['deadline'] > now:
+                        continue
+                    self._missed[(pending['destination'], pending['tried'][-1])] = now
+                    self._counts['missed'] += 1
+                    gateway = self._next_gateway(pending['destination'], pending['tried'], now)
+                    if gateway is None:
+                        # Every gateway had its try, so let all of them transmit it once more
+                        del self._pending[packet_uuid]
+                        self._counts['exhausted'] += 1
+                    else:
+                        pending['tried'].append(gateway)
+                        pending['deadline'] = now + self._timeout(pending['frames'])
+                        self._counts['fallbacks'] += 1
+                    print(f"No ACK for downlink {packet_uuid} through {pending['tried'][-1 if gateway is None else -2]}, "
+                          f"sending it through {gateway or 'all gateways'}")
+                    retries.append((gateway, pending['frames']))
+                if not retries:
+                    if not self._running:
+                        return
+                    deadline = min((pending['deadline'] for pending in self._pending.values()), default=None)
+                    self._lock.wait(deadline - now if deadline is not None else None)
+                    continue
+            for gateway, frames in retries:
+                try:
+                    self._publish(self.publish, gateway, frames)
+                except Exception as e:
+                    print(f"Failed to resend downlink: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['awaiting_ack'] = len(self._pending)
+        return stats
@@ -0,0 +1,152 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Durable record of the uplinks the relay has processed, so a packet that
+# arrives again (a super node retry, a broker redelivery, another gateway
+# hearing the same frame) is not turned into a second SMS or LLM call. Each
+# packet is claimed before it is processed, and its result is stored once
+# it completes; later copies get that stored result back to replay. Records
+# live in SQLite for `window` seconds, with the most recent ones also kept
+# in memory so the MQTT thread rarely touches the disk.
+
+PENDING = 'pending'
+DONE = 'done'
+
+class IdempotencyStore:
+    """
+    Usage::
+
+        store = IdempotencyStore("processed.db")
+        new, result = store.claim(packet.network_message.node_id, packet.packet_uuid)
+        if new:
+            ...  # process, then store.complete(...) or store.release(...)
+        elif result is not None:
+            ...  # replay the stored result
+    """
+    def __init__(self, path=':memory:', window=86400, max_cached=4096, prune_interval=60):
+        """
+        :param path: SQLite database file.
+        :param window: Seconds a processed packet is remembered.
+        :param max_cached: Records kept in memory in front of the database.
+        :param prune_interval: Seconds between deletions of expired records.
+        """
+        self.window = window
+        self.max_cached = max_cached
+        self.prune_interval = prune_interval
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS processed (
+            source TEXT NOT NULL,
+            packet_uuid TEXT NOT NULL,
+            received REAL NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            PRIMARY KEY (source, packet_uuid))""")
+        # Work that was in progress when the relay last stopped never finished,
+        # so copies of those packets must be processed again
+        self._db.execute("DELETE FROM processed WHERE status = ?", (PENDING,))
+        self._db.commit()
+        self._cache = OrderedDict()  # (source, packet_uuid) -> (received, status, result), least recently used first
+        self._counts = Counter()
+        self._last_prune = 0
+        self._lock = threading.Lock()
+
+    def claim(self, source, packet_uuid, now=None):
+        """
+        Claim a packet for processing, unless it was claimed before.
+
+        :return: (True, None) for a new packet, which the caller must complete() or release().
+            (False, result) for a duplicate: its stored result, or None while it is still being processed.
+        """
+        now = time.time() if now is None else now
+        key = (source, packet_uuid)
+        with self._lock:
+            self._prune(now)
+            record = self._cache.get(key)
+            if record is not None:
+                self._cache.move_to_end(key)
+            else:
+                row = self._db.execute("SELECT received, status, result FROM processed WHERE source = ? AND packet_uuid = ?",
+                                       key).fetchone()
+                if row is not None:
+                    self._counts['disk_lookups'] += 1
+                    record = (row[0], row[1], json.loads(row[2]) if row[2] is not None else None)
+                    self._remember(key, record)
+            if record is not None and now - record[0] <= self.window:
+                self._counts['duplicates'] += 1
+                return False, record[2] if record[1] == DONE else None
+
+            self._db.execute("INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, NULL)", (source, packet_uuid, now, PENDING))
+            self._db.commit()
+            self._remember(key, (now, PENDING, None))
+            self._counts['claimed'] += 1
+            return True, None
+
+    def complete(self, source, packet_uuid, result):
+        """
+        Store the result of a claimed packet, for replaying to its duplicates.
+
+        :param result: Anything JSON can represent.
+        """
+        key = (source, packet_uuid)
+        with self._lock:
+            self._db.execute("UPDATE processed SET status = ?, result = ? WHERE source = ? AND packet_uuid = ?",
+                             (DONE, json.dumps(result), source, packet_uuid))
+            self._db.commit()
+            received = self._cache[key][0] if key in self._cache else time.time()
+            self._remember(key, (received, DONE, result))
+            self._counts['completed'] += 1
+
+    def release(self, source, packet_uuid):
+        # Processing failed: forget the claim, so a later copy is processed again
+        key = (source, packet_uuid)
+        with self._lock:
+            self._db.execute("DELETE FROM processed WHERE source = ? AND packet_uuid = ?", key)
+            self._db.commit()
+            self._cache.pop(key, None)
+            self._counts['released'] += 1
+
+    def _remember(self, key, record):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def _prune(self, now):
+        # Completed records older than the window; pending ones are still being worked on
+        if now - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = now
+        cursor = self._db.execute("DELETE FROM processed WHERE received < ? AND status = ?", (now - self.window, DONE))
+        self._db.commit()
+        self._counts['expired'] += cursor.rowcount
+        for key in [key for key, record in self._cache.items() if now - record[0] > self.window and record[1] == DONE]:
+            del self._cache[key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['cached'] = len(self._cache)
+            stats['stored'] = self._db.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class RecordingClient:
+    """
+    Wraps an MQTT client to keep what is published through it, as the
+    result to replay for duplicates of the packet being answered.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.published = []  # [topic, payload]
+
+    def publish(self, topic, payload):
+        self.published.append([topic, payload])
+        return self.client.publish(topic, payload)
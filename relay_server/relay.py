@@ -1,132 +1,341 @@
 import paho.mqtt.client as mqtt
-import base64
-from twilio.rest import Client
-from spec_pb2 import Packet, PacketType, NetworkMessage
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import padding as sym_padding
-import os
+from resililink.spec_pb2 import Packet, PacketType, NetworkMessage
+from resililink.codec import encode_frame, decode_frame, max_payload
+from resililink.wire import serialize_packet, parse_packet, SERVER_NODE_ID, FLAG_MORE
+from resililink.fragment import FragmentCache, fragment_size, segment_size, split_payload, make_fragments
+from resililink.compression import compress, decompress, FLAG_COMPRESSED
+from resililink.crypto import MessageCipher, message_aad, FLAG_AEAD
+from workers import WorkerPool, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from sms import SmsDispatcher, SmsOutcomeUnknown
+from answer_cache import AnswerCache
+from streaming import Segmenter, StubBackend, gemini_backend
+from idempotency import IdempotencyStore, RecordingClient
+from uplink import UplinkCollector, UPLINK_TOPIC, parse_uplink
+from downlink import DownlinkRouter, downlink_topic
 import uuid
 import time
+import itertools
+import threading
 
 import google.generativeai as genai
 import os
 
 genai.configure(api_key="YOUR_API_KEY")
 model = genai.GenerativeModel("gemini-1.5-pro")
-chat = model.start_chat(history=[])
+
+# Backend answering "+Q" queries: "gemini", or "stub" for a canned answer when testing offline
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')
+llm_backend = StubBackend() if LLM_BACKEND == "stub" else gemini_backend(model)
+STREAM_ANSWERS = True  # Send answers in frame-sized segments while they are generated
 
 # Define Twilio API credentials
 TWILIO_ACCOUNT_SID = 'YOUR_API_KEY'
 TWILIO_AUTH_TOKEN = 'YOUR_API_KEY'
 TWILIO_PHONE_NUMBER = 'YOUR_PHONE_NUMBER'
+# API root, overridable to test against a local stand-in such as sms.TwilioStandIn
+TWILIO_API_URL = os.environ.get('TWILIO_API_URL', 'https://api.twilio.com')
+SMS_RATE = 1.0  # SMS per second the sending number may send
+SMS_WINDOW = 2.0  # Seconds to wait for more messages to the same destination before sending them as one SMS
+SMS_CONNECTIONS = 2  # Persistent HTTPS connections to Twilio, and requests in flight at once
+sms_dispatcher = SmsDispatcher(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER, base_url=TWILIO_API_URL,
+                               rate=SMS_RATE, window=SMS_WINDOW, connections=SMS_CONNECTIONS)
+
+# MQTT broker the gateways publish to; a skylo_emulator.py broker for offline runs
+MQTT_BROKER = os.environ.get('MQTT_BROKER', 'test.mosquitto.org')
 
 # AES key for encryption/decryption (must be 16, 24, or 32 bytes for AES-128/192/256)
 AES_KEY = b'password'.ljust(16, b'\0')[:16]  # Ensure the key is 16 bytes
+message_cipher = MessageCipher(AES_KEY)
+ENCRYPTION = "ccm"  # Message encryption, "ccm" (AES-CCM, no IV on the wire) or "cbc" for nodes that predate it
+
+# Encoding for downlink frames; uplinks are decoded whatever codec they use
+FRAME_CODEC = "base91"
+WIRE_VERSION = 2  # Packet schema for downlinks (1 = spec.proto, 2 = compact spec_v2.proto)
+HOP_LIMIT = 3  # Mesh transmissions a downlink may take after the super node sends it
+FRAME_SIZE = 240  # Largest LoRa frame the super node can transmit
+# Largest serialized packet that fits into one frame; larger ones are fragmented
+MAX_PACKET_SIZE = max_payload(FRAME_SIZE, FRAME_CODEC)
+# Longest answer sent back, in bytes of UTF-8, so a response stays within fragment.MAX_FRAGMENTS
+MAX_RESPONSE_BYTES = 4096
+
+# Answers to "+Q" queries, shared by nodes asking the same question
+ANSWER_TTL = 1800  # Seconds an answer is reused before the LLM is asked again
+# File the answers survive restarts in, unset to keep them in memory only
+ANSWER_CACHE_FILE = os.environ.get('ANSWER_CACHE_FILE')
+answer_cache = AnswerCache(max_entries=256, ttl=ANSWER_TTL, path=ANSWER_CACHE_FILE)
+
+# Uplinks already processed, so copies of a packet are answered from the stored result
+IDEMPOTENCY_DB = os.environ.get('IDEMPOTENCY_DB', 'processed.db')
+IDEMPOTENCY_WINDOW = 86400  # Seconds a processed packet is remembered
+idempotency_store = IdempotencyStore(IDEMPOTENCY_DB, window=IDEMPOTENCY_WINDOW)
+
+# Copies of an uplink heard by several gateways are merged before processing
+UPLINK_WINDOW = 1.5  # Seconds to wait for copies from other gateways
+uplink_collector = UplinkCollector(lambda packet, copy: dispatch_packet(mqtt_client, packet, copy), window=UPLINK_WINDOW)
+# Downlinks go through the gateway that heard the destination best, the next one after a missing ACK
+DOWNLINK_ACK_TIMEOUT = 30  # Seconds to wait for a node's ACK before trying another gateway
+downlink_router = DownlinkRouter(uplink_collector.gateways, lambda topic, frame: mqtt_client.publish(topic, frame),
+                                 ack_timeout=DOWNLINK_ACK_TIMEOUT)
+
+# Sequence numbers for the packets the server creates
+# Starting from the clock, so after a restart they continue above the numbers
+# used before, which receivers would reject as replays
+sequence_numbers = itertools.count(int(time.time()))
+
+# Slices of fragmented responses, kept to answer NACKs from the nodes
+fragment_cache = FragmentCache()
+
+# Workers for everything slower than parsing, so the MQTT thread keeps reading and answering keep-alives
+WORKERS = 8
+LLM_CONCURRENCY = 2  # LLM queries in flight at once
+SMS_CONCURRENCY = 4  # SMS messages decrypted and handed to sms_dispatcher at once
+METRICS_INTERVAL = 60  # Seconds between queue metrics printouts (0 = off)
+# Tasks are submitted from the uplink collector's thread, which may wait for room as long as it takes:
+# the collector then fills up and holds back the MQTT thread instead
+worker_pool = WorkerPool(workers=WORKERS, max_queue=512, limits={"llm": LLM_CONCURRENCY, "sms": SMS_CONCURRENCY},
+                         block_timeout=None)
+
 
-def aes_encrypt(message):
-    if isinstance(message, str):
-        message = message.encode()
+def encrypt_message(packet, message):
+    # Compress and encrypt message text into a packet's NetworkMessage, whose
+    # node_id must be set: with AES-CCM the packet header provides the nonce
+    encrypt_content(packet, *compress(message.encode()))
 
-    iv = os.urandom(16)
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
+def encrypt_content(packet, content, compressed):
+    # Encrypt text that compress() already prepared, e.g. a cached answer
+    network_message = packet.network_message
+    # Keeps FLAG_MORE of a streamed segment
+    network_message.flags |= FLAG_COMPRESSED if compressed else 0
+    if ENCRYPTION == "ccm":
+        # The flags are authenticated along with the rest of the header, so set them first
+        network_message.flags |= FLAG_AEAD
+        network_message.message_content = message_cipher.encrypt(content, network_message.node_id, packet.packet_uuid, packet.sequence,
+                                                                 message_aad(network_message))
+    else:
+        network_message.message_content = message_cipher.encrypt_cbc(content)
 
-    padder = sym_padding.PKCS7(algorithms.AES.block_size).padder()
-    padded_message = padder.update(message) + padder.finalize()
+def decrypt_message(packet):
+    # Decrypt a packet's message text in whichever format the sender used
+    network_message = packet.network_message
+    if network_message.flags & FLAG_AEAD:
+        content = message_cipher.decrypt(network_message.message_content, network_message.node_id, packet.packet_uuid, packet.sequence,
+                                         message_aad(network_message))
+    else:
+        content = message_cipher.decrypt_cbc(network_message.message_content)
+    if network_message.flags & FLAG_COMPRESSED:
+        content = decompress(content)
+    return content.decode()
 
-    encrypted_message = encryptor.update(padded_message) + encryptor.finalize()
+def generate_answer(query):
+    # The whole answer at once, for when streaming is off
+    print(f"Performing LLM search for: {query}")
+    answer = "".join(llm_backend(query))
+    print(f"Received response: {answer}")
+    # The whole answer goes into one packet, fragmented to fit the LoRa frames
+    return answer.encode()[:MAX_RESPONSE_BYTES].decode(errors='ignore')
 
-    return iv + encrypted_message
+def stream_answer(client, destination, query):
+    # Publish the answer segment by segment while it is generated, and return all of it.
+    # The segments share a stream ID and are numbered, so the node can put them back in order.
+    print(f"Streaming LLM answer for: {query}")
+    size = segment_size(SERVER_NODE_ID, destination, MAX_PACKET_SIZE, WIRE_VERSION, ENCRYPTION, MAX_RESPONSE_BYTES)
+    segmenter = Segmenter(size, MAX_RESPONSE_BYTES)
+    stream_id = uuid.uuid4().hex[:8]
+    segments = []
+    try:
+        for chunk in llm_backend(query):
+            for segment in segmenter.feed(chunk):
+                send_segment(client, destination, segment, stream_id, len(segments), True)
+                segments.append(segment)
+    except Exception:
+        # Close the answer, so the node does not wait for the rest
+        send_segment(client, destination, segmenter.finish() + " [answer incomplete]", stream_id, len(segments), False)
+        raise
+    segment = segmenter.finish()
+    send_segment(client, destination, segment, stream_id, len(segments), False)
+    segments.append(segment)
+    print(f"Streamed answer {stream_id} in {len(segments)} segments")
+    return "".join(segments)
+
+def send_segment(client, destination, text, stream_id, index, more):
+    packet = new_response_packet(destination)
+    packet.network_message.stream_id = stream_id
+    packet.network_message.segment = index
+    if more:
+        packet.network_message.flags |= FLAG_MORE
+    encrypt_message(packet, text)
+    publish_packet(client, packet)
+
+def new_response_packet(destination):
+    # A NetworkMessage from the server with a fresh ID and sequence number
+    response_packet = Packet()
+    response_packet.packet_uuid = uuid.uuid4().hex[:8]
+    response_packet.packet_type = PacketType.NETWORK_MESSAGE
+    response_packet.sequence = next(sequence_numbers)
+    response_packet.hop_limit = HOP_LIMIT
 
-def aes_decrypt(ciphertext):
-    encrypted_data = ciphertext
-    iv = encrypted_data[:16]
-    encrypted_message = encrypted_data[16:]
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv), backend=default_backend())
-    decryptor = cipher.decryptor()
-    decrypted_padded_message = decryptor.update(encrypted_message) + decryptor.finalize()
-    unpadder = sym_padding.PKCS7(algorithms.AES.block_size).unpadder()
-    decrypted_message = unpadder.update(decrypted_padded_message) + unpadder.finalize()
-    return decrypted_message.decode()
+    response_network_message = NetworkMessage()
+    response_network_message.node_id = SERVER_NODE_ID
+    response_network_message.timestamp = int(time.time())
+    response_network_message.destination = destination
 
-def perform_gemini_search(query):
-    print(f"Performing Gemini search for: {query}")
-    response = chat.send_message(query)
-    print(f"Received response: {response.text}")
-    return response.text
+    response_packet.network_message.CopyFrom(response_network_message)
+    return response_packet
 
-def split_message(message, chunk_size=45):
-    return [message[i:i+chunk_size] for i in range(0, len(message), chunk_size)]
+def publish_packet(client, packet):
+    # Send each frame back via MQTT, through the gateway best placed to reach the destination.
+    # Only this first transmission goes through client, which may be recording it;
+    # fallbacks to other gateways are published by the router directly.
+    downlink_router.send(packet.packet_uuid, packet.network_message.destination, packet_frames(packet), client.publish)
+
+def packet_frames(packet):
+    # Frames carrying a downlink: one, or its fragments if it does not fit into a LoRa frame
+    serialized_packet = serialize_packet(packet, WIRE_VERSION)
+    if len(serialized_packet) <= MAX_PACKET_SIZE:
+        return [encode_frame(serialized_packet, FRAME_CODEC)]
+    destination = packet.network_message.destination
+    chunks = split_payload(serialized_packet, fragment_size(SERVER_NODE_ID, destination, MAX_PACKET_SIZE, WIRE_VERSION))
+    fragment_cache.put(packet.packet_uuid, chunks, destination)
+    fragments = make_fragments(SERVER_NODE_ID, packet.packet_uuid, destination, chunks, HOP_LIMIT)
+    return [encode_frame(serialize_packet(fragment, WIRE_VERSION), FRAME_CODEC) for fragment in fragments]
+
+def resend_fragments(client, nack, gateway=None):
+    # Answer a NACK by resending only the fragments the node is missing,
+    # through the gateway that passed the NACK on
+    cached = fragment_cache.get(nack.message_id)
+    if cached is None:
+        print(f"NACK for {nack.message_id}, which is no longer cached")
+        return
+    chunks, destination = cached
+    for fragment in make_fragments(SERVER_NODE_ID, nack.message_id, destination, chunks, HOP_LIMIT, nack.missing):
+        client.publish(downlink_topic(gateway), encode_frame(serialize_packet(fragment, WIRE_VERSION), FRAME_CODEC))
+    print(f"Resent fragments {list(nack.missing)} of {nack.message_id}")
 
 def on_connect(client, userdata, flags, rc):
     print("Connected with result code " + str(rc))
-    client.subscribe("12458Test/pub")
+    # Gateways that predate per-gateway topics still publish to the plain one
+    client.subscribe([(UPLINK_TOPIC, 0), (UPLINK_TOPIC + "/+", 0)])
 
 def on_message(client, userdata, msg):
+    # Runs on the MQTT network thread: parse, then collect copies from all gateways
     print(msg.topic + " " + str(msg.payload))
-    msg_decoded = base64.urlsafe_b64decode(msg.payload)
-
     try:
-        packet = Packet()
-        packet.ParseFromString(msg_decoded)
+        gateway, rssi, snr, frame = parse_uplink(msg.topic, msg.payload)
+        msg_decoded = decode_frame(frame)
+        packet = parse_packet(msg_decoded)
     except Exception as e:
         print(f"Failed to parse packet: {e}")
         return
+    uplink_collector.add(gateway, packet, rssi, snr)
 
+def dispatch_packet(client, packet, copy):
+    # The best copy of an uplink once all gateways had their chance; hand the work to the pool
+    print(f"Uplink {packet.packet_uuid} heard by {len(copy['gateways'])} gateway(s), best {copy['gateway']} "
+          f"(RSSI {copy['rssi']}, SNR {copy['snr']})")
     if packet.packet_type == PacketType.NETWORK_MESSAGE:
-        network_message = packet.network_message
-        try:
-            decrypted_message = aes_decrypt(network_message.message_content)
-            print(f"Decrypted message: {decrypted_message}")
+        new, result = idempotency_store.claim(packet.network_message.node_id, packet.packet_uuid)
+        if not new:
+            replay_result(client, packet, result)
+            return
+        if packet.network_message.destination.startswith("+Q"):
+            accepted = worker_pool.submit(lambda: process_network_message(client, packet), PRIORITY_LOW, "llm")
+        else:
+            accepted = worker_pool.submit(lambda: process_network_message(client, packet), PRIORITY_NORMAL, "sms")
+        if not accepted:
+            idempotency_store.release(packet.network_message.node_id, packet.packet_uuid)
+    elif packet.packet_type == PacketType.NACK_MESSAGE and packet.nack_message.destination == SERVER_NODE_ID:
+        # Nodes are holding partial responses, so resends go first
+        worker_pool.submit(lambda: resend_fragments(client, packet.nack_message, copy['gateway']), PRIORITY_HIGH)
+    elif packet.packet_type == PacketType.ACK_MESSAGE:
+        # A node confirming a downlink, passed back by the gateway that transmitted it
+        if downlink_router.acked(packet.ack_message.message_id):
+            print(f"ACK for downlink {packet.ack_message.message_id} from {packet.ack_message.node_id}")
 
-            if network_message.destination.startswith("+Q"):
-                query = decrypted_message.strip()  # Remove "+QUESTION" and leading/trailing spaces
-                search_result = perform_gemini_search(query)
+def replay_result(client, packet, result):
+    # Answer a copy of a packet that was already processed, without redoing the work
+    if result is None:
+        print(f"Duplicate of {packet.packet_uuid}, which is still being processed")
+    elif 'sms' in result:
+        print(f"Duplicate of {packet.packet_uuid}, already sent as SMS {result['sms']}")
+    else:
+        # Frames the node already has are dropped by its duplicate filter
+        for topic, frame in result['published']:
+            client.publish(topic, frame)
+        print(f"Duplicate of {packet.packet_uuid}, replayed {len(result['published'])} frames")
 
-                chunks = split_message(search_result)
+def record_sms(packet, future):
+    # Stored once Twilio accepted the SMS; after a failure a later copy may try again,
+    # unless the SMS may have gone out anyway
+    source = packet.network_message.node_id
+    if future.exception() is None:
+        idempotency_store.complete(source, packet.packet_uuid, {'sms': future.result()})
+    elif isinstance(future.exception(), SmsOutcomeUnknown):
+        idempotency_store.complete(source, packet.packet_uuid, {'sms': None})
+    else:
+        idempotency_store.release(source, packet.packet_uuid)
 
+def process_network_message(client, packet):
+    network_message = packet.network_message
+    # Keeps the frames published in answer, to replay for copies of this packet
+    client = RecordingClient(client)
+    try:
+        decrypted_message = decrypt_message(packet)
+        print(f"Decrypted message: {decrypted_message}")
 
-                # Send each chunk back via MQTT
-                for i, chunk in enumerate(chunks):
-                    encrypted_result = aes_encrypt(chunk)
-                    response_packet = Packet()
-                    response_packet.packet_uuid = uuid.uuid4().hex[:8]
-                    response_packet.packet_type = PacketType.NETWORK_MESSAGE
+        if network_message.destination.startswith("+Q"):
+            query = decrypted_message.strip()  # Remove "+QUESTION" and leading/trailing spaces
+            destination = network_message.node_id
+            streamed = []
 
-                    response_network_message = NetworkMessage()
-                    response_network_message.node_id = "Server"
-                    response_network_message.timestamp = int(time.time())
-                    response_network_message.message_content = encrypted_result
-                    response_network_message.destination = network_message.node_id
+            def generate(query):
+                # On a cache miss this node gets the answer streamed while it is generated
+                if not STREAM_ANSWERS:
+                    return generate_answer(query)
+                streamed.append(query)
+                return stream_answer(client, destination, query)
 
-                    response_packet.network_message.CopyFrom(response_network_message)
+            answer = answer_cache.get(query, generate)
+            if not streamed:
+                # Cached, or generated for another node asking the same: sent whole.
+                # Encrypted for each request: a fresh packet ID and sequence number
+                # make up the nonce, and nodes drop packets whose sequence they have seen
+                response_packet = new_response_packet(destination)
+                encrypt_content(response_packet, answer.content, answer.compressed)
+                publish_packet(client, response_packet)
+            idempotency_store.complete(network_message.node_id, packet.packet_uuid, {'published': client.published})
+        else:
+            future = send_sms(network_message.destination, decrypted_message, network_message.node_id)
+            future.add_done_callback(lambda future: record_sms(packet, future))
+    except Exception as e:
+        print(f"Failed to process message: {e}")
+        idempotency_store.release(network_message.node_id, packet.packet_uuid)
 
-                    serialized_packet = response_packet.SerializeToString()
-                    encoded_packet = base64.urlsafe_b64encode(serialized_packet)
+def report_metrics():
+    while True:
+        time.sleep(METRICS_INTERVAL)
+        print(f"Worker pool: {worker_pool.stats()}")
+        print(f"SMS: {sms_dispatcher.stats()}")
+        print(f"Answer cache: {answer_cache.stats()}")
+        print(f"Processed packets: {idempotency_store.stats()}")
+        print(f"Uplinks: {uplink_collector.stats()}")
+        print(f"Downlinks: {downlink_router.stats()}")
 
-                    client.publish("12458Test/sub", encoded_packet)
-                    print(f"Sent chunk {i+1} (size {len(serialized_packet)})/{len(chunks)}")
-            else:
-                send_sms(network_message.destination, decrypted_message)
-        except Exception as e:
-            print(f"Failed to process message: {e}")
+def send_sms(destination, message_content, sender):
+    # Queued on the dispatcher, which coalesces per sender, rate limits and retries; it prints the outcome
+    print(f"Sending message from {sender} to {destination}: {message_content}")
+    return sms_dispatcher.send(destination, message_content, sender)
 
-def send_sms(destination, message_content):
-    print(f"Sending message to {destination}: {message_content}")
-    try:
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        message = client.messages.create(
-            body=message_content,
-            from_=TWILIO_PHONE_NUMBER,
-            to=destination
-        )
-        print(f"Message sent to {destination}: {message.sid}")
-    except Exception as e:
-        print(f"Failed to send message: {e}")
+worker_pool.start()
+sms_dispatcher.start()
+uplink_collector.start()
+downlink_router.start()
+if METRICS_INTERVAL:
+    metrics_thread = threading.Thread(target=report_metrics)
+    metrics_thread.daemon = True
+    metrics_thread.start()
 
 mqtt_client = mqtt.Client()
 mqtt_client.on_connect = on_connect
 mqtt_client.on_message = on_message
-mqtt_client.connect("test.mosquitto.org", 1883, 60)
+mqtt_client.connect(MQTT_BROKER, 1883, 60)
 mqtt_client.loop_forever()
\ No newline at end of file
@@ -0,0 +1,369 @@
+import base64
+import http.client
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urlsplit, parse_qs
+
+# SMS delivery through Twilio's Messages API over a few long-lived HTTPS
+# connections. Sends are paced by a token bucket so a burst stays within
+# the sending number's throughput, retried with backoff only while Twilio
+# cannot have accepted them (429, 503, or a request that never got out),
+# and messages from one sender to the same destination that arrive within a
+# short window go out as one SMS.
+
+MAX_BODY = 1600  # Longest SMS body Twilio accepts, in characters
+# Answers that mean Twilio turned the request away without processing it
+RETRY_STATUSES = (429, 503)
+
+class SmsOutcomeUnknown(Exception):
+    """
+    The request failed in a way Twilio may already have sent the SMS (a
+    5xx other than 503, or a connection lost while waiting for the answer),
+    so it is not retried.
+    """
+
+def split_body(body, size=MAX_BODY):
+    """
+    Split a body too long for one SMS into numbered parts, "(1/3) ..." and
+    so on, cut at spaces or line breaks where possible.
+
+    :return: The parts, each at most size characters.
+    """
+    count = 1
+    while True:
+        room = size - len(f"({count}/{count}) ")
+        parts = []
+        rest = body
+        while rest:
+            part = rest[:room]
+            if len(rest) > room:
+                # Not so early that the part would be mostly empty
+                cut = max(part.rfind(' '), part.rfind('\n'))
+                if cut >= room // 2:
+                    part = part[:cut + 1]
+            parts.append(part)
+            rest = rest[len(part):]
+        if len(str(len(parts))) <= len(str(count)):
+            return [f"({i + 1}/{len(parts)}) {part}" for i, part in enumerate(parts)]
+        # More parts than the prefix was sized for
+        count = len(parts)
+
+class TokenBucket:
+    # `rate` tokens per second, holding up to `burst`
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Block until a token is available and take it
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class SmsDispatcher:
+    """
+    Usage::
+
+        sms = SmsDispatcher(ACCOUNT_SID, AUTH_TOKEN, "+15550001111").start()
+        future = sms.send("+15552223333", "Water at the school", sender="FIXED12")
+        print(future.result())  # Message SID, once the coalesced SMS went out
+    """
+    def __init__(self, account_sid, auth_token, from_number, base_url="https://api.twilio.com",
+                 rate=1.0, burst=3, window=2.0, connections=2, max_retries=4, backoff=1.0, timeout=10):
+        """
+        :param base_url: API root; point it at a local stand-in for tests.
+        :param rate: SMS per second the sending number may send (1 for a US long code).
+        :param burst: SMS that may go out back to back after a quiet period.
+        :param window: Seconds a message waits for more from its sender to the same destination (0 = no coalescing).
+        :param connections: HTTP connections kept open, and SMS in flight at once.
+        :param max_retries: Retries after a 429, 503 or a request that could not be sent before a send fails.
+        :param backoff: Delay before the first retry in seconds, doubled for each further one.
+        """
+        self.account_sid = account_sid
+        self.from_number = from_number
+        self.window = window
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        url = urlsplit(base_url)
+        self._https = url.scheme == 'https'
+        self._host = url.netloc
+        self._path = f"{url.path.rstrip('/')}/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self._authorization = "Basic " + base64.b64encode(f"{account_sid}:{auth_token}".encode()).decode()
+        self._bucket = TokenBucket(rate, burst)
+        self._connections = queue.Queue()
+        for _ in range(connections):
+            self._connections.put(None)  # Opened on first use
+        self._senders = ThreadPoolExecutor(max_workers=connections)
+        self._pending = {}  # (destination, sender) -> batch still collecting messages
+        self._ready = []  # Batches to send without waiting for their window
+        self._counts = Counter()
+        self._lock = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # Send what is still waiting for its window, then close the connections
+        with self._lock:
+            self._running = False
+            self._lock.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self._senders.shutdown(wait=True)
+        while not self._connections.empty():
+            connection = self._connections.get()
+            if connection is not None:
+                connection.close()
+
+    def send(self, destination, body, sender=None):
+        """
+        Queue an SMS, merged with others from the same sender to the same destination in
+        the same window. A body longer than MAX_BODY is sent as several numbered SMS instead.
+
+        :param sender: Who wrote the message, e.g. the mesh node ID. Messages of different
+            senders are never merged, so an SMS cannot mix up whose text is whose.
+        :return: A Future resolved with the message SID (a list of them for a split body),
+            or with the error once retries ran out (SmsOutcomeUnknown if the SMS may have gone out).
+        """
+        key = (destination, sender)
+        if len(body) > MAX_BODY:
+            return self._send_split(key, body)
+        future = Future()
+        with self._lock:
+            batch = self._pending.get(key)
+            if batch is not None and len(batch['body']) + 1 + len(body) > MAX_BODY:
+                # Would not fit one SMS, so the waiting batch goes now
+                self._ready.append(self._pending.pop(key))
+                batch = None
+            if batch is None:
+                batch = {'destination': destination, 'body': body, 'futures': [],
+                         'due': time.monotonic() + self.window}
+                self._pending[key] = batch
+            else:
+                batch['body'] += "\n" + body
+                self._counts['coalesced'] += 1
+            batch['futures'].append(future)
+            self._counts['queued'] += 1
+            self._lock.notify()
+        return future
+
+    def _send_split(self, key, body):
+        # Every part is an SMS of its own, sent after what the sender has waiting for the destination
+        parts = [{'destination': key[0], 'body': part, 'futures': [Future()], 'due': 0} for part in split_body(body)]
+        with self._lock:
+            if key in self._pending:
+                self._ready.append(self._pending.pop(key))
+            self._ready.extend(parts)
+            self._counts['queued'] += 1
+            self._counts['split'] += 1
+            self._lock.notify()
+
+        # Resolved with the SIDs of all parts, or the first error, once every part is done
+        futures = [part['futures'][0] for part in parts]
+        future = Future()
+        lock = threading.Lock()
+        def part_done(_):
+            with lock:
+                if future.done() or not all(part.done() for part in futures):
+                    return
+                errors = [part.exception() for part in futures if part.exception() is not None]
+                if errors:
+                    future.set_exception(errors[0])
+                else:
+                    future.set_result([part.result() for part in futures])
+        for part in futures:
+            part.add_done_callback(part_done)
+        return future
+
+    def _run(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                ready, self._ready = self._ready, []
+                for key, batch in list(self._pending.items()):
+                    if batch['due'] <= now or not self._running:
+                        ready.append(self._pending.pop(key))
+                if not ready:
+                    if not self._running:
+                        return
+                    due = min((batch['due'] for batch in self._pending.values()), default=None)
+                    self._lock.wait(due - now if due is not None else None)
+                    continue
+            for batch in ready:
+                self._senders.submit(self._deliver, batch)
+
+    def _deliver(self, batch):
+        try:
+            sid = self._post(batch['destination'], batch['body'])
+        except Exception as e:
+            print(f"Failed to send SMS to {batch['destination']}: {e}")
+            with self._lock:
+                self._counts['failed'] += 1
+            for future in batch['futures']:
+                future.set_exception(e)
+            return
+        print(f"Message sent to {batch['destination']}: {sid}")
+        with self._lock:
+            self._counts['sent'] += 1
+        for future in batch['futures']:
+            future.set_result(sid)
+
+    def _post(self, destination, body):
+        form = urlencode({'To': destination, 'From': self.from_number, 'Body': body})
+        headers = {
+            'Authorization': self._authorization,
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/json',
+        }
+        for attempt in range(self.max_retries + 1):
+            self._bucket.acquire()
+            connection = self._connections.get()
+            reused = connection is not None
+            retry_after = None
+            sent = False
+            try:
+                if connection is None:
+                    connection_class = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+                    connection = connection_class(self._host, timeout=self.timeout)
+                connection.request('POST', self._path, body=form, headers=headers)
+                sent = True
+                response = connection.getresponse()
+                payload = response.read()
+                if response.status in (200, 201):
+                    return json.loads(payload)['sid']
+                if response.status >= 500 and response.status not in RETRY_STATUSES:
+                    raise SmsOutcomeUnknown(f"Twilio failed on the SMS: {response.status} {payload[:200]!r}")
+                if response.status not in RETRY_STATUSES:
+                    raise ValueError(f"Twilio rejected the SMS: {response.status} {payload[:200]!r}")
+                retry_after = response.getheader('Retry-After')
+                error = f"HTTP {response.status}"
+            except (OSError, http.client.HTTPException) as e:
+                # Reconnect on the next attempt
+                if connection is not None:
+                    connection.close()
+                connection = None
+                error = str(e) or type(e).__name__
+                # Once the request is out, Twilio may have sent the SMS even without an answer, so only
+                # retry when it never got out, or a kept-alive connection turned out closed before it was read
+                stale = reused and isinstance(e, http.client.RemoteDisconnected)
+                if sent and not stale:
+                    raise SmsOutcomeUnknown(f"SMS to {destination} may have been sent: {error}") from e
+            finally:
+                self._connections.put(connection)
+            if attempt == self.max_retries:
+                raise ConnectionError(f"SMS to {destination} failed after {attempt + 1} attempts: {error}")
+            with self._lock:
+                self._counts['retries'] += 1
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt
+            time.sleep(delay * random.uniform(1.0, 1.25))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['waiting'] = sum(len(batch['futures']) for batch in list(self._pending.values()) + self._ready)
+        return stats
+
+class TwilioStandIn:
+    """
+    Local HTTP server answering like Twilio's Messages endpoint, for testing
+    the dispatcher without sending real SMS. A share of requests can be
+    answered with 429 or 503.
+    """
+    def __init__(self, port=0, error_rate=0.0, seed=None):
+        stand_in = self
+        self.messages = []
+        self.requests = 0
+        self.connections = 0
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+            def setup(self):
+                super().setup()
+                with stand_in._lock:
+                    stand_in.connections += 1
+
+            def do_POST(self):
+                form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+                with stand_in._lock:
+                    stand_in.requests += 1
+                    status = 201
+                    if stand_in.random.random() < stand_in.error_rate:
+                        status = stand_in.random.choice((429, 503))
+                    else:
+                        stand_in.messages.append((form['To'][0], form['Body'][0], time.monotonic()))
+                        sid = f"SM{len(stand_in.messages):032x}"
+                body = json.dumps({'sid': sid, 'status': 'queued'} if status == 201 else {'code': status}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+if __name__ == "__main__":
+    # Incident-spike simulation against the local stand-in:
+    #   python sms.py [messages] [destinations] [error rate]
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    destinations = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    error_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+    stand_in = TwilioStandIn(error_rate=error_rate, seed=1).start()
+    dispatcher = SmsDispatcher("AC00000000000000000000000000000000", "token", "+15550000000",
+                               base_url=stand_in.url, rate=5, burst=5, window=1.0, backoff=0.2).start()
+
+    rng = random.Random(2)
+    start = time.monotonic()
+    futures = []
+    for i in range(count):
+        futures.append(dispatcher.send(f"+1555000{rng.randrange(destinations):04d}", f"Mesh message {i}"))
+        time.sleep(rng.expovariate(count / 5))  # All within about five seconds
+    delivered = sum(future.exception(timeout=60) is None for future in futures)
+    dispatcher.stop()
+    stand_in.stop()
+    print(f"{count} messages to {destinations} numbers became {len(stand_in.messages)} SMS in "
+          f"{time.monotonic() - start:.1f} s over {stand_in.connections} connections; "
+          f"{delivered} delivered, {stand_in.requests - len(stand_in.messages)} requests answered 429/503")
+    print(dispatcher.stats())
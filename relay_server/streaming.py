@@ -0,0 +1,98 @@
+import time
+
+# Streaming of LLM answers to the mesh. The answer is cut into segments that
+# each fit one LoRa frame as a NetworkMessage of its own, and every segment is
+# sent as soon as it is complete instead of after the whole generation.
+# The segments of an answer share a stream ID and are numbered from 0;
+# wire.FLAG_MORE is set on all segments but the last. Nodes reorder them
+# with fragment.StreamAssembler.
+#
+# A backend is any callable taking the query and returning an iterable of
+# text chunks as they are generated.
+
+# Characters a segment is preferably cut after, best first
+BREAKS = ["\n", ". ", "? ", "! ", "; ", ", ", " "]
+
+class Segmenter:
+    """
+    Cuts streamed text into segments of at most max_bytes of UTF-8, at line,
+    sentence or word boundaries where possible. Joining the segments gives
+    the text back unchanged.
+    """
+    def __init__(self, max_bytes, max_total=None):
+        """
+        :param max_total: Bytes of text after which the rest of the answer is dropped.
+        """
+        self.max_bytes = max_bytes
+        self.max_total = max_total
+        self.total = 0
+        self._buffer = ""
+
+    def feed(self, text):
+        """
+        :return: The segments completed by this text, possibly none.
+        """
+        if self.max_total is not None:
+            room = self.max_total - self.total - len(self._buffer.encode())
+            text = text.encode()[:max(room, 0)].decode(errors='ignore')
+        self._buffer += text
+        segments = []
+        while len(self._buffer.encode()) > self.max_bytes:
+            segment = self._cut()
+            segments.append(segment)
+            self.total += len(segment.encode())
+        return segments
+
+    def finish(self):
+        # The rest of the text, which may be empty; it becomes the final segment
+        segment, self._buffer = self._buffer, ""
+        self.total += len(segment.encode())
+        return segment
+
+    def _cut(self):
+        head = self._buffer.encode()[:self.max_bytes].decode(errors='ignore')
+        for separator in BREAKS:
+            index = head.rfind(separator)
+            # Not so early that the segment would be mostly empty
+            if index >= len(head) // 2:
+                head = head[:index + len(separator)]
+                break
+        self._buffer = self._buffer[len(head):]
+        return head
+
+def gemini_backend(model):
+    # Streaming generation with a google.generativeai model
+    def generate(query):
+        for chunk in model.generate_content(query, stream=True):
+            yield chunk.text
+    return generate
+
+class StubBackend:
+    """
+    Offline stand-in for the LLM, streaming a canned answer a few words at a
+    time at roughly the pace of a real model.
+    """
+    ANSWER = ("The nearest shelter is the high school on Oak Street, about 2 km north of the bridge. "
+              "It has water, food and a first aid station, and is staffed around the clock. "
+              "If the bridge road is flooded, take the east trail past the fire station instead. "
+              "Bring any medication you need for the next three days and keep your phone charged. "
+              "Register with the volunteers at the main entrance so your family can find you.")
+
+    def __init__(self, answer=None, words=4, delay=0.2, first_delay=1.0):
+        """
+        :param words: Words per streamed chunk.
+        :param delay: Seconds between chunks.
+        :param first_delay: Seconds before the first chunk.
+        """
+        self.answer = answer or self.ANSWER
+        self.words = words
+        self.delay = delay
+        self.first_delay = first_delay
+
+    def __call__(self, query):
+        time.sleep(self.first_delay)
+        words = self.answer.split(' ')
+        for i in range(0, len(words), self.words):
+            if i:
+                time.sleep(self.delay)
+            yield ' '.join(words[i:i + self.words]) + (' ' if i + self.words < len(words) else '')
@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from resililink.wire import packet_source
+
+# Deduplication of uplinks heard by several gateways, much like a LoRaWAN
+# network server does it. Every super node publishes what it hears to its
+# own topic, 12458Test/pub/<gateway node ID>, with the frame prefixed by the
+# RSSI and SNR it was received with:
+#
+#   -87,6.5 <frame>
+#
+# The first copy of a packet opens a collection window. Copies from other
+# gateways within the window are merged into it, and when it closes the
+# packet is processed once, as the copy with the best link. Every copy also
+# records that its gateway can reach the packet's source, which is what
+# downlink gateway selection works from. Publishes to the plain
+# 12458Test/pub topic, from gateways that predate this, carry no metadata
+# and are treated as a copy from an unknown gateway.
+
+UPLINK_TOPIC = "12458Test/pub"
+
+def parse_uplink(topic, payload):
+    """
+    :return: (gateway, rssi, snr, frame), with gateway, rssi and snr None when the publish carries none.
+    """
+    if isinstance(payload, bytes):
+        payload = payload.decode()
+    gateway = topic[len(UPLINK_TOPIC) + 1:] if topic.startswith(UPLINK_TOPIC + "/") else None
+    rssi = snr = None
+    head, separator, frame = payload.partition(' ')
+    if separator and ',' in head:
+        # Frame codecs never produce a space, so a prefix is unambiguous
+        rssi, snr = (float(value) for value in head.split(','))
+    else:
+        frame = payload
+    return gateway, rssi, snr, frame
+
+def link_quality(hop_limit, rssi, snr):
+    # Sort key of a copy, higher is better: fewest mesh hops first, then the strongest signal
+    return (hop_limit, snr if snr is not None else float('-inf'), rssi if rssi is not None else float('-inf'))
+
+class UplinkCollector:
+    """
+    Usage::
+
+        collector = UplinkCollector(lambda packet, copy: process(packet)).start()
+        collector.add(gateway, packet, rssi, snr)  # For every copy received
+        collector.gateways("FIXED178")  # Gateways that recently heard the node, best first
+    """
+    def __init__(self, deliver, window=1.5, grace=30, reachability_timeout=900, max_pending=1024, block_timeout=5.0):
+        """
+        :param deliver: Called as deliver(packet, copy) with the best copy of each packet once its window closed,
+            where copy is a dict with 'gateway', 'rssi', 'snr' and 'gateways' (all that heard it).
+        :param window: Seconds copies of a packet are collected before it is processed; covers the
+            spread in latency between gateways' satellite links.
+        :param grace: Seconds after the window during which further copies are dropped as duplicates.
+        :param reachability_timeout: Seconds a gateway counts as reaching a node after last hearing it.
+        :param max_pending: Packets collected or being delivered at once. A new packet beyond that
+            blocks add() until a window closes and its delivery returns.
+        :param block_timeout: Seconds add() waits for room before refusing a packet.
+        """
+        self.deliver = deliver
+        self.window = window
+        self.grace = grace
+        self.reachability_timeout = reachability_timeout
+        self.max_pending = max_pending
+        self.block_timeout = block_timeout
+        self._pending = OrderedDict()  # (source, packet_uuid) -> {'packet', 'copy', 'closes'}, oldest first
+        self._closed = OrderedDict()  # (source, packet_uuid) -> when its window closed
+        self._reachability = {}  # Source node ID -> {gateway: {'rssi', 'snr', 'hop_limit', 'heard'}}
+        self._counts = Counter()
+        self._copies_delivered = 0
+        self._delivering = 0  # Packets taken from _pending whose deliver() has not returned
+        self._lock = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # Processes the packets whose window is still open
+        with self._lock:
+            self._running = False
+            self._lock.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def add(self, gateway, packet, rssi=None, snr=None, now=None):
+        """
+        Record one gateway's copy of a packet.
+
+        The first copy of a packet waits while max_pending packets are
+        already collected or being delivered. When deliver() is slow, the
+        caller (the MQTT thread) therefore stops reading, and later messages
+        stay in the broker and socket buffers instead of piling up here.
+
+        :return: True if this is the packet's first copy, False if it was merged, dropped or
+            refused because there was no room within block_timeout.
+        """
+        now = time.time() if now is None else now
+        source = packet_source(packet)
+        key = (source, packet.packet_uuid)
+        with self._lock:
+            self._counts['copies'] += 1
+            if gateway is not None and source:
+                self._reachability.setdefault(source, {})[gateway] = {
+                    'rssi': rssi, 'snr': snr, 'hop_limit': packet.hop_limit, 'heard': now}
+            pending = self._pending.get(key)
+            if pending is not None:
+                copy = pending['copy']
+                if gateway not in copy['gateways']:
+                    copy['gateways'].append(gateway)
+                self._counts['merged'] += 1
+                if link_quality(packet.hop_limit, rssi, snr) > link_quality(pending['packet'].hop_limit, copy['rssi'], copy['snr']):
+                    pending['packet'] = packet
+                    copy.update(gateway=gateway, rssi=rssi, snr=snr)
+                return False
+            closed = self._closed.get(key)
+            if closed is not None and now - closed <= self.grace:
+                self._counts['late'] += 1
+                return False
+            if not self._has_room():
+                if not self._lock.wait_for(self._has_room, self.block_timeout):
+                    self._counts['refused'] += 1
+                    print(f"Uplink collector full, refused packet {packet.packet_uuid}")
+                    return False
+                # The window opens once the packet got in
+                now = max(now, time.time())
+            self._pending[key] = {
+                'packet': packet,
+                'copy': {'gateway': gateway, 'rssi': rssi, 'snr': snr, 'gateways': [gateway]},
+                'closes': now + self.window,
+            }
+            self._counts['packets'] += 1
+            self._lock.notify_all()
+            return True
+
+    def _has_room(self):
+        return len(self._pending) + self._delivering < self.max_pending or not self._running
+
+    def _run(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                ready = []
+                # Windows close in the order they opened
+                while self._pending:
+                    key, pending = next(iter(self._pending.items()))
+                    if pending['closes'] > now and self._running:
+                        break
+                    del self._pending[key]
+                    self._closed[key] = now
+                    self._copies_delivered += len(pending['copy']['gateways'])
+                    ready.append(pending)
+                self._delivering = len(ready)
+                while self._closed and now - next(iter(self._closed.values())) > self.grace:
+                    self._closed.popitem(last=False)
+                if not ready:
+                    if not self._running:
+                        return
+                    self._lock.wait(next(iter(self._pending.values()))['closes'] - now if self._pending else None)
+                    continue
+            for pending in ready:
+                try:
+                    self.deliver(pending['packet'], pending['copy'])
+                except Exception as e:
+                    print(f"Failed to deliver uplink {pending['packet'].packet_uuid}: {e}")
+                with self._lock:
+                    # Room for a blocked add()
+                    self._delivering -= 1
+                    self._lock.notify_all()
+
+    def gateways(self, node_id, now=None):
+        """
+        :return: [(gateway, {'rssi', 'snr', 'hop_limit', 'heard'})] of the gateways that heard
+            node_id within reachability_timeout, best link first.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            heard = self._reachability.get(node_id, {})
+            for gateway in [gateway for gateway, link in heard.items() if now - link['heard'] > self.reachability_timeout]:
+                del heard[gateway]
+            links = [(gateway, dict(link)) for gateway, link in heard.items()]
+        return sorted(links, key=lambda item: link_quality(item[1]['hop_limit'], item[1]['rssi'], item[1]['snr']), reverse=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['pending'] = len(self._pending)
+            delivered = stats.get('packets', 0) - len(self._pending)
+            stats['copies_per_packet'] = round(self._copies_delivered / delivered, 2) if delivered > 0 else None
+            stats['gateways_per_node'] = {node: sorted(gateways) for node, gateways in self._reachability.items() if gateways}
+        return stats
@@ -0,0 +1,146 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+
+# Task priorities, lower values run first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+class WorkerPool:
+    """
+    Runs the relay's slow work (LLM queries, SMS sends) off the MQTT network
+    thread. Tasks wait in a bounded priority queue and are taken by a fixed
+    set of worker threads. Each backend has its own concurrency limit; a
+    worker skips over tasks whose backend is saturated, so a burst of slow
+    LLM queries cannot hold up SMS or NACK handling.
+
+    When the queue is full, submit() blocks the caller for up to
+    `block_timeout` seconds, or until there is room if it is None. The relay
+    submits from the UplinkCollector thread, which waits without limit: it
+    stops delivering packets, their windows stay pending, and once the
+    collector is full its add() blocks the MQTT thread in turn. That wait is
+    bounded, to stay inside the MQTT keep-alive, but until it runs out later
+    messages stay in the broker and socket buffers instead of being lost.
+    """
+    def __init__(self, workers=4, max_queue=256, limits=None, block_timeout=5.0):
+        """
+        :param workers: Number of worker threads.
+        :param max_queue: Tasks that may wait before submit() blocks.
+        :param limits: Maximum concurrent tasks per backend name, e.g. {"llm": 2, "sms": 4}.
+        :param block_timeout: Seconds submit() waits for room before refusing a task, None to wait until there is room.
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.limits = dict(limits or {})
+        self.block_timeout = block_timeout
+        self._queue = []  # Heap of (priority, order, backend, task, submitted)
+        self._order = itertools.count()  # Keeps FIFO order within a priority
+        self._running_tasks = Counter()  # Backend -> tasks running now
+        self._counts = Counter()
+        self._wait_time = 0.0
+        self._max_depth = 0
+        self._lock = threading.Condition()
+        self._running = False
+        self._threads = []
+
+    def start(self):
+        self._running = True
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        # Lets the workers finish what they are running; queued tasks are discarded
+        with self._lock:
+            self._running = False
+            self._counts['discarded'] += len(self._queue)
+            self._queue.clear()
+            self._lock.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, task, priority=PRIORITY_NORMAL, backend=None):
+        """
+        Queue task() to run on a worker.
+
+        :param backend: Name of the backend the task calls, whose limit applies to it.
+        :return: False if the queue stayed full for block_timeout and the task was refused, or the pool stopped.
+        """
+        with self._lock:
+            if not self._lock.wait_for(lambda: len(self._queue) < self.max_queue or not self._running, self.block_timeout):
+                self._counts['refused'] += 1
+                print(f"Worker queue full, refused a {backend or 'task'} task")
+                return False
+            if len(self._queue) >= self.max_queue:
+                return False  # Stopped
+            heapq.heappush(self._queue, (priority, next(self._order), backend, task, time.monotonic()))
+            self._counts['submitted'] += 1
+            self._max_depth = max(self._max_depth, len(self._queue))
+            self._lock.notify_all()
+        return True
+
+    def _runnable(self, backend):
+        return backend is None or self._running_tasks[backend] < self.limits.get(backend, self.workers)
+
+    def _take(self):
+        # Best queued task whose backend has room, or None
+        skipped = []
+        item = None
+        while self._queue:
+            candidate = heapq.heappop(self._queue)
+            if self._runnable(candidate[2]):
+                item = candidate
+                break
+            skipped.append(candidate)
+        for candidate in skipped:
+            heapq.heappush(self._queue, candidate)
+        return item
+
+    def _run(self):
+        while True:
+            with self._lock:
+                item = None
+                while self._running and item is None:
+                    item = self._take()
+                    if item is None:
+                        self._lock.wait()
+                if item is None:
+                    return
+                _, _, backend, task, submitted = item
+                self._running_tasks[backend] += 1
+                self._wait_time += time.monotonic() - submitted
+                # Room in the queue for a blocked submit()
+                self._lock.notify_all()
+            try:
+                task()
+            except Exception as e:
+                print(f"Task failed: {e}")
+                with self._lock:
+                    self._counts['failed'] += 1
+            finally:
+                with self._lock:
+                    self._running_tasks[backend] -= 1
+                    self._counts['completed'] += 1
+                    # A slot opened for this backend's queued tasks
+                    self._lock.notify_all()
+
+    def stats(self):
+        with self._lock:
+            started = self._counts['submitted'] - len(self._queue) - self._counts['discarded']
+            return {
+                'queued': len(self._queue),
+                'queued_by_priority': dict(Counter(item[0] for item in self._queue)),
+                'max_queued': self._max_depth,
+                'running': {backend or 'other': count for backend, count in self._running_tasks.items() if count},
+                'submitted': self._counts['submitted'],
+                'completed': self._counts['completed'],
+                'failed': self._counts['failed'],
+                'refused': self._counts['refused'],
+                'average_wait': round(self._wait_time / started, 3) if started > 0 else None,
+            }
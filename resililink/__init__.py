@@ -0,0 +1,4 @@
+# Modules shared by the normal nodes, the super nodes and the relay server:
+# the packet format (spec_pb2, spec_v2_pb2, wire), frame codecs, compression,
+# encryption, fragmentation, and the mesh protocol the nodes run. Install it
+# on every device with `pip install -e .` from the repository root.
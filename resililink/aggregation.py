@@ -0,0 +1,156 @@
+import threading
+import uuid
+from concurrent.futures import Future
+
+from . import spec_pb2
+from .wire import serialize_packet, parse_packet
+
+def make_aggregate(payloads, version):
+    """
+    Wrap serialized packets into one serialized AGGREGATE_MESSAGE packet.
+
+    The aggregate is a link-level container: it has no sequence number or
+    hop limit, is never forwarded as a whole and is unpacked on receipt.
+    """
+    packet = spec_pb2.Packet()
+    packet.packet_uuid = uuid.uuid4().hex[:8]
+    packet.packet_type = spec_pb2.AGGREGATE_MESSAGE
+    packet.aggregate_message.packets.extend(payloads)
+    return serialize_packet(packet, version)
+
+def unpack_packet(packet):
+    """
+    :return: The packets carried by an aggregate, or [packet] for any other packet.
+    """
+    if packet.packet_type != spec_pb2.AGGREGATE_MESSAGE:
+        return [packet]
+    return [parse_packet(payload) for payload in packet.aggregate_message.packets]
+
+class FrameAggregator:
+    """
+    Batches packets headed for the same radio address into one frame.
+
+    The first packet queued for an address opens a batch, which is sent
+    `window` seconds later together with everything queued for the address
+    in the meantime, such as ACKs riding along with outgoing data. A batch
+    that is about to overflow the frame is sent at once, and a batch of a
+    single packet goes out as that plain packet.
+    """
+    def __init__(self, transmit, window=0.5, max_payload=193, version=2, margin=24):
+        """
+        :param transmit: Called as transmit(address, serialized_packet, priority) to send one frame.
+            It may return a Future, e.g. from a radio queue, instead of blocking until the frame is
+            on the air; the packets' futures then resolve when it does.
+        :param window: Seconds a packet may wait for company; 0 sends every packet on its own.
+        :param max_payload: Largest serialized packet that fits into a frame.
+        :param version: Wire version for the aggregate packet.
+        :param margin: A batch with less room left than this is sent without waiting.
+        """
+        self.transmit = transmit
+        self.window = window
+        self.max_payload = max_payload
+        self.version = version
+        self.margin = margin
+        self.frames = 0  # Frames transmitted
+        self.packets = 0  # Packets carried by those frames
+        self._batches = {}  # address -> batch dict
+        self._lock = threading.Lock()
+
+    def submit(self, address, payload, priority=0):
+        """
+        Queue a serialized packet for the next frame to address.
+
+        :param priority: Lower is more urgent; a batch is sent with the most urgent priority it holds.
+        :return: A Future resolved with the transmit() result, or the result of the Future it
+            returned, once the frame was sent.
+        """
+        future = Future()
+        if self.window <= 0 or len(payload) > self.max_payload - self.margin:
+            # Nothing to wait for: batching is off, or the packet fills a frame on its own
+            self._send(address, [(payload, future)], priority)
+            return future
+
+        ready = []  # Batches to send once the lock is released
+        with self._lock:
+            batch = self._batches.get(address)
+            if batch is not None and len(self._wrap(batch['items'] + [(payload, future)])) > self.max_payload:
+                # No room left, send what is queued and start over
+                ready.append(self._take(address))
+                batch = None
+            if batch is None:
+                batch = {'items': [], 'priority': priority, 'timer': threading.Timer(self.window, self.flush, args=(address,))}
+                batch['timer'].daemon = True
+                self._batches[address] = batch
+                batch['timer'].start()
+            batch['items'].append((payload, future))
+            batch['priority'] = min(batch['priority'], priority)
+            if len(self._wrap(batch['items'])) > self.max_payload - self.margin:
+                ready.append(self._take(address))
+
+        for batch in ready:
+            self._dispatch(address, batch)
+        return future
+
+    def flush(self, address=None):
+        """
+        Send the batch for address right away, or every batch if address is None.
+        """
+        with self._lock:
+            addresses = list(self._batches) if address is None else [address]
+            batches = [(address, self._take(address)) for address in addresses]
+        for address, batch in batches:
+            if batch is not None:
+                self._dispatch(address, batch)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'frames': self.frames,
+                'packets': self.packets,
+                'waiting': sum(len(batch['items']) for batch in self._batches.values())
+            }
+
+    def _wrap(self, items):
+        if len(items) == 1:
+            return items[0][0]
+        return make_aggregate([payload for payload, _ in items], self.version)
+
+    def _take(self, address):
+        # Must be called with the lock held
+        batch = self._batches.pop(address, None)
+        if batch is not None:
+            batch['timer'].cancel()
+        return batch
+
+    def _dispatch(self, address, batch):
+        self._send(address, batch['items'], batch['priority'])
+
+    def _send(self, address, items, priority):
+        with self._lock:
+            self.frames += 1
+            self.packets += len(items)
+        try:
+            result = self.transmit(address, self._wrap(items), priority)
+        except Exception as e:
+            self._fail(address, items, e)
+            return
+        if isinstance(result, Future):
+            # Queued, not sent yet: resolve the packets' futures from the transmit's,
+            # so neither a batch timer nor the caller waits for the radio
+            result.add_done_callback(lambda sent: self._resolve(address, items, sent))
+            return
+        for _, future in items:
+            future.set_result(result)
+
+    def _resolve(self, address, items, sent):
+        # The Future transmit() returned is done
+        if sent.exception() is not None:
+            self._fail(address, items, sent.exception())
+            return
+        for _, future in items:
+            future.set_result(sent.result())
+
+    def _fail(self, address, items, error):
+        print(f"Error transmitting frame to {address}: {error}")
+        for _, future in items:
+            future.set_exception(error)
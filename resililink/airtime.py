@@ -0,0 +1,113 @@
+import math
+import threading
+import time
+from collections import deque
+
+# AT+PARAMETER bandwidth index -> bandwidth in Hz
+BANDWIDTHS = {7: 125000, 8: 250000, 9: 500000}
+
+def symbol_time(spreading_factor, bandwidth):
+    return (2 ** spreading_factor) / BANDWIDTHS[bandwidth]
+
+def time_on_air(payload_length, spreading_factor=11, bandwidth=9, coding_rate=4, preamble=12, explicit_header=True, crc=True):
+    """
+    Seconds a LoRa frame spends on air (SX126x datasheet, section 6.1.4).
+
+    :param payload_length: Payload size in bytes (the AT+SEND data length).
+    :param spreading_factor: AT+PARAMETER spreading factor (5-11).
+    :param bandwidth: AT+PARAMETER bandwidth index (7: 125 kHz, 8: 250 kHz, 9: 500 kHz).
+    :param coding_rate: AT+PARAMETER coding rate (1-4, meaning 4/5 to 4/8).
+    :param preamble: AT+PARAMETER preamble length in symbols.
+    """
+    t_sym = symbol_time(spreading_factor, bandwidth)
+    header = 1 if explicit_header else 0
+    if spreading_factor < 7:
+        preamble_symbols = preamble + 6.25
+        bits = 8 * payload_length + 16 * crc - 4 * spreading_factor + 20 * header
+        bits_per_symbol = 4 * spreading_factor
+    else:
+        preamble_symbols = preamble + 4.25
+        bits = 8 * payload_length + 16 * crc - 4 * spreading_factor + 8 + 20 * header
+        # Low data rate optimization is used once a symbol exceeds 16 ms
+        low_data_rate = 1 if t_sym > 0.016 else 0
+        bits_per_symbol = 4 * (spreading_factor - 2 * low_data_rate)
+    payload_symbols = 8 + math.ceil(max(bits, 0) / bits_per_symbol) * (coding_rate + 4)
+    return (preamble_symbols + payload_symbols) * t_sym
+
+class AirtimeScheduler:
+    """
+    Paces transmissions against the channel. A frame never starts while the
+    previous one is still on air, and the airtime used inside a sliding
+    window stays within `duty_cycle` of that window.
+    """
+    def __init__(self, spreading_factor=11, bandwidth=9, coding_rate=4, preamble=12, duty_cycle=1.0, window=3600, guard_time=0.02):
+        """
+        :param duty_cycle: Fraction of `window` the node may spend transmitting (1.0 disables the budget).
+        :param window: Length of the sliding budget window in seconds.
+        :param guard_time: Gap left between consecutive frames for the module to turn around.
+        """
+        self.set_parameters(spreading_factor, bandwidth, coding_rate, preamble)
+        self.duty_cycle = duty_cycle
+        self.window = window
+        self.guard_time = guard_time
+        self._history = deque()  # (start, airtime) of frames inside the window
+        self._used = 0.0
+        self._channel_free_at = 0.0
+        self._lock = threading.Lock()
+
+    def set_parameters(self, spreading_factor, bandwidth, coding_rate, preamble):
+        self.parameters = (spreading_factor, bandwidth, coding_rate, preamble)
+
+    def airtime(self, payload_length):
+        return time_on_air(payload_length, *self.parameters)
+
+    def _expire(self, now):
+        while self._history and self._history[0][0] + self.window <= now:
+            self._used -= self._history.popleft()[1]
+
+    def _next_start(self, airtime, now):
+        budget = self.duty_cycle * self.window
+        if airtime > budget:
+            raise ValueError(f"Frame airtime {airtime:.3f}s exceeds the {budget:.3f}s budget")
+        start = max(now, self._channel_free_at)
+        used = self._used
+        # Wait for the oldest frames to leave the window until this one fits
+        for sent_at, sent_airtime in self._history:
+            if used + airtime <= budget:
+                break
+            start = max(start, sent_at + self.window)
+            used -= sent_airtime
+        return start
+
+    def estimate_delivery(self, payload_length):
+        """
+        Seconds from now until a frame of this size would be fully on air.
+        """
+        airtime = self.airtime(payload_length)
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            return self._next_start(airtime, now) - now + airtime
+
+    def reserve(self, payload_length):
+        """
+        Book the next free slot for a frame and sleep until it starts.
+
+        :return: The frame's time on air in seconds.
+        """
+        airtime = self.airtime(payload_length)
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            start = self._next_start(airtime, now)
+            self._history.append((start, airtime))
+            self._used += airtime
+            self._channel_free_at = start + airtime + self.guard_time
+        if start > now:
+            time.sleep(start - now)
+        return airtime
+
+# Example Usage
+if __name__ == "__main__":
+    for length in (16, 64, 128, 240):
+        print(f"{length:3d} bytes @ SF11/500kHz/4/8: {time_on_air(length) * 1000:.1f} ms")
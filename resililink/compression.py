@@ -0,0 +1,144 @@
+import gzip
+import os
+import sys
+import time
+import zlib
+from collections import Counter
+
+# Compression of message text before encryption. Chat and emergency messages
+# are 20-100 bytes, too short for a compressor to find repeats on its own
+# (gzip output is larger than its input there), so raw deflate is primed
+# with a preset dictionary of frequent phrases. Receivers learn from
+# NetworkMessage.flags whether a payload was compressed.
+
+# Set in NetworkMessage.flags when message_content was compressed before encryption
+FLAG_COMPRESSED = 1
+# Longest message text accepted from a compressed payload, as long as the relay's longest answer
+MAX_TEXT = 4096
+
+# Deflate looks for matches nearest the end of the dictionary first, so the
+# most frequent phrases come last. Produced by train_dictionary() from the
+# training split of compression_corpus.txt. Changing it breaks decompression
+# of messages from nodes that still use the old dictionary.
+DICTIONARY = (
+    b"Can Gas all any has not ok? see Send camp down east lost open "
+    b"your Where check later on my phone reach still there trail Need "
+    b"a anyone is the school thanks are you for road is safe at are "
+    b"safe location shelter? supplies I am safe food need road the "
+    b"north everywhere can cell service Please We are center on the "
+    b"we are I am safe station from the near the and help The Need "
+    b"water to the you are at the the "
+)
+
+def compress(data):
+    """
+    Compress message bytes with the preset dictionary.
+
+    :return: (payload, compressed), the input itself when compression does not make it shorter.
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, DICTIONARY)
+    compressed = compressor.compress(data) + compressor.flush()
+    if len(compressed) >= len(data):
+        return data, False
+    return compressed, True
+
+def decompress(data):
+    """
+    :raises ValueError: If data is not valid compressed content, or would decompress to more than MAX_TEXT bytes.
+    """
+    try:
+        decompressor = zlib.decompressobj(-15, zdict=DICTIONARY)
+        # Bounded, so a small forged payload cannot expand to megabytes
+        text = decompressor.decompress(data, MAX_TEXT + 1)
+    except zlib.error as e:
+        raise ValueError(f"Invalid compressed payload: {e}")
+    if decompressor.unconsumed_tail or len(text) > MAX_TEXT:
+        raise ValueError(f"Compressed payload expands beyond {MAX_TEXT} bytes")
+    if not decompressor.eof:
+        raise ValueError("Truncated compressed payload")
+    return text
+
+def split_corpus(samples, holdout=5):
+    """
+    Split sample messages into a training set and a held-out test set of
+    every `holdout`-th message, so a dictionary is judged on messages it
+    was not trained on.
+
+    :return: (training, test)
+    """
+    training = [sample for i, sample in enumerate(samples) if i % holdout != holdout - 1]
+    test = [sample for i, sample in enumerate(samples) if i % holdout == holdout - 1]
+    return training, test
+
+def train_dictionary(samples, size=1024, max_words=4):
+    """
+    Build a preset dictionary from sample messages: the word sequences
+    saving the most bytes (occurrences beyond the first times length),
+    most valuable last.
+    """
+    counts = Counter()
+    for sample in samples:
+        words = sample.split(' ')
+        for n in range(1, max_words + 1):
+            for i in range(len(words) - n + 1):
+                counts[' '.join(words[i:i + n]) + ' '] += 1
+    scored = sorted(((count - 1) * len(phrase), phrase) for phrase, count in counts.items() if count > 1 and len(phrase) > 3)
+    chosen = []
+    total = 0
+    for _, phrase in reversed(scored):
+        if total + len(phrase) > size or any(phrase in other for other in chosen):
+            continue
+        chosen.append(phrase)
+        total += len(phrase)
+    return ''.join(reversed(chosen)).encode()
+
+if __name__ == "__main__":
+    # Benchmark over a corpus with one message per line, on the messages held
+    # out of dictionary training:
+    #   python -m resililink.compression [corpus.txt]
+    #   python -m resililink.compression --train [corpus.txt]   (print a dictionary trained on the corpus' training split)
+    args = sys.argv[1:]
+    train = '--train' in args
+    args = [arg for arg in args if arg != '--train']
+    corpus = args[0] if args else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'compression_corpus.txt')
+    with open(corpus) as f:
+        training, test = split_corpus([line.strip() for line in f if line.strip()])
+
+    if train:
+        print(repr(train_dictionary(training)))
+        sys.exit()
+
+    trained = [sample.encode() for sample in training]
+    trained_ratio = sum(len(compress(message)[0]) for message in trained) / sum(len(message) for message in trained)
+    messages = [sample.encode() for sample in test]
+    original = sum(len(message) for message in messages)
+    print(f"{len(messages)} held-out messages, {original} bytes, {original / len(messages):.1f} bytes on average "
+          f"(dictionary ratio on the {len(trained)} training messages: {trained_ratio:.2f})")
+
+    def deflate(data):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+
+    methods = [
+        ("gzip", lambda data: gzip.compress(data, 9)),
+        ("deflate", deflate),
+        ("deflate+dictionary", lambda data: compress(data)[0]),
+    ]
+    rounds = 20
+    for name, method in methods:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            compressed = [method(message) for message in messages]
+        elapsed = (time.perf_counter() - start) / rounds / len(messages)
+        total = sum(len(data) for data in compressed)
+        print(f"{name:>20}: {total:5d} bytes, ratio {total / original:.2f}, {elapsed * 1e6:6.1f} us per message")
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            payload, compressed = compress(message)
+            if compressed:
+                decompress(payload)
+    elapsed = (time.perf_counter() - start) / rounds / len(messages)
+    print(f"{'round trip':>20}: {elapsed * 1e6:6.1f} us per message (compress + decompress)")
+    print("Timings are for this machine; run the benchmark on a node for Raspberry Pi figures.")
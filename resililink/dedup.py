@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+
+class DuplicateFilter:
+    """
+    Duplicate suppression keyed on (source node, sequence number).
+
+    Every source gets an anti-replay window: the highest sequence number
+    seen plus a bitmap of the `window` numbers below it, so each lookup is
+    O(1). Sequence numbers `window` or more behind the highest one are
+    rejected as replays. A sequence number `resync` or more behind is taken
+    as a source that restarted with its counter reset, such as a node
+    without a clock, and starts a new window. Sources not heard from for
+    `expiry` seconds are dropped, which bounds memory by the number of
+    active neighbours instead of uptime; a source whose counter went back by
+    less than `resync` is accepted again once it expired.
+    Packets without a source or sequence number (legacy senders) fall back
+    to a bounded, time-limited set of packet IDs.
+    """
+    def __init__(self, window=64, expiry=600, max_sources=256, max_packet_ids=1024, resync=1 << 16):
+        """
+        :param window: Number of sequence numbers tracked below the highest one.
+        :param resync: Distance below the highest sequence number from which a source counts as restarted.
+            A replay of a packet that old starts a new window too, so keep it far above the number of
+            packets a source sends between restarts.
+        :param expiry: Seconds after which a silent source or a legacy packet ID is forgotten.
+        :param max_sources: Hard cap on tracked sources; the least recently heard is evicted.
+        :param max_packet_ids: Hard cap on remembered legacy packet IDs.
+        """
+        self.window = window
+        self.expiry = expiry
+        self.max_sources = max_sources
+        self.max_packet_ids = max_packet_ids
+        self.resync = resync
+        self._mask = (1 << window) - 1
+        # Ordered least recently heard first, so expiry only looks at the front
+        self._sources = OrderedDict()  # source -> (highest sequence, bitmap, last heard)
+        self._packet_ids = OrderedDict()  # packet ID -> first heard
+        self._lock = threading.Lock()
+        self.hits = 0  # Duplicates suppressed
+        self.misses = 0  # New packets let through
+        self.resyncs = 0  # Sources whose counter went back by resync or more
+
+    def check(self, source, sequence, packet_id=None, now=None):
+        """
+        Record a packet and report whether it is new.
+
+        :return: True the first time a packet is seen, False for duplicates.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            if source and sequence:
+                new = self._check_sequence(source, sequence, now)
+            else:
+                new = self._check_packet_id(packet_id, now)
+            if new:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return new
+
+    def _check_sequence(self, source, sequence, now):
+        state = self._sources.get(source)
+        new = True
+        if state is None:
+            highest, bitmap = sequence, 1
+        else:
+            highest, bitmap, _ = state
+            if sequence > highest:
+                shift = sequence - highest
+                bitmap = ((bitmap << shift) | 1) & self._mask if shift < self.window else 1
+                highest = sequence
+            elif highest - sequence >= self.resync:
+                # Far behind anything a replay would plausibly carry: the source restarted
+                highest, bitmap = sequence, 1
+                self.resyncs += 1
+            elif highest - sequence >= self.window:
+                # Too old to tell apart from a replay. The source keeps its place and
+                # last-heard time, so one whose counter went back expires in time.
+                return False
+            else:
+                bit = 1 << (highest - sequence)
+                new = not bitmap & bit
+                bitmap |= bit
+        self._sources[source] = (highest, bitmap, now)
+        self._sources.move_to_end(source)
+        if len(self._sources) > self.max_sources:
+            self._sources.popitem(last=False)
+        return new
+
+    def _check_packet_id(self, packet_id, now):
+        if packet_id in self._packet_ids:
+            return False
+        self._packet_ids[packet_id] = now
+        if len(self._packet_ids) > self.max_packet_ids:
+            self._packet_ids.popitem(last=False)
+        return True
+
+    def _expire(self, now):
+        cutoff = now - self.expiry
+        while self._sources and next(iter(self._sources.values()))[2] < cutoff:
+            self._sources.popitem(last=False)
+        while self._packet_ids and next(iter(self._packet_ids.values())) < cutoff:
+            self._packet_ids.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'resyncs': self.resyncs,
+                'sources': len(self._sources),
+                'packet_ids': len(self._packet_ids)
+            }
@@ -0,0 +1,79 @@
+import random
+import threading
+
+class FloodController:
+    """
+    Rebroadcast scheduling for mesh flooding with counter-based suppression.
+
+    A packet to forward is held back for a random delay. Every further copy
+    overheard in the meantime is counted, and if `threshold` copies were heard
+    when the delay runs out the rebroadcast is dropped, since neighbours have
+    already covered the area.
+    """
+    def __init__(self, min_delay=0.2, max_delay=3.0, threshold=3, max_pending=64):
+        """
+        :param min_delay: Shortest rebroadcast delay in seconds.
+        :param max_delay: Longest rebroadcast delay, several frame airtimes so neighbours can be overheard.
+        :param threshold: Copies heard (the first reception included) that cancel the rebroadcast.
+        :param max_pending: Maximum number of rebroadcasts waiting at once.
+        """
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.threshold = threshold
+        self.max_pending = max_pending
+        self.forwarded = 0
+        self.suppressed = 0
+        self._pending = {}  # key -> [copies heard, timer]
+        self._lock = threading.Lock()
+
+    def schedule(self, key, transmit):
+        """
+        Schedule a rebroadcast.
+
+        :param key: Identifies the packet, so later copies can be matched with overheard().
+        :param transmit: Callable sending the rebroadcast; runs on a timer thread.
+        :return: False if the packet is already pending or too many rebroadcasts are waiting.
+        """
+        with self._lock:
+            if key in self._pending or len(self._pending) >= self.max_pending:
+                return False
+            timer = threading.Timer(random.uniform(self.min_delay, self.max_delay), self._expire, args=(key, transmit))
+            timer.daemon = True
+            self._pending[key] = [1, timer]
+        timer.start()
+        return True
+
+    def overheard(self, key):
+        # Count a copy of a packet heard while its rebroadcast is pending
+        with self._lock:
+            if key in self._pending:
+                self._pending[key][0] += 1
+
+    def cancel(self):
+        with self._lock:
+            for _, timer in self._pending.values():
+                timer.cancel()
+            self._pending.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'forwarded': self.forwarded,
+                'suppressed': self.suppressed
+            }
+
+    def _expire(self, key, transmit):
+        with self._lock:
+            copies, _ = self._pending.pop(key, (0, None))
+            if not copies:
+                return
+            if copies >= self.threshold:
+                self.suppressed += 1
+                print(f"Suppressing rebroadcast of {key}, heard {copies} times")
+                return
+            self.forwarded += 1
+        try:
+            transmit()
+        except Exception as e:
+            print(f"Error rebroadcasting {key}: {e}")
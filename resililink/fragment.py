@@ -0,0 +1,298 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from . import spec_pb2
+from .compression import FLAG_COMPRESSED
+from .crypto import FLAG_AEAD, TAG_LENGTH, BLOCK_SIZE
+from .wire import serialize_packet, FLAG_MORE
+
+# Largest number of fragments a packet may be split into
+MAX_FRAGMENTS = 32
+def fragment_size(node_id, destination, max_payload, version):
+    """
+    Largest data slice per fragment, so that every fragment packet of a
+    node still serializes to at most max_payload bytes.
+    """
+    # Worst case header: longest packet ID, index and count, highest hop limit
+    probe = spec_pb2.Packet()
+    probe.packet_uuid = 'ffffffff'
+    probe.packet_type = spec_pb2.FRAGMENT_MESSAGE
+    probe.hop_limit = 255
+    probe.fragment_message.node_id = node_id
+    probe.fragment_message.message_id = 'ffffffff'
+    probe.fragment_message.index = MAX_FRAGMENTS - 1
+    probe.fragment_message.count = MAX_FRAGMENTS
+    probe.fragment_message.destination = destination
+    return _field_room(probe, probe.fragment_message, 'data', max_payload, version)
+
+def segment_size(node_id, destination, max_payload, version, encryption="ccm", max_segments=4096):
+    """
+    Bytes of text per streamed answer segment, so that every segment packet
+    of a node still serializes to at most max_payload bytes when its text
+    does not compress.
+    """
+    # Worst case header: longest IDs and counters, every flag set
+    probe = spec_pb2.Packet()
+    probe.packet_uuid = 'ffffffff'
+    probe.packet_type = spec_pb2.NETWORK_MESSAGE
+    probe.sequence = 0xFFFFFFFF
+    probe.hop_limit = 255
+    probe.network_message.node_id = node_id
+    probe.network_message.timestamp = 0xFFFFFFFF
+    probe.network_message.destination = destination
+    probe.network_message.flags = FLAG_COMPRESSED | FLAG_AEAD | FLAG_MORE
+    probe.network_message.stream_id = 'ffffffff'
+    probe.network_message.segment = max_segments - 1
+    room = _field_room(probe, probe.network_message, 'message_content', max_payload, version)
+    if encryption == "ccm":
+        return room - TAG_LENGTH
+    # CBC: an IV block, and padding of at least one byte
+    return room // BLOCK_SIZE * BLOCK_SIZE - BLOCK_SIZE - 1
+
+def _field_room(probe, message, field, max_payload, version):
+    # Longest bytes value for message.field that keeps the probe within
+    # max_payload. The length prefixes of the field and of the message
+    # around it grow with the value, so shrink a full value until it fits.
+    size = max_payload - len(serialize_packet(probe, version))
+    while size > 0:
+        setattr(message, field, bytes(size))
+        if len(serialize_packet(probe, version)) <= max_payload:
+            break
+        size -= 1
+    setattr(message, field, b'')
+    return max(size, 0)
+
+def split_payload(data, size):
+    """
+    Cut a serialized packet into fragment-sized slices.
+
+    :raises ValueError: If the packet needs more than MAX_FRAGMENTS fragments.
+    """
+    if size <= 0:
+        raise ValueError("Frame too small to carry fragments")
+    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+    if len(chunks) > MAX_FRAGMENTS:
+        raise ValueError(f"Packet of {len(data)} bytes needs more than {MAX_FRAGMENTS} fragments")
+    return chunks
+
+def make_fragments(node_id, message_id, destination, chunks, hop_limit, indices=None):
+    """
+    Build FRAGMENT_MESSAGE packets for the given slices.
+
+    Fragments get a fresh packet ID every time they are built, so resent
+    fragments are not dropped as duplicates by nodes that forwarded the
+    first copies. They carry no sequence number, which keeps them out of
+    the per-source sequence windows of the duplicate filter.
+
+    :param indices: Indexes of the fragments to build, all of them if None.
+    """
+    fragments = []
+    for index in range(len(chunks)) if indices is None else indices:
+        if not 0 <= index < len(chunks):
+            continue
+        packet = spec_pb2.Packet()
+        packet.packet_uuid = uuid.uuid4().hex[:8]
+        packet.packet_type = spec_pb2.FRAGMENT_MESSAGE
+        packet.hop_limit = hop_limit
+        packet.fragment_message.node_id = node_id
+        packet.fragment_message.message_id = message_id
+        packet.fragment_message.index = index
+        packet.fragment_message.count = len(chunks)
+        packet.fragment_message.data = chunks[index]
+        packet.fragment_message.destination = destination
+        fragments.append(packet)
+    return fragments
+
+class Reassembler:
+    """
+    Reassembly buffers for fragmented packets, keyed on (source, message ID).
+
+    Buffers are bounded in number and total size, evicting the oldest
+    first, and dropped `timeout` seconds after their last fragment. A
+    buffer that stalls for `nack_delay` seconds with fragments missing is
+    reported by nacks(), at most `max_nacks` times.
+    """
+    def __init__(self, timeout=60, nack_delay=5, max_nacks=3, max_messages=16, max_bytes=32768):
+        self.timeout = timeout
+        self.nack_delay = nack_delay
+        self.max_nacks = max_nacks
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.completed = 0
+        self.expired = 0
+        self._buffers = OrderedDict()  # (source, message_id) -> buffer dict
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, source, message_id, index, count, data, now=None):
+        """
+        Store a fragment.
+
+        :return: The reassembled serialized packet once the last fragment arrived, None before.
+        """
+        if not 0 < count <= MAX_FRAGMENTS or index >= count:
+            return None
+        now = time.monotonic() if now is None else now
+        key = (source, message_id)
+        with self._lock:
+            self._expire(now)
+            buffer = self._buffers.get(key)
+            if buffer is None or buffer['count'] != count:
+                if buffer is not None:
+                    self._drop(key)
+                buffer = {'count': count, 'fragments': {}, 'updated': now, 'nacks': 0}
+                self._buffers[key] = buffer
+            if index not in buffer['fragments']:
+                buffer['fragments'][index] = data
+                self._bytes += len(data)
+            buffer['updated'] = now
+            self._buffers.move_to_end(key)
+
+            if len(buffer['fragments']) == count:
+                self._drop(key)
+                self.completed += 1
+                return b''.join(buffer['fragments'][i] for i in range(count))
+
+            # Evict the oldest buffers beyond the limits, never the one just filled
+            while len(self._buffers) > 1 and (len(self._buffers) > self.max_messages or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._buffers)))
+                self.expired += 1
+            return None
+
+    def nacks(self, now=None):
+        """
+        :return: (source, message_id, missing indexes) for every stalled buffer due for a NACK.
+        """
+        now = time.monotonic() if now is None else now
+        due = []
+        with self._lock:
+            self._expire(now)
+            for (source, message_id), buffer in self._buffers.items():
+                if buffer['nacks'] >= self.max_nacks or now - buffer['updated'] < self.nack_delay:
+                    continue
+                buffer['nacks'] += 1
+                # Restart the delay, so the sender gets time to answer
+                buffer['updated'] = now
+                missing = [i for i in range(buffer['count']) if i not in buffer['fragments']]
+                due.append((source, message_id, missing))
+        return due
+
+    def stats(self):
+        with self._lock:
+            return {
+                'buffers': len(self._buffers),
+                'bytes': self._bytes,
+                'completed': self.completed,
+                'expired': self.expired
+            }
+
+    def _drop(self, key):
+        buffer = self._buffers.pop(key)
+        self._bytes -= sum(len(data) for data in buffer['fragments'].values())
+
+    def _expire(self, now):
+        for key in [key for key, buffer in self._buffers.items() if now - buffer['updated'] > self.timeout]:
+            self._drop(key)
+            self.expired += 1
+
+class StreamAssembler:
+    """
+    Puts the segments of streamed answers back in order, keyed on (source,
+    stream ID). Segments can arrive out of order, twice, or not at all, as
+    they are flooded with random delays and resent through other gateways.
+    Text is released only as far as the segments are contiguous, and a
+    stream is complete once every segment up to the final one arrived.
+    Streams are dropped `timeout` seconds after their last segment; the
+    most recently completed ones are remembered so late copies of their
+    segments are ignored.
+    """
+    def __init__(self, timeout=300, max_streams=8, max_completed=64):
+        self.timeout = timeout
+        self.max_streams = max_streams
+        self.max_completed = max_completed
+        self.completed = 0
+        self.expired = 0
+        self._streams = OrderedDict()  # (source, stream_id) -> stream dict
+        self._completed = OrderedDict()  # (source, stream_id) -> None
+        self._lock = threading.Lock()
+
+    def add(self, source, stream_id, index, text, final, now=None):
+        """
+        Store a segment.
+
+        :param final: Whether this is the stream's last segment.
+        :return: (text, complete): the text this segment made contiguous, possibly empty,
+            and whether the stream is now complete. None for segments already seen.
+        """
+        now = time.monotonic() if now is None else now
+        key = (source, stream_id)
+        with self._lock:
+            self._expire(now)
+            if key in self._completed:
+                return None
+            stream = self._streams.get(key)
+            if stream is None:
+                stream = {'next': 0, 'segments': {}, 'final': None, 'updated': now}
+                self._streams[key] = stream
+            if index < stream['next'] or index in stream['segments']:
+                return None
+            stream['segments'][index] = text
+            if final:
+                stream['final'] = index
+            stream['updated'] = now
+            self._streams.move_to_end(key)
+
+            released = []
+            while stream['next'] in stream['segments']:
+                released.append(stream['segments'].pop(stream['next']))
+                stream['next'] += 1
+            complete = stream['final'] is not None and stream['next'] > stream['final']
+            if complete:
+                del self._streams[key]
+                self._completed[key] = None
+                if len(self._completed) > self.max_completed:
+                    self._completed.popitem(last=False)
+                self.completed += 1
+            # Evict the oldest streams beyond the limit, never the one just added to
+            while len(self._streams) > self.max_streams:
+                self._streams.popitem(last=False)
+                self.expired += 1
+            return ''.join(released), complete
+
+    def stats(self):
+        with self._lock:
+            return {
+                'streams': len(self._streams),
+                'completed': self.completed,
+                'expired': self.expired
+            }
+
+    def _expire(self, now):
+        for key in [key for key, stream in self._streams.items() if now - stream['updated'] > self.timeout]:
+            del self._streams[key]
+            self.expired += 1
+
+class FragmentCache:
+    """
+    Slices of recently fragmented packets, kept to answer NACKs.
+    """
+    def __init__(self, max_messages=16):
+        self.max_messages = max_messages
+        self._messages = OrderedDict()  # message_id -> (chunks, destination)
+        self._lock = threading.Lock()
+
+    def put(self, message_id, chunks, destination):
+        with self._lock:
+            self._messages[message_id] = (chunks, destination)
+            self._messages.move_to_end(message_id)
+            if len(self._messages) > self.max_messages:
+                self._messages.popitem(last=False)
+
+    def get(self, message_id):
+        """
+        :return: (chunks, destination), or None if the packet is no longer cached.
+        """
+        with self._lock:
+            return self._messages.get(message_id)
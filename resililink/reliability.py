@@ -0,0 +1,193 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+class ReliableSender:
+    """
+    Retransmits packets until they are acknowledged.
+
+    Every packet gets a retransmission timer with jitter; the timers live
+    in a heap served by a single thread, which also performs every
+    transmission. At most `window` packets per destination are in flight,
+    later ones wait in a per-destination backlog. Each destination has its
+    own timeout, following the RTT measured from its ACKs (RFC 6298, using
+    Karn's rule of ignoring retransmitted packets). A timeout doubles the
+    destination's timeout, which stays backed off until a fresh RTT sample.
+    """
+    def __init__(self, window=4, max_retries=5, initial_rto=3.0, min_rto=1.0, max_rto=60.0, jitter=0.25, on_give_up=None):
+        """
+        :param window: Maximum unacknowledged packets per destination.
+        :param max_retries: Retransmissions before giving up on a packet.
+        :param initial_rto: Retransmission timeout of a destination until its first RTT sample.
+        :param jitter: Random +/- fraction applied to every timeout, so nodes do not retry in lockstep.
+        :param on_give_up: Called with (packet_id, destination) when a packet exhausts its retries.
+        """
+        self.window = window
+        self.max_retries = max_retries
+        self.initial_rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.jitter = jitter
+        self.on_give_up = on_give_up
+        self._rtt = {}  # destination -> {'srtt', 'rttvar', 'rto'}
+        self._in_flight = {}  # packet_id -> state dict
+        self._backlog = {}  # destination -> deque of (packet_id, transmit)
+        self._timers = []  # heap of (deadline, order, packet_id, attempt)
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def send(self, destination, packet_id, transmit):
+        """
+        Queue a packet for reliable delivery.
+
+        :param destination: Key the in-flight window and RTT are counted against.
+        :param packet_id: ID the receiver's ACK will carry.
+        :param transmit: Callable sending one copy of the packet; runs on the sender thread. If the packet
+            is only queued for the radio, it returns a Future resolved once it is on the air, and the
+            packet's timer starts from then.
+        """
+        with self._condition:
+            self._backlog.setdefault(destination, deque()).append((packet_id, transmit))
+            self._admit(destination, time.monotonic())
+            self._condition.notify()
+
+    def ack(self, packet_id):
+        """
+        Record an ACK.
+
+        :return: True if the packet was in flight, False for unknown or late ACKs.
+        """
+        with self._condition:
+            state = self._in_flight.pop(packet_id, None)
+            if state is None:
+                return False
+            if state['attempts'] == 1 and state['sent_at'] is not None:
+                self._update_rtt(state['destination'], time.monotonic() - state['sent_at'])
+            self._admit(state['destination'], time.monotonic())
+            self._condition.notify()
+            return True
+
+    def in_flight(self, destination=None):
+        with self._condition:
+            return sum(1 for state in self._in_flight.values() if destination in (None, state['destination']))
+
+    def rto(self, destination):
+        # Current retransmission timeout towards a destination, before jitter
+        with self._condition:
+            return self._link(destination)['rto']
+
+    def _link(self, destination):
+        return self._rtt.setdefault(destination, {'srtt': None, 'rttvar': None, 'rto': self.initial_rto})
+
+    def _update_rtt(self, destination, rtt):
+        link = self._link(destination)
+        if link['srtt'] is None:
+            link['srtt'] = rtt
+            link['rttvar'] = rtt / 2
+        else:
+            link['rttvar'] = 0.75 * link['rttvar'] + 0.25 * abs(link['srtt'] - rtt)
+            link['srtt'] = 0.875 * link['srtt'] + 0.125 * rtt
+        # A fresh sample also ends any backoff
+        link['rto'] = min(max(link['srtt'] + 4 * link['rttvar'], self.min_rto), self.max_rto)
+
+    def _back_off(self, state):
+        # Double the destination's timeout after a packet's timer expired. Packets
+        # timing out together, sent with the same timeout, double it only once.
+        link = self._link(state['destination'])
+        link['rto'] = max(link['rto'], min(state['rto'] * 2, self.max_rto))
+
+    def _admit(self, destination, now):
+        # Move backlog packets into flight while the destination's window has room
+        backlog = self._backlog.get(destination)
+        in_flight = sum(1 for state in self._in_flight.values() if state['destination'] == destination)
+        while backlog and in_flight < self.window:
+            packet_id, transmit = backlog.popleft()
+            self._in_flight[packet_id] = {
+                'destination': destination,
+                'transmit': transmit,
+                'attempts': 0,
+                'sent_at': None,
+                'rto': None
+            }
+            heapq.heappush(self._timers, (now, next(self._order), packet_id, 0))
+            in_flight += 1
+        if not backlog:
+            self._backlog.pop(destination, None)
+
+    def _sent(self, packet_id, state, attempt):
+        # The copy is on the air: start its timer
+        with self._condition:
+            if self._in_flight.get(packet_id) is not state or state['attempts'] != attempt:
+                return  # Acknowledged already, or the packet was given up on
+            state['sent_at'] = time.monotonic()
+            state['rto'] = self._link(state['destination'])['rto']
+            timeout = min(state['rto'] * random.uniform(1 - self.jitter, 1 + self.jitter), self.max_rto)
+            heapq.heappush(self._timers, (state['sent_at'] + timeout, next(self._order), packet_id, attempt))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and (not self._timers or self._timers[0][0] > time.monotonic()):
+                    self._condition.wait(self._timers[0][0] - time.monotonic() if self._timers else None)
+                if not self._running:
+                    return
+                _, _, packet_id, attempt = heapq.heappop(self._timers)
+                state = self._in_flight.get(packet_id)
+                # Timers of acknowledged packets are discarded lazily
+                if state is None or state['attempts'] != attempt:
+                    continue
+                if attempt:
+                    self._back_off(state)
+                if attempt > self.max_retries:
+                    del self._in_flight[packet_id]
+                    self._admit(state['destination'], time.monotonic())
+                    give_up = True
+                else:
+                    state['attempts'] += 1
+                    state['sent_at'] = None
+                    give_up = False
+
+            if give_up:
+                print(f"Giving up on packet {packet_id} after {attempt} attempts")
+                if self.on_give_up:
+                    self.on_give_up(packet_id, state['destination'])
+                continue
+
+            if attempt:
+                print(f"Retransmitting packet {packet_id} (attempt {attempt + 1})")
+            try:
+                sent = state['transmit']()
+            except Exception as e:
+                print(f"Error transmitting packet {packet_id}: {e}")
+                sent = None
+
+            attempts = attempt + 1
+            if isinstance(sent, Future):
+                # Still queued for the radio, e.g. in a FrameAggregator
+                sent.add_done_callback(lambda _, packet_id=packet_id, state=state, attempts=attempts:
+                                       self._sent(packet_id, state, attempts))
+            else:
+                self._sent(packet_id, state, attempts)
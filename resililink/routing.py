@@ -0,0 +1,105 @@
+import threading
+import time
+
+# Demodulation SNR limit per spreading factor (dB), from the SX126x datasheet
+SNR_LIMITS = {7: -7.5, 8: -10.0, 9: -12.5, 10: -15.0, 11: -17.5, 12: -20.0}
+
+# Cost of one hop over a link with a comfortable margin. Route costs travel
+# in AnnounceMessage.route_cost as integers in these units.
+HOP_COST = 10
+# Margin (dB) above which a link counts as fully reliable
+GOOD_MARGIN = 10.0
+# Extra cost of a link at the sensitivity limit, in hops
+WEAK_LINK_PENALTY = 3
+
+def link_cost(rssi, snr, spreading_factor=11, rssi_floor=-120):
+    """
+    Cost of a link given the RSSI (dBm) and SNR (dB) a frame arrived with.
+
+    :return: HOP_COST for a strong link, rising to (1 + WEAK_LINK_PENALTY) * HOP_COST at the sensitivity limit.
+    """
+    margin = min(snr - SNR_LIMITS.get(spreading_factor, -17.5), rssi - rssi_floor)
+    shortfall = GOOD_MARGIN - min(max(margin, 0.0), GOOD_MARGIN)
+    return HOP_COST + round(shortfall / GOOD_MARGIN * WEAK_LINK_PENALTY * HOP_COST)
+
+class RoutingTable:
+    """
+    Distance-vector routes learned from ANNOUNCE packets.
+
+    Every ANNOUNCE carries the cost of the path it travelled so far. A node
+    adds the cost of the link it heard the packet on and keeps, per
+    announcing node, the neighbour address with the cheapest total. Link
+    costs are smoothed per neighbour, so one lucky frame does not flip a
+    route, and routes expire when they are not refreshed.
+    """
+    def __init__(self, spreading_factor=11, route_timeout=900, max_routes=256, smoothing=0.25):
+        """
+        :param spreading_factor: Spreading factor in use, which sets the SNR limit of a link.
+        :param route_timeout: Seconds a route stays valid without a fresh ANNOUNCE.
+        :param max_routes: Maximum number of destinations kept; the stalest route is evicted first.
+        :param smoothing: Weight of a new sample in the per-neighbour link cost average.
+        """
+        self.spreading_factor = spreading_factor
+        self.route_timeout = route_timeout
+        self.max_routes = max_routes
+        self.smoothing = smoothing
+        self._links = {}  # neighbour address -> smoothed link cost
+        self._routes = {}  # node ID -> {'next_hop', 'cost', 'expires'}
+        self._lock = threading.Lock()
+
+    def heard(self, address, rssi, snr):
+        """
+        Record a frame received directly from a neighbour.
+
+        :return: The neighbour's smoothed link cost.
+        """
+        cost = link_cost(rssi, snr, self.spreading_factor)
+        with self._lock:
+            previous = self._links.get(address)
+            if previous is not None:
+                cost = previous + self.smoothing * (cost - previous)
+            self._links[address] = cost
+            return cost
+
+    def update(self, node_id, next_hop, advertised_cost, now=None):
+        """
+        Offer a route to node_id through the neighbour at address next_hop.
+
+        heard() must have been called for the frame that carried the offer.
+
+        :param advertised_cost: Path cost from next_hop to node_id, as carried in the ANNOUNCE.
+        :return: The total cost of the offered route, to advertise when forwarding the ANNOUNCE.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            cost = advertised_cost + round(self._links.get(next_hop, HOP_COST))
+            route = self._routes.get(node_id)
+            # A route is replaced by a cheaper one, or refreshed by news from the same neighbour
+            if route is None or route['expires'] < now or cost < route['cost'] or route['next_hop'] == next_hop:
+                self._routes[node_id] = {'next_hop': next_hop, 'cost': cost, 'expires': now + self.route_timeout}
+                if len(self._routes) > self.max_routes:
+                    stalest = min(self._routes, key=lambda key: self._routes[key]['expires'])
+                    del self._routes[stalest]
+            return cost
+
+    def next_hop(self, node_id, now=None):
+        """
+        :return: The neighbour address to unicast packets for node_id to, or None without a valid route.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            route = self._routes.get(node_id)
+            if route is None:
+                return None
+            if route['expires'] < now:
+                del self._routes[node_id]
+                return None
+            return route['next_hop']
+
+    def routes(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            return {
+                node_id: {'next_hop': route['next_hop'], 'cost': route['cost']}
+                for node_id, route in self._routes.items() if route['expires'] >= now
+            }
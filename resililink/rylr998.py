@@ -0,0 +1,328 @@
+import asyncio
+import queue
+import serial
+import threading
+import time
+
+def parse_rcv(line):
+    # Parse +RCV=<Address>,<Length>,<Data>,<RSSI>,<SNR> into a frame dict
+    parts = line[5:].strip().split(',')
+    if len(parts) < 5:
+        return None
+    try:
+        return {
+            'address': int(parts[0]),
+            'length': int(parts[1]),
+            'data': parts[2],
+            'rssi': int(parts[3]),
+            'snr': float(parts[4])
+        }
+    except ValueError:
+        return None
+
+# Commands after which the module restarts: it answers +<NAME>, then +READY
+# once it is up again
+RESTART_COMMANDS = ("RESET", "FACTORY")
+
+def command_name(command):
+    # AT+ADDRESS=120 and AT+ADDRESS? -> ADDRESS; plain AT -> ""
+    return command[3:].split('=', 1)[0].rstrip('?') if command.startswith("AT+") else ""
+
+def reply_belongs(name, line):
+    # Whether a line the module sent is part of the reply to command `name`
+    if line == "+OK" or line.startswith("+ERR="):
+        return True
+    if name in RESTART_COMMANDS and line == "+READY":
+        return True
+    return bool(name) and (line == f"+{name}" or line.startswith(f"+{name}="))
+
+def reply_complete(name, line):
+    # Whether a line that belongs to the reply is its last one
+    if line.startswith("+ERR="):
+        return True
+    if name in RESTART_COMMANDS:
+        return line == "+READY"
+    return line == "+OK" or line.startswith(f"+{name}=")
+
+class RYLR998:
+    def __init__(self, port, baudrate=115200, timeout=1, scheduler=None, ser=None):
+        # An already open serial-like object, such as a simulator.py endpoint, replaces the port
+        self.ser = ser if ser is not None else serial.Serial(port, baudrate, timeout=timeout)
+        self.timeout = timeout
+        # Optional airtime.AirtimeScheduler pacing AT+SEND against the channel
+        self.scheduler = scheduler
+        # Frames received over the air, filled by the reader thread
+        self.frames = queue.Queue()
+        # The module answers one AT command at a time, so commands are
+        # serialized and the reader hands the pending one the lines of its
+        # reply. A command that timed out stays pending until its reply
+        # arrives, so that reply is dropped instead of taken for the next one.
+        self._command_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = None
+        self._running = True
+        self._reader = threading.Thread(target=self._read_loop)
+        self._reader.daemon = True
+        self._reader.start()
+        time.sleep(2)  # Allow time for the module to initialize
+
+    def _read_loop(self):
+        buffer = b''
+        while self._running:
+            try:
+                buffer += self.ser.readline()
+            except (serial.SerialException, OSError, TypeError):
+                break  # Port was closed
+            # readline() returns a partial line when it times out mid-line
+            if not buffer.endswith(b'\n'):
+                continue
+            line = buffer.decode('utf-8', errors='replace').strip()
+            buffer = b''
+            if line:
+                self._dispatch(line)
+
+    def _dispatch(self, line):
+        if line.startswith("+RCV="):
+            print(line)
+            frame = parse_rcv(line)
+            if frame:
+                self.frames.put(frame)
+            return
+        with self._pending_lock:
+            pending = self._pending
+            if pending is None or not reply_belongs(pending['name'], line):
+                print(f"Unsolicited: {line}")
+                return
+            # +OK, +ERR=<n>, a query reply such as +ADDRESS=<n>, or +RESET then +READY
+            if pending['late']:
+                print(f"Late reply to {pending['command']}: {line}")
+            else:
+                pending['response'].append(line)
+            if reply_complete(pending['name'], line):
+                self._pending = None
+                pending['done'].set()
+
+    def send_command(self, command, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        with self._command_lock:
+            late = self._pending
+            if late is not None:
+                # The previous command timed out; give its reply a last chance to arrive
+                late['done'].wait(timeout)
+            pending = {'command': command, 'name': command_name(command), 'response': [],
+                       'done': threading.Event(), 'late': False}
+            with self._pending_lock:
+                self._pending = pending
+            full_command = f"{command}\r\n"
+            self.ser.write(full_command.encode())
+            if not pending['done'].wait(timeout):
+                with self._pending_lock:
+                    if not pending['done'].is_set():
+                        pending['late'] = True
+                        pending['response'] = []
+        return pending['response'] if pending['response'] else None
+
+    def reset(self):
+        return self.send_command("AT+RESET")
+
+    def set_address(self, address):
+        return self.send_command(f"AT+ADDRESS={address}")
+
+    def get_address(self):
+        return self.send_command("AT+ADDRESS?")
+
+    def set_network_id(self, network_id):
+        return self.send_command(f"AT+NETWORKID={network_id}")
+
+    def get_network_id(self):
+        return self.send_command("AT+NETWORKID?")
+    
+    def get_band(self):
+        return self.send_command(f"AT+BAND?")
+    
+    def set_band(self, band):
+        return self.send_command(f"AT+BAND={band}")
+
+    def set_rf_parameters(self, spreading_factor, bandwidth, coding_rate, preamble):
+        if self.scheduler:
+            self.scheduler.set_parameters(spreading_factor, bandwidth, coding_rate, preamble)
+        return self.send_command(f"AT+PARAMETER={spreading_factor},{bandwidth},{coding_rate},{preamble}")
+
+    def send_data(self, address, data):
+        length = len(data)
+        if self.scheduler:
+            # Wait for the channel and the airtime budget
+            self.scheduler.reserve(length)
+        response = self.send_command(f"AT+SEND={address},{length},{data}")
+        print(f"Sent Data: {data}({length})\nResponse:{response}")
+        if response and "+OK" in response:
+            return response
+        return None
+
+    def receive_data(self, timeout=None):
+        # Drain every frame the reader thread has queued, optionally
+        # waiting up to `timeout` seconds for the first one
+        received_data = []
+        try:
+            if timeout:
+                received_data.append(self.frames.get(timeout=timeout))
+            else:
+                received_data.append(self.frames.get_nowait())
+            while True:
+                received_data.append(self.frames.get_nowait())
+        except queue.Empty:
+            pass
+
+        return received_data if received_data else None
+
+    def get_uid(self):
+        return self.send_command("AT+UID?")
+
+    def get_version(self):
+        return self.send_command("AT+VER?")
+
+    def set_baud_rate(self, baudrate):
+        return self.send_command(f"AT+IPR={baudrate}")
+
+    def close(self):
+        self._running = False
+        if self.ser.is_open:
+            self.ser.close()
+        self._reader.join(timeout=self.timeout + 1)
+
+class AsyncRYLR998:
+    """
+    asyncio counterpart of RYLR998. The serial file descriptor is registered
+    with the running event loop, so replies and +RCV frames are handled as
+    soon as the UART has data instead of by a polling thread.
+
+    Usage::
+
+        lora = await AsyncRYLR998('/dev/ttyAMA0').open()
+        await lora.send(0, "HELLO")
+        async for frame in lora.receive():
+            print(frame['data'], frame['rssi'])
+    """
+    def __init__(self, port, baudrate=115200, timeout=1):
+        # Non-blocking reads; the event loop tells us when data is waiting
+        self.ser = serial.Serial(port, baudrate, timeout=0)
+        self.timeout = timeout
+        self.frames = asyncio.Queue()
+        self._buffer = b''
+        self._command_lock = asyncio.Lock()
+        self._pending = None  # As in RYLR998, with a Future for 'done'
+        self._loop = None
+
+    async def open(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self.ser.fileno(), self._on_readable)
+        await asyncio.sleep(2)  # Allow time for the module to initialize
+        return self
+
+    def _on_readable(self):
+        try:
+            self._buffer += self.ser.read(self.ser.in_waiting or 1)
+        except (serial.SerialException, OSError):
+            self._loop.remove_reader(self.ser.fileno())
+            return
+        while b'\n' in self._buffer:
+            raw, self._buffer = self._buffer.split(b'\n', 1)
+            line = raw.decode('utf-8', errors='replace').strip()
+            if line:
+                self._dispatch(line)
+
+    def _dispatch(self, line):
+        if line.startswith("+RCV="):
+            frame = parse_rcv(line)
+            if frame:
+                self.frames.put_nowait(frame)
+            return
+        pending = self._pending
+        if pending is None or not reply_belongs(pending['name'], line):
+            print(f"Unsolicited: {line}")
+            return
+        if pending['late']:
+            print(f"Late reply to {pending['command']}: {line}")
+        else:
+            pending['response'].append(line)
+        if reply_complete(pending['name'], line):
+            self._pending = None
+            pending['done'].set_result(None)
+
+    async def send_command(self, command, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        async with self._command_lock:
+            late = self._pending
+            if late is not None:
+                # The previous command timed out; give its reply a last chance to arrive
+                await asyncio.wait([late['done']], timeout=timeout)
+            pending = {'command': command, 'name': command_name(command), 'response': [],
+                       'done': self._loop.create_future(), 'late': False}
+            self._pending = pending
+            self.ser.write(f"{command}\r\n".encode())
+            try:
+                await asyncio.wait_for(asyncio.shield(pending['done']), timeout)
+            except asyncio.TimeoutError:
+                pending['late'] = True
+                return None
+            return pending['response']
+
+    async def reset(self):
+        return await self.send_command("AT+RESET")
+
+    async def set_address(self, address):
+        return await self.send_command(f"AT+ADDRESS={address}")
+
+    async def set_network_id(self, network_id):
+        return await self.send_command(f"AT+NETWORKID={network_id}")
+
+    async def set_band(self, band):
+        return await self.send_command(f"AT+BAND={band}")
+
+    async def set_rf_parameters(self, spreading_factor, bandwidth, coding_rate, preamble):
+        return await self.send_command(f"AT+PARAMETER={spreading_factor},{bandwidth},{coding_rate},{preamble}")
+
+    async def send(self, address, data):
+        length = len(data)
+        response = await self.send_command(f"AT+SEND={address},{length},{data}")
+        if response and "+OK" in response:
+            return response
+        return None
+
+    async def receive(self):
+        # Yield +RCV frames as they arrive, in the same format as receive_data
+        while True:
+            yield await self.frames.get()
+
+    def close(self):
+        if self._loop is not None and self.ser.is_open:
+            self._loop.remove_reader(self.ser.fileno())
+        if self.ser.is_open:
+            self.ser.close()
+
+# Example Usage
+if __name__ == "__main__":
+    lora = RYLR998(port='/dev/ttyAMA0')  # Replace with the appropriate port
+    print(lora.reset())
+    print(lora.set_address(120))
+    print(lora.get_address())
+    print(lora.set_network_id(6))
+    print(lora.get_network_id())
+    
+    print(lora.send_data(0, "HELLO"))
+    
+    print("Waiting for data...")
+    for _ in range(10):  # Try to receive data for 10 seconds
+        received = lora.receive_data()
+        if received:
+            for item in received:
+                if 'data' in item:
+                    print(f"Received: Address={item['address']}, Length={item['length']}, "
+                          f"Data={item['data']}, RSSI={item['rssi']}, SNR={item['snr']}")
+                else:
+                    print(f"Other response: {item['other']}")
+        time.sleep(1)
+
+    print(lora.get_uid())
+    print(lora.get_version())
+    lora.close()
\ No newline at end of file
@@ -0,0 +1,479 @@
+import heapq
+import math
+import os
+import random
+import selectors
+import sys
+import threading
+import time
+import tty
+from collections import Counter
+
+from .airtime import BANDWIDTHS, time_on_air
+from .routing import SNR_LIMITS
+
+# In-process LoRa channel for exercising the nodes without radios. Every
+# simulated RYLR998 is reached through a virtual serial endpoint, either a
+# file-like object that RYLR998(ser=...) accepts in place of serial.Serial or
+# a pty that anything opening a serial port can use. The modems speak the AT
+# dialect of the real module and share one channel that models time on air,
+# path loss, collisions with the capture effect, and half-duplex radios.
+
+FRAME_SIZE = 240  # Largest AT+SEND payload the RYLR998 accepts
+NOISE_FIGURE = 6  # Receiver noise figure in dB
+CAPTURE_THRESHOLD = 6.0  # dB a frame must exceed the interference by to survive it
+
+# +ERR codes of the RYLR998
+ERR_NO_ENTER = 1
+ERR_NO_AT = 2
+ERR_UNKNOWN_COMMAND = 4
+ERR_LENGTH_MISMATCH = 5
+ERR_TOO_LONG = 13
+ERR_TX_BUSY = 17
+ERR_PARAMETER = 18
+
+class VirtualSerial:
+    """
+    The host side of a simulated module's UART, with the subset of the
+    serial.Serial interface that RYLR998 uses.
+    """
+    def __init__(self, modem, timeout=1):
+        self.modem = modem
+        self.timeout = timeout
+        self.is_open = True
+        self._buffer = bytearray()
+        self._incoming = bytearray()
+        self._ready = threading.Condition()
+
+    def write(self, data):
+        if not self.is_open:
+            raise OSError("Port is closed")
+        # Commands are handled as soon as their line is complete
+        self._incoming += data
+        while b'\n' in self._incoming:
+            line, _, rest = bytes(self._incoming).partition(b'\n')
+            self._incoming = bytearray(rest)
+            self.modem.command(line + b'\n')
+        return len(data)
+
+    def feed(self, data):
+        # Output of the module towards the host
+        with self._ready:
+            self._buffer += data
+            self._ready.notify_all()
+
+    def readline(self):
+        with self._ready:
+            self._ready.wait_for(lambda: b'\n' in self._buffer or not self.is_open, self.timeout)
+            if not self.is_open:
+                raise OSError("Port is closed")
+            end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+            line = bytes(self._buffer[:end])
+            del self._buffer[:end]
+            return line
+
+    def read(self, size=1):
+        with self._ready:
+            self._ready.wait_for(lambda: self._buffer or not self.is_open, self.timeout)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+
+    @property
+    def in_waiting(self):
+        return len(self._buffer)
+
+    def close(self):
+        with self._ready:
+            self.is_open = False
+            self._ready.notify_all()
+
+class PtyEndpoint:
+    # A simulated module's UART on a pty; the slave device path is the port
+    def __init__(self, modem):
+        self.modem = modem
+        self.master, slave = os.openpty()
+        # Raw mode, so the tty layer neither echoes commands nor rewrites line endings
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave
+        self._incoming = b''
+
+    def on_readable(self):
+        try:
+            data = os.read(self.master, 4096)
+        except OSError:
+            return
+        self._incoming += data
+        while b'\n' in self._incoming:
+            line, self._incoming = self._incoming.split(b'\n', 1)
+            self.modem.command(line + b'\n')
+
+    def feed(self, data):
+        try:
+            os.write(self.master, data)
+        except OSError:
+            pass  # Nobody has the port open
+
+    def close(self):
+        os.close(self.master)
+        os.close(self._slave)
+
+class Modem:
+    """
+    One simulated RYLR998: its settings, its AT command interpreter, and its
+    place in the channel.
+    """
+    def __init__(self, channel, position, address=0, network_id=18, band=915000000, tx_power=22):
+        self.channel = channel
+        self.position = position
+        self.address = address
+        self.network_id = network_id
+        self.band = band
+        self.tx_power = tx_power
+        self.parameters = (9, 7, 1, 12)  # Factory AT+PARAMETER
+        self.uid = '%024X' % channel.random.getrandbits(96)
+        self.endpoint = None
+        self.transmitting_until = 0.0
+
+    def reply(self, line):
+        if self.endpoint is not None:
+            self.endpoint.feed(f"{line}\r\n".encode())
+
+    def command(self, raw):
+        if not raw.endswith(b'\r\n'):
+            return self.reply(f"+ERR={ERR_NO_ENTER}")
+        line = raw[:-2].decode('utf-8', errors='replace')
+        if not line.startswith("AT"):
+            return self.reply(f"+ERR={ERR_NO_AT}")
+        name, _, value = line[2:].partition('=')
+        handler = getattr(self, f"_at_{name.lstrip('+').rstrip('?').lower()}", None) if name else self._at_test
+        if handler is None:
+            return self.reply(f"+ERR={ERR_UNKNOWN_COMMAND}")
+        try:
+            self.reply(handler(value if '=' in line else None, name.endswith('?')))
+        except (ValueError, TypeError, AttributeError):
+            # Malformed or out-of-range value
+            self.reply(f"+ERR={ERR_PARAMETER}")
+
+    def _at_test(self, value, query):
+        return "+OK"
+
+    def _at_reset(self, value, query):
+        self.reply("+RESET")
+        return "+READY"
+
+    def _at_address(self, value, query):
+        if query:
+            return f"+ADDRESS={self.address}"
+        address = int(value)
+        if not 0 <= address <= 65535:
+            raise ValueError(address)
+        self.address = address
+        return "+OK"
+
+    def _at_networkid(self, value, query):
+        if query:
+            return f"+NETWORKID={self.network_id}"
+        network_id = int(value)
+        if not (3 <= network_id <= 15 or network_id == 18):
+            raise ValueError(network_id)
+        self.network_id = network_id
+        return "+OK"
+
+    def _at_band(self, value, query):
+        if query:
+            return f"+BAND={self.band}"
+        self.band = int(value)
+        return "+OK"
+
+    def _at_crfop(self, value, query):
+        if query:
+            return f"+CRFOP={self.tx_power}"
+        tx_power = int(value)
+        if not 0 <= tx_power <= 22:
+            raise ValueError(tx_power)
+        self.tx_power = tx_power
+        return "+OK"
+
+    def _at_parameter(self, value, query):
+        if query:
+            return f"+PARAMETER={','.join(map(str, self.parameters))}"
+        spreading_factor, bandwidth, coding_rate, preamble = (int(part) for part in value.split(','))
+        if not (5 <= spreading_factor <= 11 and bandwidth in BANDWIDTHS and 1 <= coding_rate <= 4 and 4 <= preamble <= 24):
+            raise ValueError(value)
+        self.parameters = (spreading_factor, bandwidth, coding_rate, preamble)
+        return "+OK"
+
+    def _at_ipr(self, value, query):
+        return "+IPR=115200" if query else "+OK"
+
+    def _at_uid(self, value, query):
+        return f"+UID={self.uid}"
+
+    def _at_ver(self, value, query):
+        return "+VER=RYLR998 simulator"
+
+    def _at_send(self, value, query):
+        address, length, data = value.split(',', 2)
+        if int(length) != len(data.encode()):
+            return f"+ERR={ERR_LENGTH_MISMATCH}"
+        if int(length) > FRAME_SIZE:
+            return f"+ERR={ERR_TOO_LONG}"
+        if not self.channel.transmit(self, int(address), data):
+            return f"+ERR={ERR_TX_BUSY}"
+        return "+OK"
+
+class Channel:
+    """
+    The shared medium. A frame reaches a module on the same band, network ID
+    and RF parameters when its signal clears the noise floor by the demodulator's
+    SNR limit for the spreading factor, the module was not transmitting during
+    any of it, and it is CAPTURE_THRESHOLD dB stronger than every overlapping
+    frame on the band combined.
+
+    Received power follows a log-distance path loss model with a fixed
+    shadowing offset per link and independent fading per frame, so links near
+    the edge of range lose some frames rather than all or none.
+
+    Usage::
+
+        channel = Channel()
+        for position in grid(25, spacing=500):
+            lora = RYLR998(port=None, ser=channel.add_node(position).endpoint)
+        ...
+        print(channel.stats())
+    """
+    def __init__(self, path_loss_exponent=3.5, shadowing=4.0, fading=2.0, seed=None):
+        """
+        :param path_loss_exponent: 2 for free space, 3-4 for radios near the ground among buildings.
+        :param shadowing: Standard deviation (dB) of the fixed per-link shadowing.
+        :param fading: Standard deviation (dB) of the per-frame fading.
+        :param seed: Seed for shadowing, fading and module UIDs, for repeatable runs.
+        """
+        self.path_loss_exponent = path_loss_exponent
+        self.shadowing = shadowing
+        self.fading = fading
+        self.random = random.Random(seed)
+        self.modems = []
+        self._links = {}
+        self._on_air = []  # Frames that ended less than the longest airtime ago
+        self._events = []  # (time, counter, callback) heap for the event thread
+        self._counter = 0
+        self._counts = Counter()
+        self._airtime = 0.0
+        self._started = time.monotonic()
+        self._lock = threading.Condition()
+        self._selector = selectors.DefaultSelector()
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add_node(self, position, pty=False, timeout=1, **settings):
+        """
+        Add a module at `position` (x, y) in metres.
+
+        :param pty: Give the module a pty (its path is modem.endpoint.port) instead of a file-like endpoint.
+        :param settings: Initial Modem settings such as address or tx_power.
+        :return: The Modem, whose endpoint is what the host talks to.
+        """
+        modem = Modem(self, position, **settings)
+        if pty:
+            modem.endpoint = PtyEndpoint(modem)
+            self._selector.register(modem.endpoint.master, selectors.EVENT_READ, modem.endpoint)
+        else:
+            modem.endpoint = VirtualSerial(modem, timeout=timeout)
+        with self._lock:
+            self.modems.append(modem)
+        return modem
+
+    def _path_loss(self, sender, receiver):
+        distance = max(math.dist(sender.position, receiver.position), 1.0)
+        # Free space loss over the first metre, then the log-distance slope
+        reference = 20 * math.log10(sender.band) - 147.55
+        key = (id(sender), id(receiver)) if id(sender) < id(receiver) else (id(receiver), id(sender))
+        if key not in self._links:
+            self._links[key] = self.random.gauss(0, self.shadowing)
+        return reference + 10 * self.path_loss_exponent * math.log10(distance) + self._links[key]
+
+    def _received_power(self, frame, receiver):
+        return frame['sender'].tx_power - self._path_loss(frame['sender'], receiver) + self.random.gauss(0, self.fading)
+
+    def transmit(self, sender, address, data):
+        # Called for AT+SEND; False while the module is still sending its last frame
+        airtime = time_on_air(len(data.encode()), *sender.parameters)
+        with self._lock:
+            now = time.monotonic()
+            if sender.transmitting_until > now:
+                return False
+            sender.transmitting_until = now + airtime
+            frame = {
+                'sender': sender, 'address': address, 'data': data,
+                'start': now, 'end': now + airtime,
+                'band': sender.band, 'network_id': sender.network_id, 'parameters': sender.parameters,
+            }
+            self._on_air.append(frame)
+            self._counts['sent'] += 1
+            self._airtime += airtime
+            self._schedule(frame['end'], lambda: self._deliver(frame))
+        return True
+
+    def _schedule(self, when, callback):
+        heapq.heappush(self._events, (when, self._counter, callback))
+        self._counter += 1
+        self._lock.notify()
+
+    def _deliver(self, frame):
+        # Runs on the event thread, with the lock held, when the frame ends
+        sender = frame['sender']
+        spreading_factor, bandwidth = frame['parameters'][:2]
+        noise = -174 + 10 * math.log10(BANDWIDTHS[bandwidth]) + NOISE_FIGURE
+        interferers = [other for other in self._on_air if other is not frame and other['band'] == frame['band']
+                       and other['start'] < frame['end'] and other['end'] > frame['start']]
+        deliveries = []
+        for receiver in self.modems:
+            if receiver is sender or (receiver.band, receiver.network_id, receiver.parameters) != (frame['band'], frame['network_id'], frame['parameters']):
+                continue
+            if frame['address'] not in (0, receiver.address):
+                continue
+            power = self._received_power(frame, receiver)
+            snr = power - noise
+            if snr < SNR_LIMITS.get(spreading_factor, -20.0):
+                self._counts['out_of_range'] += 1
+                continue
+            self._counts['in_range'] += 1
+            if any(other['sender'] is receiver for other in interferers):
+                self._counts['half_duplex'] += 1
+                continue
+            interference = sum(10 ** (self._received_power(other, receiver) / 10) for other in interferers)
+            if interference and power - 10 * math.log10(interference) < CAPTURE_THRESHOLD:
+                self._counts['collided'] += 1
+                continue
+            if interferers:
+                self._counts['captured'] += 1
+            self._counts['delivered'] += 1
+            rssi = round(min(power, -20))
+            deliveries.append((receiver, f"+RCV={sender.address},{len(frame['data'].encode())},{frame['data']},{rssi},{round(snr)}"))
+        # Forget frames that can no longer overlap anything still to be decided
+        horizon = frame['end'] - max((other['end'] - other['start'] for other in self._on_air), default=0)
+        self._on_air = [other for other in self._on_air if other['end'] > horizon]
+        return deliveries
+
+    def _run(self):
+        while self._running:
+            # Commands from pty endpoints
+            for key, _ in self._selector.select(timeout=0) if self._selector.get_map() else ():
+                key.data.on_readable()
+            with self._lock:
+                now = time.monotonic()
+                due = []
+                while self._events and self._events[0][0] <= now:
+                    due.append(heapq.heappop(self._events)[2])
+                deliveries = [delivery for callback in due for delivery in callback()]
+                if not due:
+                    wait = self._events[0][0] - now if self._events else 0.05
+                    self._lock.wait(min(wait, 0.01 if self._selector.get_map() else 0.05))
+            # Write outside the lock, a host may be waiting on its own reply
+            for receiver, line in deliveries:
+                receiver.reply(line)
+
+    def stats(self):
+        """
+        :return: Frame counts, the delivery ratio over receivers in range, and the offered
+            load (seconds on air per second; above 1 frames must overlap).
+        """
+        with self._lock:
+            counts = dict(self._counts)
+            airtime = self._airtime
+            elapsed = time.monotonic() - self._started
+        counts.setdefault('sent', 0)
+        in_range = counts.get('in_range', 0)
+        counts['delivery_ratio'] = round(counts.get('delivered', 0) / in_range, 3) if in_range else None
+        counts['offered_load'] = round(airtime / elapsed, 3) if elapsed else 0.0
+        return counts
+
+    def close(self):
+        self._running = False
+        self._thread.join(timeout=1)
+        for modem in self.modems:
+            modem.endpoint.close()
+        self._selector.close()
+
+def grid(count, spacing):
+    # Positions of `count` nodes on a square grid `spacing` metres apart
+    side = math.ceil(math.sqrt(count))
+    return [((i % side) * spacing, (i // side) * spacing) for i in range(count)]
+
+def scatter(count, width, height=None, seed=None):
+    # Positions of `count` nodes spread uniformly over a width x height metre area
+    rng = random.Random(seed)
+    return [(rng.uniform(0, width), rng.uniform(0, height or width)) for _ in range(count)]
+
+if __name__ == "__main__":
+    # Simulated network:
+    #   python -m resililink.simulator --pty [nodes] [spacing]
+    #       (print pty ports to run chat.py against, e.g. LORA_PORT=/dev/pts/5 python web_chat.py)
+    #   python -m resililink.simulator [nodes] [seconds] [interval] [spacing]
+    #       (every node broadcasts about once per interval seconds; print delivery statistics)
+    args = sys.argv[1:]
+    use_pty = '--pty' in args
+    args = [arg for arg in args if arg != '--pty']
+    channel = Channel(seed=1)
+
+    if use_pty:
+        count = int(args[0]) if args else 3
+        spacing = float(args[1]) if len(args) > 1 else 500
+        for i, position in enumerate(grid(count, spacing)):
+            modem = channel.add_node(position, pty=True, address=i + 1)
+            print(f"Node at {position}: {modem.endpoint.port}")
+        print("Ctrl-C to stop")
+        try:
+            while True:
+                time.sleep(10)
+                print(channel.stats())
+        except KeyboardInterrupt:
+            pass
+        channel.close()
+        sys.exit()
+
+    count = int(args[0]) if args else 50
+    duration = float(args[1]) if len(args) > 1 else 60
+    interval = float(args[2]) if len(args) > 2 else 30
+    spacing = float(args[3]) if len(args) > 3 else 800
+    modems = [channel.add_node(position, address=i + 1, network_id=18, band=902687500)
+              for i, position in enumerate(grid(count, spacing))]
+    for modem in modems:
+        modem.parameters = (11, 9, 4, 12)
+    deadline = time.monotonic() + duration
+
+    def host(modem, rng):
+        # Poisson traffic of 100-byte broadcasts, written straight to the
+        # module, with a reader discarding the +OK and +RCV lines
+        endpoint = modem.endpoint
+        def discard():
+            try:
+                while True:
+                    endpoint.readline()
+            except OSError:
+                pass  # Channel closed
+
+        reader = threading.Thread(target=discard)
+        reader.daemon = True
+        reader.start()
+        while True:
+            send_at = time.monotonic() + rng.expovariate(1 / interval)
+            if send_at >= deadline:
+                break
+            time.sleep(send_at - time.monotonic())
+            endpoint.write(f"AT+SEND=0,100,{'x' * 100}\r\n".encode())
+
+    print(f"{count} nodes {spacing:.0f} m apart, one 100-byte frame per node every {interval:.0f} s on average, for {duration:.0f} s")
+    threads = [threading.Thread(target=host, args=(modem, random.Random(i))) for i, modem in enumerate(modems)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    time.sleep(1)  # Let the last frames land
+    print(channel.stats())
+    channel.close()
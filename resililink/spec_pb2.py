@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: spec.proto
+"""Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nspec.proto\"\x9f\x03\n\x06Packet\x12\x13\n\x0bpacket_uuid\x18\x01 \x01(\t\x12 \n\x0bpacket_type\x18\x02 \x01(\x0e\x32\x0b.PacketType\x12*\n\x0fnetwork_message\x18\x03 \x01(\x0b\x32\x0f.NetworkMessageH\x00\x12\"\n\x0b\x61\x63k_message\x18\x04 \x01(\x0b\x32\x0b.AckMessageH\x00\x12,\n\x10\x64iscover_message\x18\x05 \x01(\x0b\x32\x10.DiscoverMessageH\x00\x12,\n\x10\x61nnounce_message\x18\x06 \x01(\x0b\x32\x10.AnnounceMessageH\x00\x12,\n\x10\x66ragment_message\x18\t \x01(\x0b\x32\x10.FragmentMessageH\x00\x12$\n\x0cnack_message\x18\n \x01(\x0b\x32\x0c.NackMessageH\x00\x12.\n\x11\x61ggregate_message\x18\x0b \x01(\x0b\x32\x11.AggregateMessageH\x00\x12\x10\n\x08sequence\x18\x07 \x01(\r\x12\x11\n\thop_limit\x18\x08 \x01(\rB\t\n\x07payload\"\xb9\x01\n\x0eNetworkMessage\x12\x0f\n\x07node_id\x18\x01 \x01(\t\x12\x11\n\ttimestamp\x18\x02 \x01(\r\x12\"\n\x0fsender_location\x18\x03 \x01(\x0b\x32\t.Location\x12\x17\n\x0fmessage_content\x18\x04 \x01(\x0c\x12\x13\n\x0b\x64\x65stination\x18\x05 \x01(\t\x12\r\n\x05\x66lags\x18\x06 \x01(\r\x12\x11\n\tstream_id\x18\x07 \x01(\t\x12\x0f\n\x07segment\x18\x08 \x01(\r\"D\n\nAckMessage\x12\x12\n\nmessage_id\x18\x01 \x01(\t\x12\x0f\n\x07node_id\x18\x02 \x01(\t\x12\x11\n\ttimestamp\x18\x03 \x01(\r\"$\n\x0f\x44iscoverMessage\x12\x11\n\ttimestamp\x18\x01 \x01(\r\"k\n\x0f\x41nnounceMessage\x12\x0f\n\x07node_id\x18\x01 \x01(\t\x12\x11\n\ttimestamp\x18\x02 \x01(\r\x12 \n\rnode_location\x18\x03 \x01(\x0b\x32\t.Location\x12\x12\n\nroute_cost\x18\x04 \x01(\r\"w\n\x0f\x46ragmentMessage\x12\x0f\n\x07node_id\x18\x01 \x01(\t\x12\x12\n\nmessage_id\x18\x02 \x01(\t\x12\r\n\x05index\x18\x03 \x01(\r\x12\r\n\x05\x63ount\x18\x04 \x01(\r\x12\x0c\n\x04\x64\x61ta\x18\x05 \x01(\x0c\x12\x13\n\x0b\x64\x65stination\x18\x06 \x01(\t\"X\n\x0bNackMessage\x12\x0f\n\x07node_id\x18\x01 \x01(\t\x12\x12\n\nmessage_id\x18\x02 \x01(\t\x12\x13\n\x0b\x64\x65stination\x18\x03 \x01(\t\x12\x0f\n\x07missing\x18\x04 \x03(\r\"#\n\x10\x41ggregateMessage\x12\x0f\n\x07packets\x18\x01 \x03(\x0c\"/\n\x08Location\x12\x10\n\x08latitude\x18\x01 \x01(\x01\x12\x11\n\tlongitude\x18\x02 \x01(\x01*\x9d\x01\n\nPacketType\x12\x13\n\x0fNETWORK_MESSAGE\x10\x00\x12\x0f\n\x0b\x41\x43K_MESSAGE\x10\x01\x12\x14\n\x10\x44ISCOVER_MESSAGE\x10\x02\x12\x14\n\x10\x41NNOUNCE_MESSAGE\x10\x03\x12\x14\n\x10\x46RAGMENT_MESSAGE\x10\x04\x12\x10\n\x0cNACK_MESSAGE\x10\x05\x12\x15\n\x11\x41GGREGATE_MESSAGE\x10\x06\x62\x06proto3')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'spec_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  _PACKETTYPE._serialized_start=1135
+  _PACKETTYPE._serialized_end=1292
+  _PACKET._serialized_start=15
+  _PACKET._serialized_end=430
+  _NETWORKMESSAGE._serialized_start=433
+  _NETWORKMESSAGE._serialized_end=618
+  _ACKMESSAGE._serialized_start=620
+  _ACKMESSAGE._serialized_end=688
+  _DISCOVERMESSAGE._serialized_start=690
+  _DISCOVERMESSAGE._serialized_end=726
+  _ANNOUNCEMESSAGE._serialized_start=728
+  _ANNOUNCEMESSAGE._serialized_end=835
+  _FRAGMENTMESSAGE._serialized_start=837
+  _FRAGMENTMESSAGE._serialized_end=956
+  _NACKMESSAGE._serialized_start=958
+  _NACKMESSAGE._serialized_end=1046
+  _AGGREGATEMESSAGE._serialized_start=1048
+  _AGGREGATEMESSAGE._serialized_end=1083
+  _LOCATION._serialized_start=1085
+  _LOCATION._serialized_end=1132
+# @@protoc_insertion_point(module_scope)
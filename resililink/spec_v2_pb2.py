@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: spec_v2.proto
+"""Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rspec_v2.proto\x12\x02v2\"\xa0\x03\n\x06Packet\x12\x11\n\tpacket_id\x18\x01 \x01(\x07\x12\x0e\n\x06source\x18\x02 \x01(\r\x12\x10\n\x08sequence\x18\x03 \x01(\r\x12-\n\x0fnetwork_message\x18\x04 \x01(\x0b\x32\x12.v2.NetworkMessageH\x00\x12%\n\x0b\x61\x63k_message\x18\x05 \x01(\x0b\x32\x0e.v2.AckMessageH\x00\x12/\n\x10\x64iscover_message\x18\x06 \x01(\x0b\x32\x13.v2.DiscoverMessageH\x00\x12/\n\x10\x61nnounce_message\x18\x07 \x01(\x0b\x32\x13.v2.AnnounceMessageH\x00\x12/\n\x10\x66ragment_message\x18\t \x01(\x0b\x32\x13.v2.FragmentMessageH\x00\x12\'\n\x0cnack_message\x18\n \x01(\x0b\x32\x0f.v2.NackMessageH\x00\x12\x31\n\x11\x61ggregate_message\x18\x0b \x01(\x0b\x32\x14.v2.AggregateMessageH\x00\x12\x11\n\thop_limit\x18\x08 \x01(\rB\t\n\x07payload\"\xe0\x01\n\x0eNetworkMessage\x12\x11\n\ttimestamp\x18\x01 \x01(\x07\x12%\n\x0fsender_location\x18\x02 \x01(\x0b\x32\x0c.v2.Location\x12\x17\n\x0fmessage_content\x18\x03 \x01(\x0c\x12\x1a\n\x10\x64\x65stination_node\x18\x04 \x01(\rH\x00\x12\x1d\n\x13\x64\x65stination_address\x18\x05 \x01(\tH\x00\x12\r\n\x05\x66lags\x18\x06 \x01(\r\x12\x11\n\tstream_id\x18\x07 \x01(\x07\x12\x0f\n\x07segment\x18\x08 \x01(\rB\r\n\x0b\x64\x65stination\"3\n\nAckMessage\x12\x12\n\nmessage_id\x18\x01 \x01(\x07\x12\x11\n\ttimestamp\x18\x02 \x01(\x07\"$\n\x0f\x44iscoverMessage\x12\x11\n\ttimestamp\x18\x01 \x01(\x07\"]\n\x0f\x41nnounceMessage\x12\x11\n\ttimestamp\x18\x01 \x01(\x07\x12#\n\rnode_location\x18\x02 \x01(\x0b\x32\x0c.v2.Location\x12\x12\n\nroute_cost\x18\x03 \x01(\r\"\x9b\x01\n\x0f\x46ragmentMessage\x12\x12\n\nmessage_id\x18\x01 \x01(\x07\x12\r\n\x05index\x18\x02 \x01(\r\x12\r\n\x05\x63ount\x18\x03 \x01(\r\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\x0c\x12\x1a\n\x10\x64\x65stination_node\x18\x05 \x01(\rH\x00\x12\x1d\n\x13\x64\x65stination_address\x18\x06 \x01(\tH\x00\x42\r\n\x0b\x64\x65stination\"G\n\x0bNackMessage\x12\x12\n\nmessage_id\x18\x01 \x01(\x07\x12\x13\n\x0b\x64\x65stination\x18\x02 \x01(\r\x12\x0f\n\x07missing\x18\x03 \x03(\r\"#\n\x10\x41ggregateMessage\x12\x0f\n\x07packets\x18\x01 \x03(\x0c\"/\n\x08Location\x12\x10\n\x08latitude\x18\x01 \x01(\x0f\x12\x11\n\tlongitude\x18\x02 \x01(\x0f\x62\x06proto3')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'spec_v2_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  _PACKET._serialized_start=22
+  _PACKET._serialized_end=438
+  _NETWORKMESSAGE._serialized_start=441
+  _NETWORKMESSAGE._serialized_end=665
+  _ACKMESSAGE._serialized_start=667
+  _ACKMESSAGE._serialized_end=718
+  _DISCOVERMESSAGE._serialized_start=720
+  _DISCOVERMESSAGE._serialized_end=756
+  _ANNOUNCEMESSAGE._serialized_start=758
+  _ANNOUNCEMESSAGE._serialized_end=851
+  _FRAGMENTMESSAGE._serialized_start=854
+  _FRAGMENTMESSAGE._serialized_end=1009
+  _NACKMESSAGE._serialized_start=1011
+  _NACKMESSAGE._serialized_end=1082
+  _AGGREGATEMESSAGE._serialized_start=1084
+  _AGGREGATEMESSAGE._serialized_end=1119
+  _LOCATION._serialized_start=1121
+  _LOCATION._serialized_end=1168
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,274 @@
+from . import spec_pb2
+from . import spec_v2_pb2
+
+# Translation between the v1 schema (spec.proto) used throughout the code
+# and the compact v2 wire format (spec_v2.proto). Packets are always handled
+# as v1 objects; serialize_packet() emits v2 whenever the packet can be
+# represented in it, and parse_packet() accepts either version.
+
+V1 = 1
+V2 = 2
+
+# A v2 packet always starts with the tag of its non-zero fixed32 packet_id
+# (field 1, wire type 5). A v1 packet starts with the packet_uuid string tag.
+V2_TAG = b'\x0d'
+
+FIXED_PREFIX = "FIXED"
+SERVER_NODE_ID = "Server"
+SERVER_ADDRESS = 65535
+
+# Set in NetworkMessage.flags on every segment of a streamed answer except
+# the last, so a segment without it marks the answer complete
+FLAG_MORE = 4
+
+def node_address(node_id):
+    # "FIXED178" -> 178, "Server" -> SERVER_ADDRESS, anything else -> None
+    if node_id == SERVER_NODE_ID:
+        return SERVER_ADDRESS
+    digits = node_id[len(FIXED_PREFIX):]
+    if not node_id.startswith(FIXED_PREFIX) or not digits.isdigit():
+        return None
+    address = int(digits)
+    # Only addresses that translate back to the exact same node ID
+    if str(address) != digits or not 0 < address < SERVER_ADDRESS:
+        return None
+    return address
+
+def address_node_id(address):
+    if address == SERVER_ADDRESS:
+        return SERVER_NODE_ID
+    return f"{FIXED_PREFIX}{address}" if address else ""
+
+def packet_id(packet_uuid):
+    # 8 lowercase hex digits -> non-zero 32-bit integer, anything else -> None
+    if len(packet_uuid) != 8:
+        return None
+    try:
+        value = int(packet_uuid, 16)
+    except ValueError:
+        return None
+    if value == 0 or format(value, '08x') != packet_uuid:
+        return None
+    return value
+
+def packet_uuid(packet_id):
+    return format(packet_id, '08x')
+
+def _location_to_v2(location, out):
+    out.latitude = round(location.latitude * 1e7)
+    out.longitude = round(location.longitude * 1e7)
+
+def _location_to_v1(location, out):
+    out.latitude = location.latitude / 1e7
+    out.longitude = location.longitude / 1e7
+
+def to_v2(packet):
+    """
+    Translate a v1 Packet to v2.
+
+    :return: A spec_v2_pb2.Packet, or None if the packet uses IDs v2 cannot carry.
+    """
+    out = spec_v2_pb2.Packet()
+    out.packet_id = packet_id(packet.packet_uuid) or 0
+    if not out.packet_id:
+        return None
+    out.sequence = packet.sequence
+    out.hop_limit = packet.hop_limit
+    payload = packet.WhichOneof('payload')
+
+    if payload == 'network_message':
+        message = packet.network_message
+        source = node_address(message.node_id)
+        if source is None:
+            return None
+        out.source = source
+        out.network_message.timestamp = message.timestamp
+        if message.HasField('sender_location'):
+            _location_to_v2(message.sender_location, out.network_message.sender_location)
+        out.network_message.message_content = message.message_content
+        out.network_message.flags = message.flags
+        if message.stream_id:
+            stream_id = packet_id(message.stream_id)
+            if stream_id is None:
+                return None
+            out.network_message.stream_id = stream_id
+            out.network_message.segment = message.segment
+        destination = node_address(message.destination)
+        if destination is not None:
+            out.network_message.destination_node = destination
+        else:
+            out.network_message.destination_address = message.destination
+    elif payload == 'ack_message':
+        message = packet.ack_message
+        source = node_address(message.node_id)
+        message_id = packet_id(message.message_id)
+        if source is None or message_id is None:
+            return None
+        out.source = source
+        out.ack_message.message_id = message_id
+        out.ack_message.timestamp = message.timestamp
+    elif payload == 'discover_message':
+        out.discover_message.SetInParent()
+        out.discover_message.timestamp = packet.discover_message.timestamp
+    elif payload == 'announce_message':
+        message = packet.announce_message
+        source = node_address(message.node_id)
+        if source is None:
+            return None
+        out.source = source
+        out.announce_message.SetInParent()
+        out.announce_message.timestamp = message.timestamp
+        out.announce_message.route_cost = message.route_cost
+        if message.HasField('node_location'):
+            _location_to_v2(message.node_location, out.announce_message.node_location)
+    elif payload == 'fragment_message':
+        message = packet.fragment_message
+        source = node_address(message.node_id)
+        message_id = packet_id(message.message_id)
+        if source is None or message_id is None:
+            return None
+        out.source = source
+        out.fragment_message.message_id = message_id
+        out.fragment_message.index = message.index
+        out.fragment_message.count = message.count
+        out.fragment_message.data = message.data
+        destination = node_address(message.destination)
+        if destination is not None:
+            out.fragment_message.destination_node = destination
+        else:
+            out.fragment_message.destination_address = message.destination
+    elif payload == 'nack_message':
+        message = packet.nack_message
+        source = node_address(message.node_id)
+        message_id = packet_id(message.message_id)
+        destination = node_address(message.destination)
+        if source is None or message_id is None or destination is None:
+            return None
+        out.source = source
+        out.nack_message.message_id = message_id
+        out.nack_message.destination = destination
+        out.nack_message.missing.extend(message.missing)
+    elif payload == 'aggregate_message':
+        out.aggregate_message.packets.extend(packet.aggregate_message.packets)
+    else:
+        return None
+    return out
+
+def to_v1(packet):
+    """
+    Translate a v2 Packet back to the v1 representation.
+    """
+    out = spec_pb2.Packet()
+    out.packet_uuid = packet_uuid(packet.packet_id)
+    out.sequence = packet.sequence
+    out.hop_limit = packet.hop_limit
+    source = address_node_id(packet.source)
+    payload = packet.WhichOneof('payload')
+
+    if payload == 'network_message':
+        message = packet.network_message
+        out.packet_type = spec_pb2.NETWORK_MESSAGE
+        out.network_message.node_id = source
+        out.network_message.timestamp = message.timestamp
+        if message.HasField('sender_location'):
+            _location_to_v1(message.sender_location, out.network_message.sender_location)
+        out.network_message.message_content = message.message_content
+        out.network_message.flags = message.flags
+        if message.stream_id:
+            out.network_message.stream_id = packet_uuid(message.stream_id)
+            out.network_message.segment = message.segment
+        if message.WhichOneof('destination') == 'destination_node':
+            out.network_message.destination = address_node_id(message.destination_node)
+        else:
+            out.network_message.destination = message.destination_address
+    elif payload == 'ack_message':
+        out.packet_type = spec_pb2.ACK_MESSAGE
+        out.ack_message.message_id = packet_uuid(packet.ack_message.message_id)
+        out.ack_message.node_id = source
+        out.ack_message.timestamp = packet.ack_message.timestamp
+    elif payload == 'discover_message':
+        out.packet_type = spec_pb2.DISCOVER_MESSAGE
+        out.discover_message.SetInParent()
+        out.discover_message.timestamp = packet.discover_message.timestamp
+    elif payload == 'announce_message':
+        message = packet.announce_message
+        out.packet_type = spec_pb2.ANNOUNCE_MESSAGE
+        out.announce_message.node_id = source
+        out.announce_message.timestamp = message.timestamp
+        out.announce_message.route_cost = message.route_cost
+        if message.HasField('node_location'):
+            _location_to_v1(message.node_location, out.announce_message.node_location)
+    elif payload == 'fragment_message':
+        message = packet.fragment_message
+        out.packet_type = spec_pb2.FRAGMENT_MESSAGE
+        out.fragment_message.node_id = source
+        out.fragment_message.message_id = packet_uuid(message.message_id)
+        out.fragment_message.index = message.index
+        out.fragment_message.count = message.count
+        out.fragment_message.data = message.data
+        if message.WhichOneof('destination') == 'destination_node':
+            out.fragment_message.destination = address_node_id(message.destination_node)
+        else:
+            out.fragment_message.destination = message.destination_address
+    elif payload == 'nack_message':
+        message = packet.nack_message
+        out.packet_type = spec_pb2.NACK_MESSAGE
+        out.nack_message.node_id = source
+        out.nack_message.message_id = packet_uuid(message.message_id)
+        out.nack_message.destination = address_node_id(message.destination)
+        out.nack_message.missing.extend(message.missing)
+    elif payload == 'aggregate_message':
+        out.packet_type = spec_pb2.AGGREGATE_MESSAGE
+        out.aggregate_message.packets.extend(packet.aggregate_message.packets)
+    return out
+
+def packet_source(packet):
+    # Node ID of the node that created a v1 Packet ("" for DISCOVER)
+    payload = packet.WhichOneof('payload')
+    if payload == 'network_message':
+        return packet.network_message.node_id
+    if payload == 'ack_message':
+        return packet.ack_message.node_id
+    if payload == 'announce_message':
+        return packet.announce_message.node_id
+    if payload == 'fragment_message':
+        return packet.fragment_message.node_id
+    if payload == 'nack_message':
+        return packet.nack_message.node_id
+    return ""
+
+def packet_destination(packet):
+    # Node ID or address a v1 Packet is headed for ("" for broadcast packets)
+    payload = packet.WhichOneof('payload')
+    if payload == 'network_message':
+        return packet.network_message.destination
+    if payload == 'fragment_message':
+        return packet.fragment_message.destination
+    if payload == 'nack_message':
+        return packet.nack_message.destination
+    return ""
+
+def wire_version(data):
+    return V2 if data[:1] == V2_TAG else V1
+
+def serialize_packet(packet, version=V2):
+    """
+    Serialize a v1 Packet, as v2 when requested and representable.
+    """
+    if version >= V2:
+        compact = to_v2(packet)
+        if compact is not None:
+            return compact.SerializeToString()
+    return packet.SerializeToString()
+
+def parse_packet(data):
+    """
+    Parse a serialized v1 or v2 packet into a v1 Packet.
+    """
+    if wire_version(data) == V2:
+        compact = spec_v2_pb2.Packet()
+        compact.ParseFromString(data)
+        return to_v1(compact)
+    packet = spec_pb2.Packet()
+    packet.ParseFromString(data)
+    return packet
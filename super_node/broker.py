@@ -0,0 +1,235 @@
+import socketserver
+import struct
+import sys
+import threading
+import time
+from collections import Counter
+
+# A small MQTT 3.1.1 broker for running the gateway path offline. It speaks
+# enough of the protocol for paho-mqtt clients such as relay.py (CONNECT,
+# PUBLISH at QoS 0-2, SUBSCRIBE with + and # wildcards, UNSUBSCRIBE, PINGREQ,
+# DISCONNECT and retained messages) and lets in-process code publish and
+# subscribe directly, which is how skylo_emulator.py attaches its modem.
+# Messages are always forwarded to subscribers at QoS 0.
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+def topic_matches(pattern, topic):
+    # MQTT topic filter matching: + matches one level, # the rest
+    pattern_levels = pattern.split('/')
+    topic_levels = topic.split('/')
+    for i, level in enumerate(pattern_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels) or (level != '+' and level != topic_levels[i]):
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+def encode_packet(packet_type, body, flags=0):
+    # Fixed header: type and flags, then the remaining length as a varint
+    header = bytearray([packet_type << 4 | flags])
+    length = len(body)
+    while True:
+        byte = length % 128
+        length //= 128
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(header) + body
+
+def encode_string(text):
+    data = text.encode() if isinstance(text, str) else text
+    return struct.pack('!H', len(data)) + data
+
+def read_packet(sock_file):
+    """
+    :return: (type, flags, body), or None when the connection closed.
+    """
+    first = sock_file.read(1)
+    if not first:
+        return None
+    length, shift = 0, 0
+    while True:
+        byte = sock_file.read(1)
+        if not byte:
+            return None
+        length |= (byte[0] & 0x7F) << shift
+        shift += 7
+        if not byte[0] & 0x80:
+            break
+    body = sock_file.read(length)
+    if len(body) < length:
+        return None
+    return first[0] >> 4, first[0] & 0x0F, body
+
+class _ClientHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        broker = self.server.broker
+        self.send_lock = threading.Lock()
+        self.client_id = None
+        try:
+            while True:
+                packet = read_packet(self.rfile)
+                if packet is None or not self._handle(broker, *packet):
+                    break
+        except (OSError, struct.error, IndexError):
+            pass  # Dropped or malformed connection
+        finally:
+            broker._unsubscribe_all(self)
+
+    def send(self, packet_type, body, flags=0):
+        with self.send_lock:
+            self.request.sendall(encode_packet(packet_type, body, flags))
+
+    def deliver(self, topic, payload):
+        try:
+            self.send(PUBLISH, encode_string(topic) + payload)
+        except OSError:
+            pass  # The handler thread notices the closed socket
+
+    def _handle(self, broker, packet_type, flags, body):
+        if packet_type == CONNECT:
+            # Protocol name, level, flags and keep-alive precede the client ID
+            name_length = struct.unpack('!H', body[:2])[0]
+            offset = 2 + name_length + 4
+            id_length = struct.unpack('!H', body[offset:offset + 2])[0]
+            self.client_id = body[offset + 2:offset + 2 + id_length].decode(errors='replace')
+            self.send(CONNACK, b'\x00\x00')
+            broker._count('connections')
+        elif packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic_length = struct.unpack('!H', body[:2])[0]
+            topic = body[2:2 + topic_length].decode()
+            offset = 2 + topic_length
+            if qos:
+                packet_id = body[offset:offset + 2]
+                offset += 2
+                self.send(PUBACK if qos == 1 else PUBREC, packet_id)
+            broker.publish(topic, body[offset:], retain=bool(flags & 0x01))
+        elif packet_type == PUBREL:
+            self.send(PUBCOMP, body[:2])
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset, granted = body[:2], 2, bytearray()
+            while offset < len(body):
+                topic_length = struct.unpack('!H', body[offset:offset + 2])[0]
+                pattern = body[offset + 2:offset + 2 + topic_length].decode()
+                offset += 2 + topic_length + 1
+                granted.append(0)
+                broker._subscribe(pattern, self)
+            self.send(SUBACK, packet_id + bytes(granted))
+        elif packet_type == UNSUBSCRIBE:
+            packet_id, offset = body[:2], 2
+            while offset < len(body):
+                topic_length = struct.unpack('!H', body[offset:offset + 2])[0]
+                broker._unsubscribe(body[offset + 2:offset + 2 + topic_length].decode(), self)
+                offset += 2 + topic_length
+            self.send(UNSUBACK, packet_id)
+        elif packet_type == PINGREQ:
+            self.send(PINGRESP, b'')
+        elif packet_type == DISCONNECT:
+            return False
+        return True
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class Broker:
+    """
+    Usage::
+
+        broker = Broker(port=1883).start()
+        broker.subscribe("12458Test/#", lambda topic, payload: print(topic, payload))
+        broker.publish("12458Test/sub", b"...")
+    """
+    def __init__(self, host='127.0.0.1', port=1883):
+        """
+        :param port: TCP port to listen on (0 picks a free one, see self.port after start()).
+        """
+        self.host = host
+        self.port = port
+        self._subscriptions = []  # (pattern, handler or callback)
+        self._retained = {}
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        self._server = _Server((self.host, self.port), _ClientHandler)
+        self._server.broker = self
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        print(f"MQTT broker listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def publish(self, topic, payload, retain=False):
+        # Forward to every matching subscriber, in-process or over TCP
+        if isinstance(payload, str):
+            payload = payload.encode()
+        with self._lock:
+            if retain:
+                self._retained[topic] = payload
+            targets = [target for pattern, target in self._subscriptions if topic_matches(pattern, topic)]
+            self._counts['published'] += 1
+            self._counts['delivered'] += len(targets)
+        for target in targets:
+            if isinstance(target, _ClientHandler):
+                target.deliver(topic, payload)
+            else:
+                target(topic, payload)
+
+    def subscribe(self, pattern, callback):
+        """
+        In-process subscription; callback(topic, payload) runs on the publisher's thread.
+        """
+        self._subscribe(pattern, callback)
+
+    def unsubscribe(self, pattern, callback):
+        self._unsubscribe(pattern, callback)
+
+    def _subscribe(self, pattern, target):
+        with self._lock:
+            if (pattern, target) not in self._subscriptions:
+                self._subscriptions.append((pattern, target))
+            retained = [(topic, payload) for topic, payload in self._retained.items() if topic_matches(pattern, topic)]
+        for topic, payload in retained:
+            if isinstance(target, _ClientHandler):
+                target.deliver(topic, payload)
+            else:
+                target(topic, payload)
+
+    def _unsubscribe(self, pattern, target):
+        with self._lock:
+            if (pattern, target) in self._subscriptions:
+                self._subscriptions.remove((pattern, target))
+
+    def _unsubscribe_all(self, target):
+        with self._lock:
+            self._subscriptions = [(pattern, other) for pattern, other in self._subscriptions if other is not target]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['subscriptions'] = len(self._subscriptions)
+        return stats
+
+if __name__ == "__main__":
+    # Standalone broker: python broker.py [port]
+    broker = Broker(host='0.0.0.0', port=int(sys.argv[1]) if len(sys.argv) > 1 else 1883).start()
+    try:
+        while True:
+            time.sleep(60)
+            print(broker.stats())
+    except KeyboardInterrupt:
+        broker.stop()
@@ -1,75 +1,111 @@
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding as sym_padding
-import spec_pb2
+from resililink import spec_pb2
 import uuid
+import itertools
 import time
-import base64
 import threading
-import os
 import random
+import os
+import queue
+from collections import Counter, OrderedDict
 from skylo import SerialWrapper
-from rylr998 import RYLR998
+from resililink.rylr998 import RYLR998
+from resililink.airtime import AirtimeScheduler
+from resililink.codec import encode_frame, decode_frame, max_payload
+from resililink.wire import serialize_packet, parse_packet, packet_source, packet_destination, SERVER_NODE_ID
+from resililink.dedup import DuplicateFilter
+from radio import RadioActor, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from resililink.reliability import ReliableSender
+from resililink.flooding import FloodController
+from resililink.routing import RoutingTable
+from resililink.fragment import Reassembler, FragmentCache, fragment_size, split_payload, make_fragments
+from resililink.aggregation import FrameAggregator, unpack_packet
+from resililink.compression import compress, decompress, FLAG_COMPRESSED
+from resililink.crypto import MessageCipher, message_aad, FLAG_AEAD
 
 NODE_ID = "FIXED170"  # Generate a UUID4 for the node ID
 AES_KEY = b'password'.ljust(16, b'\0')[:16]  # Ensure the key is 16 bytes
-
-serial_port = '/dev/ttyUSB0'  # Replace with your serial port
+message_cipher = MessageCipher(AES_KEY)
+ENCRYPTION = "ccm"  # Message encryption, "ccm" (AES-CCM, no IV on the wire) or "cbc" for nodes that predate it
+LORA_PORT = os.environ.get('LORA_PORT', '/dev/ttyAMA0')  # RYLR998 serial port, or a simulator.py pty
+DUTY_CYCLE = 1.0  # Fraction of each hour the radio may spend transmitting
+FRAME_CODEC = "base91"  # Use "base64" while legacy nodes that cannot decode other codecs remain
+WIRE_VERSION = 2  # Packet schema to transmit (1 = spec.proto, 2 = compact spec_v2.proto)
+HOP_LIMIT = 3  # Transmissions a packet this node creates may take through the mesh
+FRAME_SIZE = 240  # Largest AT+SEND payload the RYLR998 accepts
+# Largest serialized packet that fits into one frame; larger ones are fragmented
+MAX_PACKET_SIZE = max_payload(FRAME_SIZE, FRAME_CODEC)
+UPLINK_TOPIC = f"12458Test/pub/{NODE_ID}"  # MQTT topic this gateway publishes what it hears to
+# MQTT topics of the relay's downlinks: those routed through this gateway, and those for every gateway
+DOWNLINK_TOPICS = [f"12458Test/sub/{NODE_ID}", "12458Test/sub"]
+MAX_RELAYED_DOWNLINKS = 256  # Downlinks remembered to pass their ACKs back to the relay
+AGGREGATION_WINDOW = 0.5  # Seconds a small packet waits for others to share its frame (0 = off)
+
+serial_port = os.environ.get('SKYLO_PORT', '/dev/ttyUSB0')  # Skylo modem, or a skylo_emulator.py pty
 wrapper = SerialWrapper(serial_port, baudrate=115200, timeout=1)
 wrapper.mqtt_config(connection_id=1, client_name="testclient_12458_sk", broker_url="test.mosquitto.org")
 wrapper.mqtt_connect(1)
 
-# Set to keep track of received packet UUIDs
-received_packets = set()
+# Duplicate suppression for received packets, keyed on (source, sequence)
+duplicate_filter = DuplicateFilter()
+# Delayed, suppressible rebroadcasts of packets for other nodes
+flood_controller = FloodController()
+# Next hops towards other nodes, learned from ANNOUNCE packets
+routing_table = RoutingTable(spreading_factor=11)
+# Fragments of packets addressed to this node or the relay, waiting for the rest
+reassembler = Reassembler()
+# Slices of packets this node fragmented, kept to answer NACKs
+fragment_cache = FragmentCache()
 # Dictionary to keep track of sent packets and their acknowledgment status
+# (False = pending, True = acknowledged, None = gave up)
 acknowledgments = {}
+# IDs of relay downlinks this gateway transmitted, oldest first
+relayed_downlinks = OrderedDict()
 # Set to keep track of discovered nodes
 discovered_nodes = set()
+# Received frames and packets the listener dropped, by reason
+receive_errors = Counter()
+# Sequence numbers for the packets this node creates
+# Starting from the clock, so after a restart they continue above the numbers
+# used before, which receivers would reject as replays
+sequence_numbers = itertools.count(int(time.time()))
 
 #
-def aes_encrypt(message):
-    if isinstance(message, str):
-        message = message.encode()
-
-    # Generate a random 16-byte IV for CBC mode
-    iv = os.urandom(16)
-
-    # Create AES cipher with the key and IV in CBC mode
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
-
-    # Add padding to the message (AES requires the input to be a multiple of the block size)
-    padder = sym_padding.PKCS7(algorithms.AES.block_size).padder()
-    padded_message = padder.update(message) + padder.finalize()
-
-    # Encrypt the message
-    encrypted_message = encryptor.update(padded_message) + encryptor.finalize()
-
-    # Return the IV and the encrypted message
-    return iv + encrypted_message
 
-def aes_decrypt(ciphertext):
-    # Extract the IV (first 16 bytes) and the actual encrypted message
-    iv = ciphertext[:16]
-    encrypted_message = ciphertext[16:]
-
-    # Create AES cipher with the key and IV in CBC mode
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.CBC(iv), backend=default_backend())
-    decryptor = cipher.decryptor()
-
-    # Decrypt the message
-    decrypted_padded_message = decryptor.update(encrypted_message) + decryptor.finalize()
-
-    # Remove padding from the decrypted message
-    unpadder = sym_padding.PKCS7(algorithms.AES.block_size).unpadder()
-    decrypted_message = unpadder.update(decrypted_padded_message) + unpadder.finalize()
+def encrypt_message(packet, message):
+    # Compress and encrypt message text into a packet's NetworkMessage, whose
+    # node_id must be set: with AES-CCM the packet header provides the nonce
+    network_message = packet.network_message
+    content, compressed = compress(message.encode())
+    network_message.flags = FLAG_COMPRESSED if compressed else 0
+    if ENCRYPTION == "ccm":
+        # The flags are authenticated along with the rest of the header, so set them first
+        network_message.flags |= FLAG_AEAD
+        network_message.message_content = message_cipher.encrypt(content, network_message.node_id, packet.packet_uuid, packet.sequence,
+                                                                 message_aad(network_message))
+    else:
+        network_message.message_content = message_cipher.encrypt_cbc(content)
 
-    return decrypted_message.decode()
+def decrypt_message(packet):
+    # Decrypt a packet's message text in whichever format the sender used
+    network_message = packet.network_message
+    try:
+        if network_message.flags & FLAG_AEAD:
+            content = message_cipher.decrypt(network_message.message_content, network_message.node_id, packet.packet_uuid, packet.sequence,
+                                             message_aad(network_message))
+        else:
+            content = message_cipher.decrypt_cbc(network_message.message_content)
+    except ValueError:
+        # A wrong key, or a message forged or corrupted on the way
+        receive_errors['authentication'] += 1
+        raise
+    if network_message.flags & FLAG_COMPRESSED:
+        content = decompress(content)
+    return content.decode()
 
 
 def initialize_lora(address, network_id):
     # Initialize the LoRa module
-    lora = RYLR998(port='/dev/ttyAMA0')
+    lora = RYLR998(port=LORA_PORT, scheduler=AirtimeScheduler(duty_cycle=DUTY_CYCLE))
     lora.set_address(address)  # Set this node's address
     lora.set_network_id(network_id)  # Set the network ID
     lora.set_rf_parameters(11,9,4,12)
@@ -79,143 +115,319 @@ def initialize_lora(address, network_id):
 
 # AES Encryption and Decryption functions remain unchanged
 
-def send_message(lora, destination, message_content):
-    # Encrypt the message
-    encrypted_message = aes_encrypt(message_content.encode())
+def new_packet(packet_type):
+    # Create a Packet with a fresh ID and this node's next sequence number
+    packet = spec_pb2.Packet()
+    packet.packet_uuid = uuid.uuid4().hex[:8]  # Generate a UUID4 for the packet
+    packet.packet_type = packet_type
+    packet.sequence = next(sequence_numbers)
+    packet.hop_limit = HOP_LIMIT
+    return packet
 
+def send_message(radio, destination, message_content):
     # Create a NetworkMessage
     network_message = spec_pb2.NetworkMessage()
     network_message.node_id = NODE_ID
     network_message.timestamp = int(time.time())
-    network_message.message_content = encrypted_message
     network_message.destination = destination
 
     # Create a Packet and assign the NetworkMessage to it
-    packet = spec_pb2.Packet()
-    packet.packet_uuid = uuid.uuid4().hex[:8]  # Generate a UUID4 for the packet
-    packet.packet_type = spec_pb2.NETWORK_MESSAGE
+    packet = new_packet(spec_pb2.NETWORK_MESSAGE)
     packet.network_message.CopyFrom(network_message)
 
-    # Serialize and send the packet
-    send_packet(lora, packet)
+    # Compress and encrypt the message, now that the packet header is known
+    encrypt_message(packet, message_content)
 
-    # Add the packet to the acknowledgment dictionarya
+    # Add the packet to the acknowledgment dictionary, then let the reliable
+    # sender transmit it until it is ACKed. The sender starts each timer, and
+    # the RTT measurement, when the radio's future says the frame went out.
     acknowledgments[packet.packet_uuid] = False
-
-def send_packet(lora, packet):
-    serialized_packet = packet.SerializeToString()
-    b64_packet = base64.urlsafe_b64encode(serialized_packet)
-    lora.send_data(0, str(b64_packet.decode()))
-    print(f"Sent packet: {b64_packet} / {packet}")
-
-def listen_for_data(lora):
+    reliable_sender.send(destination, packet.packet_uuid, lambda: send_packet(radio, packet, address=next_hop_address(destination)))
+
+def delivery_failed(packet_uuid, destination):
+    print(f"No acknowledgment from {destination} for {packet_uuid}")
+    acknowledgments[packet_uuid] = None
+
+# Retransmits sent messages until their ACK arrives
+reliable_sender = ReliableSender(on_give_up=delivery_failed)
+
+def packet_payloads(packet):
+    # Serialized packets carrying a packet: itself, or its fragments if it does not fit a frame.
+    # Fragments are rebuilt on every call, so resent ones get fresh packet IDs.
+    serialized_packet = serialize_packet(packet, WIRE_VERSION)
+    if len(serialized_packet) <= MAX_PACKET_SIZE:
+        return [serialized_packet]
+    destination = packet_destination(packet)
+    chunks = split_payload(serialized_packet, fragment_size(NODE_ID, destination, MAX_PACKET_SIZE, WIRE_VERSION))
+    fragment_cache.put(packet.packet_uuid, chunks, destination)
+    fragments = make_fragments(NODE_ID, packet.packet_uuid, destination, chunks, HOP_LIMIT)
+    return [serialize_packet(fragment, WIRE_VERSION) for fragment in fragments]
+
+def transmit_frame(address, payload, priority):
+    # Called by the aggregator for every frame it sends. Returns the radio's
+    # Future without waiting on it, so neither the aggregator's batch timers
+    # nor the reliable sender block for the radio queue and time on air.
+    return radio.send(address, encode_frame(payload, FRAME_CODEC), priority)
+
+# Packs small packets for the same address into one frame, so ACKs ride along with data
+frame_aggregator = FrameAggregator(transmit_frame, window=AGGREGATION_WINDOW, max_payload=MAX_PACKET_SIZE, version=WIRE_VERSION)
+
+def send_packet(radio, packet, priority=PRIORITY_NORMAL, address=0):
+    # Returns a Future resolved once the packet's last frame was sent
+    for payload in packet_payloads(packet):
+        future = frame_aggregator.submit(address, payload, priority)
+    print(f"Sent packet: {packet}")
+    return future
+
+def next_hop_address(destination):
+    # Unicast towards the destination when a route is known, broadcast otherwise
+    next_hop = routing_table.next_hop(destination)
+    return next_hop if next_hop is not None else 0
+
+def is_new_packet(packet):
+    return duplicate_filter.check(packet_source(packet), packet.sequence, packet.packet_uuid)
+
+def listen_for_data(radio):
     print("Listening for incoming data...")
+    frames = radio.subscribe()
     while True:
-        incoming_data = lora.receive_data()
-        if incoming_data:
-            print(f"Received raw data: {incoming_data}")
-            data_parts = incoming_data.split(",")
-            if len(data_parts) >= 3:
-                encoded_packet = data_parts[2]
-                serialized_packet = base64.urlsafe_b64decode(encoded_packet)
-                received_packet = spec_pb2.Packet()
-                received_packet.ParseFromString(serialized_packet)
-
-                if received_packet.packet_uuid in received_packets:
-                    print(f"Duplicate packet {received_packet.packet_uuid} received, skipping processing.")
-                    continue
-
-                received_packets.add(received_packet.packet_uuid)
-                print(f"Received Packet: {received_packet}")
-
-                if received_packet.packet_type == spec_pb2.NETWORK_MESSAGE:
-                    process_network_message(lora, received_packet)
-                elif received_packet.packet_type == spec_pb2.ACK_MESSAGE:
-                    process_ack_message(received_packet)
-                elif received_packet.packet_type == spec_pb2.DISCOVER_MESSAGE:
-                    process_discover_message(lora, received_packet)
-                elif received_packet.packet_type == spec_pb2.ANNOUNCE_MESSAGE:
-                    process_announce_message(lora, received_packet)
-
-def process_network_message(lora, received_packet):
+        try:
+            item = frames.get(timeout=1)
+        except queue.Empty:
+            check_reassembly(radio)
+            continue
+        print(f"Received raw data: {item}")
+        encoded_packet = item['data']
+        try:
+            # A frame that does not decode, or a truncated packet or aggregate
+            serialized_packet = decode_frame(encoded_packet)
+            packets = unpack_packet(parse_packet(serialized_packet))
+        except Exception as e:
+            receive_errors['frame_decoding'] += 1
+            print(f"Error decoding frame: {e}")
+            print(f"Problematic encoded packet: {encoded_packet}")
+            continue
+
+        # Every frame is a link quality sample for the neighbour that sent it
+        routing_table.heard(item['address'], item['rssi'], item['snr'])
+
+        # An aggregate frame carries several packets, each handled on its own,
+        # so one that fails does not take the others or the listener with it
+        for packet in packets:
+            try:
+                process_packet(radio, packet, item['address'], item)
+            except Exception as e:
+                receive_errors['packet_processing'] += 1
+                print(f"Error processing packet {packet.packet_uuid}: {e} ({dict(receive_errors)})")
+
+def process_packet(radio, received_packet, address, link=None):
+    # Handle a packet received from the neighbour at address, over a frame
+    # with the 'rssi' and 'snr' in link
+    if packet_source(received_packet) == NODE_ID:
+        return  # Our own packet, rebroadcast by a neighbour
+
+    if not is_new_packet(received_packet):
+        # Another copy counts against a pending rebroadcast
+        flood_controller.overheard(received_packet.packet_uuid)
+        if received_packet.packet_type == spec_pb2.ANNOUNCE_MESSAGE:
+            # Copies arriving over other paths may offer a better route
+            routing_table.update(received_packet.announce_message.node_id, address,
+                                 received_packet.announce_message.route_cost)
+        destination = received_packet.network_message.destination
+        if (received_packet.packet_type == spec_pb2.NETWORK_MESSAGE
+                and (destination == NODE_ID or destination.startswith("+"))):
+            # The sender is retransmitting, so our ACK was lost
+            send_ack(radio, received_packet)
+        print(f"Duplicate packet {received_packet.packet_uuid} received, skipping processing.")
+        return
+
+    print(f"Received Packet: {received_packet}")
+
+    if received_packet.packet_type == spec_pb2.NETWORK_MESSAGE:
+        process_network_message(radio, received_packet, link)
+    elif received_packet.packet_type == spec_pb2.ACK_MESSAGE:
+        process_ack_message(radio, received_packet, link)
+    elif received_packet.packet_type == spec_pb2.DISCOVER_MESSAGE:
+        process_discover_message(radio, received_packet)
+    elif received_packet.packet_type == spec_pb2.ANNOUNCE_MESSAGE:
+        process_announce_message(radio, received_packet, address)
+    elif received_packet.packet_type == spec_pb2.FRAGMENT_MESSAGE:
+        process_fragment_message(radio, received_packet, address, link)
+    elif received_packet.packet_type == spec_pb2.NACK_MESSAGE:
+        process_nack_message(radio, received_packet, link)
+
+def process_fragment_message(radio, received_packet, address, link=None):
+    fragment = received_packet.fragment_message
+    if fragment.destination != NODE_ID and not fragment.destination.startswith("+"):
+        # Fragments for other nodes are forwarded as they are, not reassembled
+        retransmit_packet(radio, received_packet)
+        return
+
+    serialized_packet = reassembler.add(fragment.node_id, fragment.message_id, fragment.index, fragment.count, fragment.data)
+    if serialized_packet is not None:
+        print(f"Reassembled packet {fragment.message_id} from {fragment.count} fragments")
+        # The reassembled packet is processed like one that arrived whole
+        process_packet(radio, parse_packet(serialized_packet), address, link)
+
+def process_nack_message(radio, received_packet, link=None):
+    nack = received_packet.nack_message
+    if nack.destination == SERVER_NODE_ID:
+        # The relay fragmented the packet, pass the NACK on over MQTT
+        publish_uplink(received_packet, link)
+        return
+    if nack.destination != NODE_ID:
+        retransmit_packet(radio, received_packet)
+        return
+
+    cached = fragment_cache.get(nack.message_id)
+    if cached is None:
+        print(f"NACK for {nack.message_id}, which is no longer cached")
+        return
+    chunks, destination = cached
+    # Resend only the fragments the receiver is missing
+    for fragment in make_fragments(NODE_ID, nack.message_id, destination, chunks, HOP_LIMIT, nack.missing):
+        send_packet(radio, fragment, address=next_hop_address(destination))
+
+def check_reassembly(radio):
+    # Ask for the fragments missing from stalled reassembly buffers
+    for source, message_id, missing in reassembler.nacks():
+        send_nack(radio, source, message_id, missing)
+
+def send_nack(radio, destination, message_id, missing):
+    nack_message = spec_pb2.NackMessage()
+    nack_message.node_id = NODE_ID
+    nack_message.message_id = message_id
+    nack_message.destination = destination
+    nack_message.missing.extend(missing)
+
+    packet = new_packet(spec_pb2.NACK_MESSAGE)
+    packet.nack_message.CopyFrom(nack_message)
+
+    send_packet(radio, packet, address=next_hop_address(destination))
+
+def process_network_message(radio, received_packet, link=None):
     if received_packet.network_message.destination != NODE_ID and not received_packet.network_message.destination.startswith("+"):
         # Retransmit the packet if it's not for us
         print(f"Retransmitting packet {received_packet.packet_uuid}")
-        #send_packet(lora, received_packet)
+        retransmit_packet(radio, received_packet)
     else:
         # Process the message if it's for us or it's a relay SMS
-        decrypted_message = aes_decrypt(received_packet.network_message.message_content)
+        decrypted_message = decrypt_message(received_packet)
         print(f"Decrypted message: {decrypted_message}")
-        send_ack(lora, received_packet)
+        send_ack(radio, received_packet)
         
         if received_packet.network_message.destination.startswith("+"):
             print(f"Received relay SMS: {decrypted_message}")
             # Relay to MQTT
-            wrapper.mqtt_publish(1, "12458Test/pub", base64.urlsafe_b64encode(received_packet.SerializeToString()).decode())
+            publish_uplink(received_packet, link)
 
-def process_ack_message(received_packet):
+def process_ack_message(radio, received_packet, link=None):
     message_id = received_packet.ack_message.message_id
-    if message_id in acknowledgments:
+    reliable_sender.ack(message_id)
+    if message_id in relayed_downlinks:
+        # The relay tries another gateway unless this ACK reaches it
+        print(f"ACK received for relay downlink {message_id}")
+        publish_uplink(received_packet, link)
+    elif message_id in acknowledgments:
         acknowledgments[message_id] = True
         print(f"ACK received for packet UUID: {message_id}")
+    else:
+        # Someone else's ACK, pass it on towards its destination
+        retransmit_packet(radio, received_packet)
 
-def process_discover_message(lora, received_packet):
+def process_discover_message(radio, received_packet):
     print("Received DISCOVER message. Announcing our presence.")
     time.sleep(random.randint(1,10)/10)
-    send_announce_message(lora)
+    send_announce_message(radio)
     # Retransmit the DISCOVER message
-    #send_packet(lora, received_packet)
+    retransmit_packet(radio, received_packet)
 
-def process_announce_message(lora, received_packet):
+def process_announce_message(radio, received_packet, address):
     announced_node_id = received_packet.announce_message.node_id
     if announced_node_id not in discovered_nodes:
         discovered_nodes.add(announced_node_id)
         print(f"Discovered new node: {announced_node_id}")
+    # Route to the announcing node through the neighbour we heard it from,
+    # and pass the cost of that route on with the ANNOUNCE
+    route_cost = routing_table.update(announced_node_id, address, received_packet.announce_message.route_cost)
+    received_packet.announce_message.route_cost = route_cost
     # Retransmit the ANNOUNCE message
-    #send_packet(lora, received_packet)
+    retransmit_packet(radio, received_packet)
 
-def send_ack(lora, received_packet):
+def send_ack(radio, received_packet):
     ack_message = spec_pb2.AckMessage()
     ack_message.message_id = received_packet.packet_uuid
     ack_message.node_id = NODE_ID
     ack_message.timestamp = int(time.time())
 
-    ack_packet = spec_pb2.Packet()
-    ack_packet.packet_uuid = uuid.uuid4().hex[:8]
-    ack_packet.packet_type = spec_pb2.ACK_MESSAGE
+    ack_packet = new_packet(spec_pb2.ACK_MESSAGE)
     ack_packet.ack_message.CopyFrom(ack_message)
 
-    send_packet(lora, ack_packet)
+    # Unicast when the route back is known, so the ACK can share a frame with data going that way
+    send_packet(radio, ack_packet, PRIORITY_HIGH, address=next_hop_address(packet_source(received_packet)))
 
-def send_discover_message(lora):
+def retransmit_packet(radio, received_packet):
+    # Rebroadcast a packet for other nodes after a random delay, unless its
+    # hop limit is used up or enough neighbours rebroadcast it first
+    if received_packet.hop_limit <= 1:
+        return False
+    packet = spec_pb2.Packet()
+    packet.CopyFrom(received_packet)
+    packet.hop_limit -= 1
+    if packet_destination(packet):
+        next_hop = routing_table.next_hop(packet_destination(packet))
+        if next_hop is not None:
+            # With a known route there is no need to flood, hand the packet to the next hop
+            send_packet(radio, packet, address=next_hop)
+            return True
+    return flood_controller.schedule(packet.packet_uuid, lambda: send_packet(radio, packet, PRIORITY_LOW))
+
+def send_discover_message(radio):
     discover_message = spec_pb2.DiscoverMessage()
     discover_message.timestamp = int(time.time())
 
-    packet = spec_pb2.Packet()
-    packet.packet_uuid = uuid.uuid4().hex[:8]
-    packet.packet_type = spec_pb2.DISCOVER_MESSAGE
+    packet = new_packet(spec_pb2.DISCOVER_MESSAGE)
     packet.discover_message.CopyFrom(discover_message)
 
-    send_packet(lora, packet)
+    send_packet(radio, packet, PRIORITY_LOW)
     print("Sent DISCOVER message")
 
-def send_announce_message(lora):
+def send_announce_message(radio):
     announce_message = spec_pb2.AnnounceMessage()
     announce_message.node_id = NODE_ID
     announce_message.timestamp = int(time.time())
 
-    packet = spec_pb2.Packet()
-    packet.packet_uuid = uuid.uuid4().hex[:8]
-    packet.packet_type = spec_pb2.ANNOUNCE_MESSAGE
+    packet = new_packet(spec_pb2.ANNOUNCE_MESSAGE)
     packet.announce_message.CopyFrom(announce_message)
 
-    send_packet(lora, packet)
+    send_packet(radio, packet, PRIORITY_LOW)
     print(f"Sent ANNOUNCE message for node {NODE_ID}")
 
 
+def publish_uplink(packet, link=None):
+    # Pass a packet on to the relay, on this gateway's own topic and prefixed
+    # with the RSSI and SNR it was heard with, so the relay can merge the
+    # copies other gateways publish and knows which gateway reaches the sender
+    frame = encode_frame(serialize_packet(packet, WIRE_VERSION), FRAME_CODEC)
+    if link is not None:
+        frame = f"{link['rssi']},{link['snr']} {frame}"
+    wrapper.mqtt_publish(1, UPLINK_TOPIC, frame)
+
+def remember_downlink(packet):
+    # Fragments are ACKed by the ID of the packet they were cut from
+    if packet.packet_type == spec_pb2.FRAGMENT_MESSAGE:
+        message_id = packet.fragment_message.message_id
+    else:
+        message_id = packet.packet_uuid
+    relayed_downlinks[message_id] = True
+    relayed_downlinks.move_to_end(message_id)
+    while len(relayed_downlinks) > MAX_RELAYED_DOWNLINKS:
+        relayed_downlinks.popitem(last=False)
+
 def listen_for_mqtt():
-    print("Listening for MQTT messages on 12458Test/sub...")
-    wrapper.mqtt_subscribe(1, "12458Test/sub")
+    print(f"Listening for MQTT messages on {', '.join(DOWNLINK_TOPICS)}...")
+    for topic in DOWNLINK_TOPICS:
+        wrapper.mqtt_subscribe(1, topic)
     while True:
         mqtt_data = wrapper.mqtt_receive_message()
         if mqtt_data and "%MQTTEVU:\"PUBRCV\"" in mqtt_data:
@@ -224,42 +436,47 @@ def listen_for_mqtt():
                 _, _, _, topic, length = mqtt_data.split(',')
                 payload = wrapper.read_response()
                 
-                # Decode the base64 payload
-                decoded_payload = base64.urlsafe_b64decode(payload)
+                # Decode the frame payload (any codec, legacy base64 included)
+                decoded_payload = decode_frame(payload)
                 
                 # Parse the payload into a Packet object
-                mqtt_packet = spec_pb2.Packet()
-                mqtt_packet.ParseFromString(decoded_payload)
+                mqtt_packet = parse_packet(decoded_payload)
                 print(f"Received MQTT packet: {mqtt_packet}")
+
+                # Remember the packet, so copies rebroadcast by the mesh are not processed again
+                is_new_packet(mqtt_packet)
+                remember_downlink(mqtt_packet)
                 
                 # Transmit the packet over LoRa
-                send_packet(lora, mqtt_packet)
+                send_packet(radio, mqtt_packet, address=next_hop_address(packet_destination(mqtt_packet)))
                 print(f"Transmitted MQTT packet over LoRa: {mqtt_packet.packet_uuid}")
-                time.sleep(1)
             except Exception as e:
                 print(f"Error processing MQTT message: {e}")
 
-def process_network_message(lora, received_packet):
+def process_network_message(radio, received_packet, link=None):
     if received_packet.network_message.destination != NODE_ID and not received_packet.network_message.destination.startswith("+"):
         # Retransmit the packet if it's not for us
         print(f"Retransmitting packet {received_packet.packet_uuid}")
-        #send_packet(lora, received_packet)
+        retransmit_packet(radio, received_packet)
     else:
         # Process the message if it's for us or it's a relay SMS
-        decrypted_message = aes_decrypt(received_packet.network_message.message_content)
+        decrypted_message = decrypt_message(received_packet)
         print(f"Decrypted message: {decrypted_message}")
-        send_ack(lora, received_packet)
+        send_ack(radio, received_packet)
         
         if received_packet.network_message.destination.startswith("+"):
             print(f"Received relay SMS: {decrypted_message}")
             # Relay to MQTT
-            wrapper.mqtt_publish(1, "12458Test/pub", base64.urlsafe_b64encode(received_packet.SerializeToString()).decode())
+            publish_uplink(received_packet, link)
 
 def main():
-    global lora
+    global radio
     lora = initialize_lora(address=3, network_id=18)
+    # The actor is the only user of the LoRa module from here on
+    radio = RadioActor(lora).start()
+    reliable_sender.start()
 
-    listen_thread = threading.Thread(target=listen_for_data, args=(lora,))
+    listen_thread = threading.Thread(target=listen_for_data, args=(radio,))
     listen_thread.daemon = True
     listen_thread.start()
 
@@ -269,15 +486,17 @@ def main():
 
     try:
         while True:
-            user_input = input("Enter message, 'exit' to quit, '?ACK' for ACK status, or 'DISCOVER' to find devices: ").strip()
+            user_input = input("Enter message, 'exit' to quit, '?ACK' for ACK status, '?ERRORS' for dropped frames, or 'DISCOVER' to find devices: ").strip()
             if user_input.lower() == 'exit':
                 break
             elif user_input == '?ACK':
                 for packet_uuid, acked in acknowledgments.items():
-                    status = "ACKED" if acked else "PENDING"
+                    status = "FAILED" if acked is None else "ACKED" if acked else "PENDING"
                     print(f"Packet UUID {packet_uuid}: {status}")
+            elif user_input == '?ERRORS':
+                print(f"Dropped frames and packets: {dict(receive_errors)}")
             elif user_input.upper() == 'DISCOVER':
-                send_discover_message(lora)
+                send_discover_message(radio)
                 print("Waiting for responses...")
                 time.sleep(5)  # Wait for 5 seconds to collect responses
                 print("Discovered nodes:")
@@ -285,11 +504,14 @@ def main():
                     print(node)
             else:
                 destination = input("Enter the destination node ID: ").strip()
-                send_message(lora, destination, user_input)
+                send_message(radio, destination, user_input)
                 time.sleep(1)
     except KeyboardInterrupt:
         print("Shutting down LoRa receiver...")
     finally:
+        reliable_sender.stop()
+        frame_aggregator.flush()
+        radio.stop()
         lora.close()
         wrapper.mqtt_disconnect(1)
         wrapper.close_connection()
@@ -0,0 +1,93 @@
+import itertools
+import queue
+import threading
+from concurrent.futures import Future
+
+# Send priorities, lower values are transmitted first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+class RadioActor:
+    """
+    Single owner of a RYLR998. Only the actor's thread talks to the module:
+    outbound frames are taken from a priority queue one at a time, and every
+    inbound +RCV frame is published to all subscriber queues, so AT+SEND
+    replies and received frames can no longer interleave between threads.
+    """
+    def __init__(self, lora, poll_interval=0.05):
+        """
+        :param lora: An initialized RYLR998. Nothing else may use it once the actor is started.
+        :param poll_interval: Longest time an inbound frame waits while the send queue is idle.
+        """
+        self.lora = lora
+        self.poll_interval = poll_interval
+        self._send_queue = queue.PriorityQueue()
+        self._order = itertools.count()  # Keeps FIFO order within a priority
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+
+    def send(self, address, data, priority=PRIORITY_NORMAL):
+        """
+        Queue a frame for transmission.
+
+        :return: A Future resolved with the send_data() result once the frame was handed to the module.
+        """
+        future = Future()
+        self._send_queue.put((priority, next(self._order), address, data, future))
+        return future
+
+    def subscribe(self):
+        """
+        :return: A queue.Queue that receives every inbound frame dict.
+        """
+        frames = queue.Queue()
+        with self._subscribers_lock:
+            self._subscribers.append(frames)
+        return frames
+
+    def unsubscribe(self, frames):
+        with self._subscribers_lock:
+            self._subscribers.remove(frames)
+
+    def pending(self):
+        return self._send_queue.qsize()
+
+    def _publish(self, received_data):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for item in received_data:
+            for frames in subscribers:
+                frames.put(item)
+
+    def _run(self):
+        while self._running:
+            received_data = self.lora.receive_data()
+            if received_data:
+                self._publish(received_data)
+
+            try:
+                _, _, address, data, future = self._send_queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.lora.send_data(address, data))
+            except Exception as e:
+                print(f"Error sending frame: {e}")
+                future.set_exception(e)
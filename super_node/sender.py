@@ -1,5 +1,5 @@
-from rylr998 import RYLR998
-import spec_pb2
+from resililink.rylr998 import RYLR998
+from resililink import spec_pb2
 import uuid
 import time
 import base64
@@ -41,6 +41,6 @@ while (x := lora.receive_data()) is None:
 print(x)
 # Deserialize the received data
 received_packet = spec_pb2.Packet()
-received_packet.ParseFromString(base64.b64decode(x.split(",")[2]))
+received_packet.ParseFromString(base64.b64decode(x[0]['data']))
 print(received_packet)
 lora.close()
\ No newline at end of file
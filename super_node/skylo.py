@@ -1,3 +1,4 @@
+import asyncio
 import serial
 import time
 
@@ -205,6 +206,179 @@ class SerialWrapper:
             print(f"Message received: {response}")
         return response
 
+class AsyncSkylo:
+    """
+    asyncio counterpart of SerialWrapper. The serial file descriptor is
+    registered with the running event loop; command results, MQTT events and
+    received publications are demultiplexed as lines arrive.
+
+    Usage::
+
+        skylo = await AsyncSkylo('/dev/ttyUSB0').open()
+        await skylo.mqtt_config(1, "testclient_12458_sk", "test.mosquitto.org")
+        await skylo.mqtt_connect(1)
+        await skylo.mqtt_subscribe(1, "12458Test/sub")
+        async for topic, payload in skylo.receive():
+            ...
+    """
+    def __init__(self, port, baudrate=115200, timeout=5):
+        """
+        :param port: Serial port to use (e.g., '/dev/ttyUSB0')
+        :param baudrate: Baud rate for the serial communication (default is 115200)
+        :param timeout: Seconds to wait for a command result or MQTT event (default is 5)
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.serial_conn = serial.Serial(port=port, baudrate=baudrate, timeout=0, write_timeout=timeout)
+        self.messages = asyncio.Queue()
+        self._buffer = b''
+        self._command_lock = asyncio.Lock()
+        self._pending = None
+        self._response = []
+        self._event_waiters = {}
+        self._pubrcv_topic = None
+        self._loop = None
+
+    async def open(self):
+        """
+        Register the serial port with the running event loop.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self.serial_conn.fileno(), self._on_readable)
+        return self
+
+    def close_connection(self):
+        """
+        Unregister and close the serial connection.
+        """
+        if self.serial_conn.is_open:
+            if self._loop is not None:
+                self._loop.remove_reader(self.serial_conn.fileno())
+            self.serial_conn.close()
+            print(f"Connection to {self.port} closed.")
+
+    def _on_readable(self):
+        try:
+            self._buffer += self.serial_conn.read(self.serial_conn.in_waiting or 1)
+        except (serial.SerialException, OSError) as e:
+            print(f"Error reading from the serial device: {e}")
+            self._loop.remove_reader(self.serial_conn.fileno())
+            return
+        while b'\r\n' in self._buffer:
+            raw, self._buffer = self._buffer.split(b'\r\n', 1)
+            line = raw.decode('utf-8', errors='replace').strip()
+            if line:
+                self._dispatch(line)
+
+    def _dispatch(self, line):
+        if self._pubrcv_topic is not None:
+            # The line after a PUBRCV event is the message payload
+            self.messages.put_nowait((self._pubrcv_topic, line))
+            self._pubrcv_topic = None
+        elif line.startswith("%MQTTEVU:"):
+            event = line[len("%MQTTEVU:"):].split(',')
+            name = event[0].strip('"')
+            if name == "PUBRCV":
+                # %MQTTEVU:"PUBRCV",<id>,<msg id>,"<topic>",<length>
+                self._pubrcv_topic = event[3].strip('"') if len(event) > 3 else ""
+            for waiter in self._event_waiters.pop(name, []):
+                if not waiter.done():
+                    waiter.set_result(line)
+        elif self._pending is not None and not self._pending.done():
+            self._response.append(line)
+            if line == "OK" or "ERROR" in line:
+                self._pending.set_result(self._response)
+        else:
+            print(f"Unsolicited: {line}")
+
+    async def send_command(self, command, timeout=None):
+        """
+        Send a command and wait for its final OK/ERROR result.
+
+        :param command: The AT command to send.
+        :param timeout: Seconds to wait (defaults to the instance timeout).
+        :return: List of response lines, or None on timeout.
+        """
+        async with self._command_lock:
+            self._pending = self._loop.create_future()
+            self._response = []
+            try:
+                self.serial_conn.write((command + '\r').encode())
+                return await asyncio.wait_for(self._pending, self.timeout if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                print(f"Timeout waiting for response to: {command}")
+                return None
+            finally:
+                self._pending = None
+
+    async def wait_event(self, name, timeout=None):
+        """
+        Wait for the next %MQTTEVU event with the given name (e.g. "CONCONF").
+
+        :return: The raw event line, or None on timeout.
+        """
+        waiter = self._loop.create_future()
+        self._event_waiters.setdefault(name, []).append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    ### MQTT Commands ###
+
+    async def mqtt_config(self, connection_id, client_name, broker_url, port=1883, ip_type=0, keep_alive=1200, clean_session=1):
+        """
+        Configure MQTT connection parameters (see SerialWrapper.mqtt_config).
+        """
+        await self.send_command(f'AT%MQTTCFG="clear",{connection_id}')
+        await self.send_command(f'AT%MQTTCFG="nodes",{connection_id},"{client_name}","{broker_url}"')
+        await self.send_command(f'AT%MQTTCFG="IP",{connection_id},,{ip_type},{port}')
+        await self.send_command(f'AT%MQTTCFG="PROTOCOL",{connection_id},0,{keep_alive},{clean_session}')
+        await self.send_command(f'AT%MQTTEV="all",{connection_id}')
+
+    async def mqtt_connect(self, connection_id):
+        """
+        Connect to the MQTT broker and wait for the connection confirmation.
+
+        :return: The CONCONF event line, or None if it did not arrive.
+        """
+        confirmation = asyncio.ensure_future(self.wait_event("CONCONF"))
+        await self.send_command(f'AT%MQTTCMD="connect",{connection_id}')
+        response = await confirmation
+        if response:
+            print("Connected to MQTT broker successfully.")
+        return response
+
+    async def mqtt_disconnect(self, connection_id):
+        """
+        Disconnect from the MQTT broker and wait for the confirmation.
+
+        :return: The DISCONF event line, or None if it did not arrive.
+        """
+        confirmation = asyncio.ensure_future(self.wait_event("DISCONF"))
+        await self.send_command(f'AT%MQTTCMD="disconnect",{connection_id}')
+        response = await confirmation
+        if response:
+            print("Disconnected from MQTT broker.")
+        return response
+
+    async def mqtt_subscribe(self, connection_id, topic, qos=0):
+        return await self.send_command(f'AT%MQTTCMD="subscribe",{connection_id},{qos},"{topic}"')
+
+    async def mqtt_unsubscribe(self, connection_id, topic):
+        return await self.send_command(f'AT%MQTTCMD="unsubscribe",{connection_id},"{topic}"')
+
+    async def mqtt_publish(self, connection_id, topic, message, qos=0):
+        return await self.send_command(f'AT%MQTTCMD="publish",{connection_id},{qos},0,"{topic}",{len(message)}\r{message}')
+
+    async def receive(self):
+        """
+        Yield (topic, payload) for every message received on subscribed topics.
+        """
+        while True:
+            yield await self.messages.get()
+
 # Example usage
 if __name__ == "__main__":
     serial_port = '/dev/ttyUSB0'  # Replace with your serial port
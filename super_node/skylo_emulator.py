@@ -0,0 +1,344 @@
+import csv
+import heapq
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tty
+from collections import Counter
+
+from broker import Broker
+
+# Emulates the Skylo satellite modem behind SerialWrapper/AsyncSkylo on a pty.
+# It accepts the AT%MQTTCFG/AT%MQTTEV/AT%MQTTCMD commands the gateway sends,
+# answers OK/ERROR, and reports progress with %MQTTEVU URCs. Publications
+# travel to an in-process broker (broker.py) that relay.py can connect to,
+# and publications on subscribed topics come back as PUBRCV events. Both
+# directions queue behind a limited link rate and arrive after a satellite
+# round of latency with jitter, in order.
+
+MAX_MESSAGE = 1024  # Largest publication payload in bytes
+
+class SatelliteLink:
+    # One direction of the satellite link: messages queue behind each other
+    # at `rate` bytes/s, then take `latency` +/- `jitter` seconds to arrive
+    def __init__(self, rate, latency, jitter, rng):
+        self.rate = rate
+        self.latency = latency
+        self.jitter = jitter
+        self.random = rng
+        self._busy_until = 0.0
+        self._last_arrival = 0.0
+        self.messages = 0
+        self.bytes = 0
+        self.delay = 0.0
+
+    def arrival(self, size, now):
+        start = max(now, self._busy_until)
+        self._busy_until = start + size / self.rate
+        arrival = self._busy_until + max(self.latency + self.random.uniform(-self.jitter, self.jitter), 0)
+        # The link delivers in order, whatever the jitter
+        self._last_arrival = max(arrival, self._last_arrival)
+        self.messages += 1
+        self.bytes += size
+        self.delay += self._last_arrival - now
+        return self._last_arrival
+
+    def stats(self):
+        return {
+            'messages': self.messages,
+            'bytes': self.bytes,
+            'average_delay': round(self.delay / self.messages, 3) if self.messages else None,
+            'backlog': round(max(self._busy_until - time.monotonic(), 0), 3),
+        }
+
+class SkyloEmulator:
+    """
+    Usage::
+
+        broker = Broker(port=1883).start()
+        modem = SkyloEmulator(broker).start()
+        wrapper = SerialWrapper(modem.port)   # or SKYLO_PORT=<modem.port> python chat_2.py
+    """
+    def __init__(self, broker, latency=2.5, jitter=1.0, uplink_rate=300, downlink_rate=300, seed=None):
+        """
+        :param broker: Broker the modem's MQTT connection is attached to, whatever broker URL is configured.
+        :param latency: One-way delay through the satellite and ground network, in seconds.
+        :param jitter: Maximum deviation from `latency`, in seconds.
+        :param uplink_rate: Bytes per second from the modem to the broker.
+        :param downlink_rate: Bytes per second from the broker to the modem.
+        """
+        rng = random.Random(seed)
+        self.broker = broker
+        self.uplink = SatelliteLink(uplink_rate, latency, jitter, rng)
+        self.downlink = SatelliteLink(downlink_rate, latency, jitter, rng)
+        self.master, slave = os.openpty()
+        # Raw mode, so the tty layer neither echoes commands nor rewrites line endings
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave
+        self._config = {}
+        self._connected = set()
+        self._subscriptions = {}  # (connection ID, topic) -> broker callback
+        self._message_ids = iter(range(1, 1 << 31))
+        self._events = []
+        self._counter = 0
+        self._counts = Counter()
+        self._lock = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        self._running = True
+        for target in (self._read_loop, self._event_loop):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        print(f"Skylo modem emulator on {self.port}")
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._lock:
+            self._lock.notify()
+        for pattern, callback in self._subscriptions.items():
+            self.broker.unsubscribe(pattern[1], callback)
+        os.close(self.master)
+        os.close(self._slave)
+
+    def _write(self, line):
+        with self._write_lock:
+            try:
+                os.write(self.master, f"{line}\r\n".encode())
+            except OSError:
+                pass  # Port closed
+
+    def _later(self, when, callback):
+        with self._lock:
+            heapq.heappush(self._events, (when, self._counter, callback))
+            self._counter += 1
+            self._lock.notify()
+
+    def _event_loop(self):
+        while self._running:
+            with self._lock:
+                now = time.monotonic()
+                due = []
+                while self._events and self._events[0][0] <= now:
+                    due.append(heapq.heappop(self._events)[2])
+                if not due:
+                    self._lock.wait(self._events[0][0] - now if self._events else None)
+            for callback in due:
+                callback()
+
+    def _read_loop(self):
+        buffer = b''
+        pending = None  # (length, publish arguments) while reading a publication payload
+        while self._running:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break  # Emulator stopped
+            buffer += data
+            while True:
+                if pending is not None:
+                    length, arguments = pending
+                    if len(buffer) < length:
+                        break
+                    payload, buffer = buffer[:length], buffer[length:]
+                    pending = None
+                    self._publish(arguments, payload)
+                    continue
+                if b'\r' not in buffer:
+                    break
+                raw, buffer = buffer.split(b'\r', 1)
+                line = raw.decode('utf-8', errors='replace').strip()
+                if line:
+                    pending = self._command(line)
+
+    def _command(self, line):
+        # Handles one command line; returns (length, arguments) when a
+        # publication payload of that length follows
+        match = re.fullmatch(r'AT(%MQTTCFG|%MQTTEV|%MQTTCMD)?=?(.*)', line, re.IGNORECASE)
+        if not match or (match.group(1) is None and match.group(2)):
+            self._write("ERROR")
+            return None
+        command, arguments = (match.group(1) or '').upper(), self._arguments(match.group(2))
+        self._counts['commands'] += 1
+        try:
+            if command == '':
+                self._write("OK")
+            elif command == '%MQTTCFG':
+                self._configure(arguments)
+            elif command == '%MQTTEV':
+                self._write("OK")
+            elif command == '%MQTTCMD':
+                return self._mqtt_command(arguments)
+        except (IndexError, ValueError):
+            self._write("ERROR")
+        return None
+
+    @staticmethod
+    def _arguments(text):
+        # Comma-separated, with double-quoted strings that may hold commas
+        return next(csv.reader([text])) if text else []
+
+    def _configure(self, arguments):
+        setting, connection_id = arguments[0].lower(), int(arguments[1])
+        if setting == 'clear':
+            self._config.pop(connection_id, None)
+        else:
+            self._config.setdefault(connection_id, {})[setting] = arguments[2:]
+        self._write("OK")
+
+    def _mqtt_command(self, arguments):
+        action, connection_id = arguments[0].lower(), int(arguments[1])
+        now = time.monotonic()
+        if action == 'connect':
+            if 'nodes' not in self._config.get(connection_id, {}):
+                return self._write("ERROR")
+            self._write("OK")
+            self._later(now + 2 * self.uplink.latency, lambda: self._connect(connection_id))
+            return None
+        if connection_id not in self._connected:
+            return self._write("ERROR")
+        if action == 'disconnect':
+            self._write("OK")
+            self._connected.discard(connection_id)
+            for key in [key for key in self._subscriptions if key[0] == connection_id]:
+                self.broker.unsubscribe(key[1], self._subscriptions.pop(key))
+            self._later(now + self.uplink.latency, lambda: self._write(f'%MQTTEVU:"DISCONF",{connection_id},0'))
+        elif action == 'subscribe':
+            topic = arguments[3]
+            message_id = next(self._message_ids)
+            self._write("OK")
+            arrival = self.uplink.arrival(len(topic), now)
+            self._later(arrival, lambda: self._subscribe(connection_id, topic, message_id))
+        elif action == 'unsubscribe':
+            topic = arguments[2]
+            message_id = next(self._message_ids)
+            self._write("OK")
+            callback = self._subscriptions.pop((connection_id, topic), None)
+            if callback:
+                self.broker.unsubscribe(topic, callback)
+            self._later(now + 2 * self.uplink.latency, lambda: self._write(f'%MQTTEVU:"UNSCONF",{connection_id},{message_id},0'))
+        elif action == 'publish':
+            length = int(arguments[5])
+            if length > MAX_MESSAGE:
+                return self._write("ERROR")
+            return length, arguments
+        else:
+            self._write("ERROR")
+        return None
+
+    def _connect(self, connection_id):
+        self._connected.add(connection_id)
+        self._write(f'%MQTTEVU:"CONCONF",{connection_id},0')
+
+    def _subscribe(self, connection_id, topic, message_id):
+        def on_publication(received_topic, payload):
+            self._downlink(connection_id, received_topic, payload)
+
+        self._subscriptions[(connection_id, topic)] = on_publication
+        self.broker.subscribe(topic, on_publication)
+        # The confirmation takes the trip back down
+        self._later(time.monotonic() + self.downlink.latency, lambda: self._write(f'%MQTTEVU:"SUBCONF",{connection_id},{message_id},0'))
+
+    def _publish(self, arguments, payload):
+        connection_id, topic = int(arguments[1]), arguments[4]
+        message_id = next(self._message_ids)
+        self._write("OK")
+        self._counts['uplink_messages'] += 1
+        arrival = self.uplink.arrival(len(payload), time.monotonic())
+
+        def deliver():
+            self.broker.publish(topic, payload)
+            self._later(time.monotonic() + self.downlink.latency, lambda: self._write(f'%MQTTEVU:"PUBCONF",{connection_id},{message_id},0'))
+
+        self._later(arrival, deliver)
+
+    def _downlink(self, connection_id, topic, payload):
+        # Runs on the publisher's thread; the URC and payload line arrive later
+        message_id = next(self._message_ids)
+        self._counts['downlink_messages'] += 1
+        arrival = self.downlink.arrival(len(payload), time.monotonic())
+
+        def deliver():
+            with self._write_lock:
+                try:
+                    os.write(self.master, f'%MQTTEVU:"PUBRCV",{connection_id},{message_id},"{topic}",{len(payload)}\r\n'.encode() + payload + b'\r\n')
+                except OSError:
+                    pass
+
+        self._later(arrival, deliver)
+
+    def stats(self):
+        return {
+            'commands': self._counts['commands'],
+            'uplink': self.uplink.stats(),
+            'downlink': self.downlink.stats(),
+            'broker': self.broker.stats(),
+        }
+
+if __name__ == "__main__":
+    # Emulated modem and broker:
+    #   python skylo_emulator.py [broker port]
+    #       (then SKYLO_PORT=<pty> python chat_2.py and MQTT_BROKER=localhost python relay.py)
+    #   python skylo_emulator.py --bench [messages] [size]
+    #       (publish through the modem to a local echo standing in for the relay, report throughput)
+    from skylo import SerialWrapper
+
+    args = sys.argv[1:]
+    bench = '--bench' in args
+    args = [arg for arg in args if arg != '--bench']
+
+    if not bench:
+        broker = Broker(host='0.0.0.0', port=int(args[0]) if args else 1883).start()
+        modem = SkyloEmulator(broker).start()
+        try:
+            while True:
+                time.sleep(30)
+                print(modem.stats())
+        except KeyboardInterrupt:
+            modem.stop()
+            broker.stop()
+        sys.exit()
+
+    count = int(args[0]) if args else 20
+    size = int(args[1]) if len(args) > 1 else 200
+    broker = Broker(port=0).start()
+    modem = SkyloEmulator(broker, seed=1).start()
+    # Echo every uplink back down, the way the relay answers the gateway
+    broker.subscribe("12458Test/pub", lambda topic, payload: broker.publish("12458Test/sub", payload))
+
+    wrapper = SerialWrapper(modem.port, baudrate=115200, timeout=10)
+    wrapper.mqtt_config(connection_id=1, client_name="bench", broker_url="localhost")
+    wrapper.mqtt_connect(1)
+    for _ in range(10):
+        if wrapper.read_response() == '%MQTTEVU:"CONCONF",1,0':
+            break
+    wrapper.mqtt_subscribe(1, "12458Test/sub")
+
+    start = time.monotonic()
+    sent_at = {}
+    for i in range(count):
+        message = f"{i:06d}".ljust(size, 'x')
+        sent_at[message[:6]] = time.monotonic()
+        wrapper.mqtt_publish(1, "12458Test/pub", message)
+    print(f"Queued {count} publications of {size} bytes in {time.monotonic() - start:.2f} s")
+
+    round_trips = []
+    while len(round_trips) < count:
+        line = wrapper.read_response()
+        if line and line.startswith('%MQTTEVU:"PUBRCV"'):
+            payload = wrapper.read_response()
+            round_trips.append(time.monotonic() - sent_at[payload[:6]])
+    elapsed = time.monotonic() - start
+    print(f"{count} round trips in {elapsed:.1f} s: {count * size / elapsed:.0f} bytes/s each way, "
+          f"round trip {min(round_trips):.1f}-{max(round_trips):.1f} s")
+    print(modem.stats())
+    wrapper.close_connection()
+    modem.stop()
+    broker.stop()
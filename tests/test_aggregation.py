@@ -0,0 +1,27 @@
+from concurrent.futures import Future
+
+from resililink.aggregation import FrameAggregator
+
+def test_queued_transmit_resolves_packets_when_sent():
+    radio_futures = []
+    def transmit(address, payload, priority):
+        radio_futures.append(Future())
+        return radio_futures[-1]
+
+    aggregator = FrameAggregator(transmit, window=60)
+    first = aggregator.submit(5, b"\x01" * 20)
+    second = aggregator.submit(5, b"\x02" * 20)
+    aggregator.flush()
+    # Handed to the radio as one frame, but not on the air yet
+    assert len(radio_futures) == 1
+    assert not first.done() and not second.done()
+
+    radio_futures[0].set_result("+OK")
+    assert first.result(timeout=0) == second.result(timeout=0) == "+OK"
+
+def test_failed_transmit_fails_every_packet():
+    radio_future = Future()
+    aggregator = FrameAggregator(lambda address, payload, priority: radio_future, window=0)
+    packet = aggregator.submit(0, b"\x01" * 20)
+    radio_future.set_exception(OSError("serial port closed"))
+    assert isinstance(packet.exception(timeout=0), OSError)
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from resililink import spec_pb2
+from resililink.crypto import MessageCipher, message_aad, FLAG_AEAD
+from resililink.wire import serialize_packet, parse_packet, FLAG_MORE
+
+cipher = MessageCipher(os.urandom(16))
+
+def encrypted_packet(text=b"Need water at the north shelter"):
+    packet = spec_pb2.Packet()
+    packet.packet_uuid = "1a2b3c4d"
+    packet.packet_type = spec_pb2.NETWORK_MESSAGE
+    packet.sequence = 1760000000
+    packet.hop_limit = 3
+    message = packet.network_message
+    message.node_id = "FIXED12"
+    message.timestamp = 1760000000
+    message.destination = "+15551234567"
+    message.flags = FLAG_AEAD | FLAG_MORE
+    message.stream_id = "0badf00d"
+    message.segment = 2
+    message.message_content = cipher.encrypt(text, message.node_id, packet.packet_uuid, packet.sequence, message_aad(message))
+    return packet
+
+def decrypt(packet):
+    message = packet.network_message
+    return cipher.decrypt(message.message_content, message.node_id, packet.packet_uuid, packet.sequence, message_aad(message))
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_header_survives_the_wire(version):
+    packet = parse_packet(serialize_packet(encrypted_packet(), version))
+    packet.hop_limit -= 1  # Forwarders may change the hop limit
+    assert decrypt(packet) == b"Need water at the north shelter"
+
+@pytest.mark.parametrize("field, value", [
+    ("flags", FLAG_AEAD),
+    ("timestamp", 1760000001),
+    ("destination", "+15559999999"),
+    ("stream_id", "0badf00e"),
+    ("segment", 1),
+])
+def test_altered_header_is_rejected(field, value):
+    packet = encrypted_packet()
+    setattr(packet.network_message, field, value)
+    with pytest.raises(ValueError):
+        decrypt(packet)
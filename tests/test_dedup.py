@@ -0,0 +1,29 @@
+from resililink.dedup import DuplicateFilter
+
+def test_duplicates_and_replays_are_rejected():
+    dedup = DuplicateFilter(window=64)
+    assert dedup.check("FIXED1", 1760000000, now=0)
+    assert dedup.check("FIXED1", 1760000002, now=1)
+    assert not dedup.check("FIXED1", 1760000002, now=2)
+    assert dedup.check("FIXED1", 1760000001, now=3)  # Late, but inside the window
+    assert dedup.check("FIXED1", 1760000100, now=4)
+    assert not dedup.check("FIXED1", 1760000002, now=5)  # Behind the window
+
+def test_source_that_restarted_without_a_clock():
+    dedup = DuplicateFilter(window=64)
+    for i in range(10):
+        assert dedup.check("FIXED1", 1760000000 + i, now=i)
+    # Its counter starts over from a clock that reads 1970
+    assert dedup.check("FIXED1", 30, now=20)
+    assert not dedup.check("FIXED1", 30, now=21)
+    assert dedup.check("FIXED1", 31, now=22)
+    assert dedup.stats()['resyncs'] == 1
+
+def test_source_that_went_back_a_little_expires_while_it_keeps_sending():
+    dedup = DuplicateFilter(window=64, expiry=600)
+    assert dedup.check("FIXED1", 1760000000, now=0)
+    for now in range(10, 600, 10):
+        # Other sources keep the filter busy meanwhile
+        assert dedup.check("FIXED2", 1760000000 + now, now=now)
+        assert not dedup.check("FIXED1", 1759999000 + now, now=now)
+    assert dedup.check("FIXED1", 1759999610, now=610)
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from resililink import spec_pb2
+from resililink.codec import max_payload
+from resililink.compression import FLAG_COMPRESSED
+from resililink.crypto import MessageCipher, FLAG_AEAD
+from resililink.fragment import MAX_FRAGMENTS, fragment_size, make_fragments, segment_size, split_payload
+from resililink.wire import serialize_packet, SERVER_NODE_ID, FLAG_MORE
+
+MAX_PACKET_SIZE = max_payload(240)
+DESTINATION = "+15551234567"
+cipher = MessageCipher(os.urandom(16))
+
+def segment_packet(content, encryption):
+    # A streamed segment with the largest header the relay sends
+    packet = spec_pb2.Packet()
+    packet.packet_uuid = os.urandom(4).hex()
+    packet.packet_type = spec_pb2.NETWORK_MESSAGE
+    packet.sequence = 0xFFFFFFF0
+    packet.hop_limit = 255
+    packet.network_message.node_id = SERVER_NODE_ID
+    packet.network_message.timestamp = 0xFFFFFFFF
+    packet.network_message.destination = DESTINATION
+    packet.network_message.stream_id = "ffffffff"
+    packet.network_message.segment = 4095
+    if encryption == "ccm":
+        packet.network_message.message_content = cipher.encrypt(content, SERVER_NODE_ID, packet.packet_uuid, packet.sequence)
+        packet.network_message.flags = FLAG_COMPRESSED | FLAG_AEAD | FLAG_MORE
+    else:
+        packet.network_message.message_content = cipher.encrypt_cbc(content)
+        packet.network_message.flags = FLAG_COMPRESSED | FLAG_MORE
+    return packet
+
+@pytest.mark.parametrize("version", [1, 2])
+@pytest.mark.parametrize("encryption", ["ccm", "cbc"])
+def test_segment_fits_one_frame(version, encryption):
+    size = segment_size(SERVER_NODE_ID, DESTINATION, MAX_PACKET_SIZE, version, encryption)
+    for _ in range(20):
+        # Random bytes do not compress, so they are sent as they are
+        packet = segment_packet(os.urandom(size), encryption)
+        assert len(serialize_packet(packet, version)) <= MAX_PACKET_SIZE
+    # Past the point where the NetworkMessage's length prefix takes two bytes
+    assert packet.network_message.ByteSize() > 127
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_segment_size_is_tight(version):
+    size = segment_size(SERVER_NODE_ID, DESTINATION, MAX_PACKET_SIZE, version)
+    packet = segment_packet(os.urandom(size + 1), "ccm")
+    assert len(serialize_packet(packet, version)) > MAX_PACKET_SIZE
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_fragments_fit_one_frame(version):
+    size = fragment_size(SERVER_NODE_ID, DESTINATION, MAX_PACKET_SIZE, version)
+    chunks = split_payload(os.urandom(size * MAX_FRAGMENTS), size)
+    for fragment in make_fragments(SERVER_NODE_ID, "ffffffff", DESTINATION, chunks, 255):
+        assert len(serialize_packet(fragment, version)) <= MAX_PACKET_SIZE
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from resililink import rylr998
+from resililink.rylr998 import RYLR998
+
+class ScriptedSerial:
+    """
+    A module that answers each command with scripted lines. Replies to
+    commands sent while `hold` is set wait until release(), and so do the
+    replies to any command sent after them, as the module answers in order.
+    """
+    def __init__(self, replies):
+        self.replies = replies
+        self.hold = False
+        self.is_open = True
+        self._held = []
+        self._buffer = bytearray()
+        self._ready = threading.Condition()
+
+    def write(self, data):
+        lines = self.replies[data.decode().strip()]
+        if self.hold or self._held:
+            self._held.extend(lines)
+        else:
+            self.feed(lines)
+
+    def release(self):
+        self.feed(self._held)
+        self._held = []
+
+    def feed(self, lines):
+        with self._ready:
+            for line in lines:
+                self._buffer += f"{line}\r\n".encode()
+            self._ready.notify_all()
+
+    def readline(self):
+        with self._ready:
+            self._ready.wait_for(lambda: b'\n' in self._buffer or not self.is_open, 0.1)
+            if not self.is_open:
+                raise OSError("Port is closed")
+            end = self._buffer.find(b'\n') + 1
+            line = bytes(self._buffer[:end])
+            del self._buffer[:end]
+            return line
+
+    def close(self):
+        with self._ready:
+            self.is_open = False
+            self._ready.notify_all()
+
+@pytest.fixture
+def module(monkeypatch):
+    # Skip the two seconds the real module needs to start
+    monkeypatch.setattr(rylr998.time, "sleep", lambda seconds: None)
+    modules = []
+    def open_module(replies):
+        ser = ScriptedSerial(replies)
+        modules.append(RYLR998(port=None, ser=ser, timeout=0.5))
+        return modules[-1], ser
+    yield open_module
+    for lora in modules:
+        lora.close()
+
+def test_multi_line_reply(module):
+    lora, _ = module({"AT+RESET": ["+RESET", "+READY"], "AT+ADDRESS?": ["+ADDRESS=120"]})
+    assert lora.reset() == ["+RESET", "+READY"]
+    assert lora.get_address() == ["+ADDRESS=120"]
+
+def test_received_frame_during_a_command(module):
+    lora, _ = module({"AT+ADDRESS?": ["+RCV=5,5,HELLO,-40,9", "+ADDRESS=120"]})
+    assert lora.get_address() == ["+ADDRESS=120"]
+    assert lora.receive_data(timeout=1)[0]['data'] == "HELLO"
+
+def test_late_reply_is_not_taken_for_the_next_command(module):
+    lora, ser = module({"AT+SEND=0,5,HELLO": ["+ERR=5"], "AT+SEND=0,5,WORLD": ["+OK"]})
+    ser.hold = True
+    assert lora.send_data(0, "HELLO") is None  # Timed out
+    ser.hold = False
+    # The first command's +ERR arrives only now, and would come before any reply to the second
+    threading.Timer(0.1, ser.release).start()
+    assert lora.send_data(0, "WORLD") == ["+OK"]